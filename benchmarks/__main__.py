@@ -0,0 +1,34 @@
+#    Ryde Player provides a on screen interface and video player for Longmynd compatible tuners.
+#    Copyright © 2022 Tim Clark
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import argparse
+from benchmarks import replay, lmstatus, lmstdout, ctstdout, rtmppackets
+
+# Runs every replay benchmark with its synthetic capture
+# Run from the repository root with: python3 -m benchmarks
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5, help="number of times to replay each capture")
+    args = parser.parse_args()
+
+    lmstatus.benchmark(lmstatus.syntheticCapture(2000), args.repeat, 4096)
+    lmstdout.benchmark(lmstdout.syntheticCapture(500), args.repeat, 1024)
+    ctstdout.benchmark(ctstdout.syntheticCapture(1000), args.repeat, 1024)
+    rtmppackets.benchmark(rtmppackets.syntheticStream(120), args.repeat)
+
+if __name__ == '__main__':
+    run()
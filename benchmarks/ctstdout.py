@@ -0,0 +1,90 @@
+#    Ryde Player provides a on screen interface and video player for Longmynd compatible tuners.
+#    Copyright © 2022 Tim Clark
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import argparse, contextlib, os, shutil, tempfile
+from benchmarks import replay
+import rydeplayer.common
+import rydeplayer.sources.common
+import rydeplayer.sources.combituner
+import rydeplayer.sources.longmynd # provides the default band for a new tunerConfig
+
+# Replays CombiTuner STDOUT through combiTunerManager.processStdout and times the status parser
+# A capture can be made with: /home/pi/combituner/CombiTunerExpress ... > ctstdout.capture
+# Run from the repository root with: python3 -m benchmarks.ctstdout [capture]
+
+startupLines = [
+    "[GetChipId] chip id:AVL6862",
+    "[GetFamilyId] Family ID:0x4955",
+    "[AVL_Init] AVL_Initialize Booted!",
+    "[AVL_Init] ok",
+    "[DVB_Tx_tuner_Lock] Tuner locked!",
+    "[AVL_LockChannel_T] Freq is 498000 KHz, Bandwidth is 1000 KHz",
+    ]
+
+# one status report from a locked DVB-T2 signal, the signal values move so the parser sees changes
+def statusLines(report):
+    return [
+        "locked",
+        "MOD: DVB-T2",
+        "FFT: 8K",
+        "Const: QPSK",
+        "FEC: "+('2/3' if report%20 else '3/4'),
+        "Guard: 1/32",
+        "SSI is "+str(70+report%10),
+        "SQI is "+str(85+report%10),
+        "SNR is "+str(20+(report%8)/4),
+        "PER is 0",
+        ]
+
+def syntheticCapture(reports):
+    lines = list(startupLines)
+    for report in range(reports):
+        lines.extend(statusLines(report))
+    return ('\n'.join(lines)+'\n').encode('utf-8')
+
+def benchmark(capture, repeat, chunk):
+    lineCount = capture.count(b'\n')
+    # CombiTuner writes whole lines to a pty, reading part of a line would split it in two
+    chunks = replay.splitLines(capture, chunk)
+    tempDir = tempfile.mkdtemp(prefix='rydebench')
+    sourceConfig = rydeplayer.sources.combituner.config(binpath='/bin/false', mediapath=os.path.join(tempDir, 'ctmedia'))
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        ctMan = rydeplayer.sources.combituner.combiTunerManager(rydeplayer.sources.common.tunerConfig(), sourceConfig, rydeplayer.common.fdRegistry())
+        try:
+            result = replay.measure(lambda: replay.replayChunks(chunks, ctMan.stdoutWritefd, lambda: ctMan.handleFD(ctMan.stdoutReadfd)), repeat)
+        finally:
+            ctMan.cleanup()
+            shutil.rmtree(tempDir)
+    replay.report("CombiTuner STDOUT (combiTunerManager.processStdout)", "lines", lineCount, result)
+    print("    final state: "+str(ctMan.getCoreState()))
+    return result
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(metavar="capture filename", dest='capture', help="CombiTuner STDOUT capture to replay. Default: synthetic capture", nargs='?', default=None)
+    parser.add_argument('--reports', type=int, default=1000, help="status reports in the synthetic capture")
+    parser.add_argument('--repeat', type=int, default=5, help="number of times to replay the capture")
+    parser.add_argument('--chunk', type=int, default=1024, help="maximum bytes written to the pty between reads")
+    args = parser.parse_args()
+
+    if args.capture is None:
+        capture = syntheticCapture(args.reports)
+    else:
+        capture = replay.readCapture(args.capture)
+    benchmark(capture, args.repeat, args.chunk)
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+#    Ryde Player provides a on screen interface and video player for Longmynd compatible tuners.
+#    Copyright © 2022 Tim Clark
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import argparse, sys, threading, time
+import faketuner
+
+# Stand-in for CombiTuner for testing rydeplayer without a tuner
+# Takes the CombiTuner command line, prints its startup sequence and status reports and writes a synthetic TS to the media FIFO
+# Set the CombiTuner binpath to this file and the fakeTuners debug option to COMBITUNER, see faketuner.py for the environment variables
+
+startupLines = [
+    "[GetChipId] chip id:AVL6862",
+    "[GetFamilyId] Family ID:0x4955",
+    "[AVL_Init] AVL_Initialize Booted!",
+    "[AVL_Init] ok",
+    "[DVB_Tx_tuner_Lock] Tuner locked!",
+    ]
+
+provider = "FAKE"
+service = "Fake CombiTuner"
+
+class fakeCombiTuner(object):
+    def __init__(self, args):
+        self.config = faketuner.fakeConfig()
+        parser = argparse.ArgumentParser()
+        parser.add_argument('-m', dest='mode', choices=['dvbt'], required=True)
+        parser.add_argument('-f', dest='freq', type=int, required=True)
+        parser.add_argument('-b', dest='bw', type=int, required=True)
+        parser.add_argument('-n', dest='mediapath', required=True)
+        self.args = parser.parse_args(args)
+        self.lock = faketuner.lockSimulator(self.config)
+
+    def run(self):
+        if self.config.shouldFailStart():
+            print("Failed to Init demod!", flush=True)
+            sys.exit(1)
+        faketuner.printSlowly(startupLines, self.config.startTime)
+        print("[AVL_LockChannel_T] Freq is "+str(self.args.freq)+" KHz, Bandwidth is "+str(self.args.bw)+" KHz", flush=True)
+        self.lock.retune()
+        threading.Thread(target=faketuner.tsWriterLoop, args=(self.args.mediapath, self.config, self.lock, provider, service), daemon=True).start()
+        report = 0
+        while True:
+            for line in self.statusReport(report):
+                print(line)
+            sys.stdout.flush()
+            report += 1
+            time.sleep(1/self.config.statusRate)
+
+    # one status report as CombiTuner prints them
+    def statusReport(self, report):
+        if not self.lock.isLocked():
+            return ["Unlocked"]
+        return [
+            "locked",
+            "MOD: DVB-T2",
+            "FFT: 8K",
+            "Const: QPSK",
+            "FEC: 2/3",
+            "Guard: 1/32",
+            "SSI is "+str(70+report%10),
+            "SQI is "+str(85+report%10),
+            "SNR is "+str(20+(report%8)/4),
+            "PER is 0",
+            ]
+
+if __name__ == '__main__':
+    fakeCombiTuner(sys.argv[1:]).run()
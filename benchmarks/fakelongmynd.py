@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+#    Ryde Player provides a on screen interface and video player for Longmynd compatible tuners.
+#    Copyright © 2022 Tim Clark
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import argparse, os, sys, threading, time
+import faketuner
+
+# Stand-in for longmynd for testing rydeplayer without a tuner
+# Takes the longmynd command line, prints its startup sequence, writes status messages to the status FIFO and a synthetic TS to the media FIFO
+# Set the longmynd binpath to this file and the fakeTuners debug option to a MiniTiouner, see faketuner.py for the environment variables
+
+startupLines = [
+    "Flow: main",
+    "Flow: Fifo Init",
+    "      Status: opened fifo ok",
+    "      Status: opened fifo ok",
+    "Flow: FTDI init",
+    "      Status: MPSSE init",
+    "      Status: MPSSE connected to Minitiouner S",
+    "Flow: NIM init",
+    "Flow: STV0910 init",
+    "      Status: STV0910 MID = 0x51, DID = 0x20",
+    "Flow: Tuner init",
+    "      Status: tuner:1, tuner init ok",
+    "Flow: LNA init",
+    "      Status: found new NIM with LNAs",
+    "      Status: found new NIM with LNAs",
+    "Flow: STV0910 start scan",
+    ]
+
+provider = "FAKE"
+service = "Fake Longmynd"
+
+# the comma separated scan lists of frequencies and symbol rates
+def parseScan(tuneArgs):
+    freqs = [int(freq) for freq in tuneArgs.freqs.split(',')]
+    srs = [int(sr) for sr in tuneArgs.srs.split(',')]
+    return (freqs, srs)
+
+class fakeLongmynd(object):
+    def __init__(self, args):
+        self.config = faketuner.fakeConfig()
+        self.parser = argparse.ArgumentParser()
+        self.parser.add_argument('-t', dest='mediapath', required=True)
+        self.parser.add_argument('-s', dest='statuspath', required=True)
+        self.parser.add_argument('-r', dest='tstimeout', type=int)
+        self.parser.add_argument('-u', dest='usb', nargs=2)
+        self.parser.add_argument('-w', dest='bottomPort', action='store_true')
+        self.parser.add_argument('-p', dest='polarity', choices=['h', 'v'])
+        self.parser.add_argument('freqs')
+        self.parser.add_argument('srs')
+        self.args = self.parser.parse_args(args)
+        self.freqs, self.srs = parseScan(self.args)
+        self.lock = faketuner.lockSimulator(self.config)
+
+    def run(self):
+        if self.config.shouldFailStart():
+            print("ERROR: Failed to init Tuner", flush=True)
+            sys.exit(1)
+        statusFd = os.open(self.args.statuspath, os.O_WRONLY)
+        faketuner.printSlowly(startupLines, self.config.startTime)
+        self.lock.retune()
+        threading.Thread(target=faketuner.tsWriterLoop, args=(self.args.mediapath, self.config, self.lock, provider, service), daemon=True).start()
+        report = 0
+        while True:
+            try:
+                os.write(statusFd, self.statusReport(report).encode('utf-8'))
+            except BrokenPipeError:
+                print("ERROR: status FIFO closed", flush=True)
+                sys.exit(1)
+            report += 1
+            time.sleep(1/self.config.statusRate)
+
+    # one status report in the status FIFO format, like longmynd it cycles through the scan frequencies and symbol rates until it locks
+    def statusReport(self, report):
+        locked = self.lock.isLocked()
+        scanStep = 0 if locked else report
+        freq = self.freqs[scanStep % len(self.freqs)]
+        sr = self.srs[scanStep % len(self.srs)]
+        if locked:
+            lines = [
+                (1, 4), (2, 1), (3, 0), (4, -16), (5, 3), (6, freq), (7, 0), (8, 0),
+                (9, sr*1000), (10, 0), (11, 0), (12, 80+(report%10)), (13, provider), (14, service),
+                (15, 0), (16, faketuner.tsGenerator.videoPid), (17, faketuner.tsGenerator.videoType),
+                (16, faketuner.tsGenerator.audioPid), (17, faketuner.tsGenerator.audioType), (18, 4),
+                (19, 0), (20, 0), (21, 0), (22, 0), (23, 0), (24, 0), (25, 0), (26, 2436), (27, 1904),
+                ]
+        else:
+            lines = [(1, 2), (6, freq), (9, sr*1000), (12, 0), (26, 12000), (27, 3000)]
+        return ''.join('$'+str(msgtype)+','+str(value)+'\n' for msgtype, value in lines)
+
+if __name__ == '__main__':
+    fakeLongmynd(sys.argv[1:]).run()
@@ -0,0 +1,178 @@
+#    Ryde Player provides a on screen interface and video player for Longmynd compatible tuners.
+#    Copyright © 2022 Tim Clark
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os, time, random
+
+# Shared parts of the stand-in tuner binaries, fakelongmynd.py and fakecombituner.py
+# They are started by rydeplayer with the real binaries command lines so their behaviour is set through the environment:
+#   FAKETUNER_STARTTIME   seconds taken to print the startup sequence. Default: 0.5
+#   FAKETUNER_LOCKTIME    seconds from started to locked, and to relock after a retune or lock loss. Default: 0.5
+#   FAKETUNER_STATUSRATE  status reports per second. Default: 10
+#   FAKETUNER_TSBITRATE   bits per second of synthetic TS written to the media FIFO while locked. Default: 1000000
+#   FAKETUNER_LOCKLOSS    seconds between simulated losses of lock, 0 to never lose lock. Default: 0
+#   FAKETUNER_FAILSTART   chance between 0 and 1 of a start failing with an error, for testing the error handling. Default: 0
+
+def envFloat(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        print("Invalid "+name+", using "+str(default), flush=True)
+        return float(default)
+
+class fakeConfig(object):
+    def __init__(self):
+        self.startTime = envFloat('FAKETUNER_STARTTIME', 0.5)
+        self.lockTime = envFloat('FAKETUNER_LOCKTIME', 0.5)
+        self.statusRate = envFloat('FAKETUNER_STATUSRATE', 10)
+        self.tsBitrate = envFloat('FAKETUNER_TSBITRATE', 1000000)
+        self.lockLoss = envFloat('FAKETUNER_LOCKLOSS', 0)
+        self.failStart = envFloat('FAKETUNER_FAILSTART', 0)
+
+    def shouldFailStart(self):
+        return random.random() < self.failStart
+
+# print lines spread evenly over a time, as a tuner does while it initialises
+def printSlowly(lines, duration):
+    for line in lines:
+        print(line, flush=True)
+        time.sleep(duration/len(lines))
+
+# Tracks whether the fake signal is locked, lock is gained lockTime after a (re)tune and optionally lost every lockLoss seconds
+class lockSimulator(object):
+    def __init__(self, config):
+        self.config = config
+        self.retune()
+
+    def retune(self):
+        self.tuneTime = time.monotonic()
+
+    def isLocked(self):
+        sinceLock = time.monotonic() - self.tuneTime - self.config.lockTime
+        if sinceLock < 0:
+            return False
+        if self.config.lockLoss > 0 and sinceLock % (self.config.lockLoss + self.config.lockTime) > self.config.lockLoss:
+            return False
+        return True
+
+# MPEG-2 CRC32 used by the PSI tables
+def _crc32(data):
+    crc = 0xffffffff
+    for byte in data:
+        crc ^= byte << 24
+        for bit in range(8):
+            if crc & 0x80000000:
+                crc = ((crc << 1) ^ 0x04c11db7) & 0xffffffff
+            else:
+                crc = (crc << 1) & 0xffffffff
+    return crc
+
+# Generates a synthetic single program transport stream, structurally valid but the elementary streams are filler
+# PAT, PMT and SDT every 200ms, a PCR every 40ms frame and null packets to pad it to the bitrate
+class tsGenerator(object):
+    pmtPid = 0x20
+    videoPid = 257
+    audioPid = 258
+    videoType = 27 # H.264
+    audioType = 3 # MPEG-1 audio
+    frameTime = 0.04
+    psiInterval = 5 # frames
+
+    def __init__(self, bitrate, provider, service):
+        self.packetsPerFrame = max(int(bitrate*self.frameTime/(188*8)), 8)
+        self.continuity = {}
+        self.frame = 0
+        self.psiPackets = [self._psiPacket(0x00, self._patSection()), self._psiPacket(self.pmtPid, self._pmtSection()), self._psiPacket(0x11, self._sdtSection(provider, service))]
+        self.nullPacket = bytes([0x47, 0x1f, 0xff, 0x10]) + bytes(184)
+
+    def _header(self, pid, payloadStart, adaptation):
+        cc = self.continuity.get(pid, 15)
+        cc = (cc + 1) & 0x0f
+        self.continuity[pid] = cc
+        return bytes([0x47, (0x40 if payloadStart else 0x00) | (pid >> 8), pid & 0xff, (0x30 if adaptation else 0x10) | cc])
+
+    @staticmethod
+    def _section(tableId, tableIdExt, body):
+        length = 5 + len(body) + 4
+        section = bytes([tableId, 0xb0 | (length >> 8), length & 0xff, tableIdExt >> 8, tableIdExt & 0xff, 0xc1, 0x00, 0x00]) + body
+        return section + _crc32(section).to_bytes(4, byteorder='big')
+
+    def _patSection(self):
+        return self._section(0x00, 1, bytes([0x00, 0x01, 0xe0 | (self.pmtPid >> 8), self.pmtPid & 0xff]))
+
+    def _pmtSection(self):
+        body = bytes([0xe0 | (self.videoPid >> 8), self.videoPid & 0xff, 0xf0, 0x00])
+        for streamType, pid in [(self.videoType, self.videoPid), (self.audioType, self.audioPid)]:
+            body += bytes([streamType, 0xe0 | (pid >> 8), pid & 0xff, 0xf0, 0x00])
+        return self._section(0x02, 1, body)
+
+    def _sdtSection(self, provider, service):
+        providerBytes = provider.encode('utf-8')
+        serviceBytes = service.encode('utf-8')
+        descriptor = bytes([0x48, 3 + len(providerBytes) + len(serviceBytes), 0x01, len(providerBytes)]) + providerBytes + bytes([len(serviceBytes)]) + serviceBytes
+        body = bytes([0x00, 0x01, 0xff, 0x00, 0x01, 0xfc, 0x80 | (len(descriptor) >> 8), len(descriptor) & 0xff]) + descriptor
+        return self._section(0x42, 1, body)
+
+    # the PSI packets are built once, only their continuity counter changes
+    def _psiPacket(self, pid, section):
+        payload = bytes([0x00]) + section
+        return (pid, payload + b'\xff'*(184-len(payload)))
+
+    def _pesPacket(self, pid, streamId, pts, pcr):
+        pesHeader = bytes([0x00, 0x00, 0x01, streamId, 0x00, 0x00, 0x80, 0x80, 0x05,
+            0x21 | ((pts >> 29) & 0x0e), (pts >> 22) & 0xff, 0x01 | ((pts >> 14) & 0xfe), (pts >> 7) & 0xff, 0x01 | ((pts << 1) & 0xfe)])
+        if pcr is not None:
+            adaptation = bytes([0x10, (pcr >> 25) & 0xff, (pcr >> 17) & 0xff, (pcr >> 9) & 0xff, (pcr >> 1) & 0xff, ((pcr & 1) << 7) | 0x7e, 0x00])
+            return self._header(pid, True, True) + bytes([len(adaptation)]) + adaptation + pesHeader + bytes(184-1-len(adaptation)-len(pesHeader))
+        return self._header(pid, True, False) + pesHeader + bytes(184-len(pesHeader))
+
+    # the next 40ms of TS
+    def nextFrame(self):
+        packets = []
+        if self.frame % self.psiInterval == 0:
+            for pid, payload in self.psiPackets:
+                packets.append(self._header(pid, True, False) + payload)
+        clock = self.frame*3600 # 90kHz
+        packets.append(self._pesPacket(self.videoPid, 0xe0, clock + 45000, clock))
+        packets.append(self._pesPacket(self.audioPid, 0xc0, clock + 45000, None))
+        videoPackets = max(int(self.packetsPerFrame*0.85) - len(packets), 0)
+        for packet in range(videoPackets):
+            packets.append(self._header(self.videoPid, False, False) + bytes(184))
+        while len(packets) < self.packetsPerFrame:
+            packets.append(self.nullPacket)
+        self.frame += 1
+        return b''.join(packets)
+
+# Writes the synthetic TS into the media FIFO at the configured bitrate while the lock simulator is locked
+# rydeplayer keeps the FIFO open so the writes block rather than fail if it stops reading, like a real tuner
+def tsWriterLoop(mediaPath, config, lock, provider, service):
+    generator = tsGenerator(config.tsBitrate, provider, service)
+    mediaFd = os.open(mediaPath, os.O_WRONLY)
+    nextFrameTime = time.monotonic()
+    while True:
+        now = time.monotonic()
+        if not lock.isLocked():
+            nextFrameTime = now + generator.frameTime
+            time.sleep(generator.frameTime)
+            continue
+        if now < nextFrameTime:
+            time.sleep(nextFrameTime - now)
+        try:
+            os.write(mediaFd, generator.nextFrame())
+        except BrokenPipeError:
+            # the player is reopening the FIFO, wait for it to come back
+            os.close(mediaFd)
+            mediaFd = os.open(mediaPath, os.O_WRONLY)
+        nextFrameTime += generator.frameTime
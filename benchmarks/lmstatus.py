@@ -0,0 +1,75 @@
+#    Ryde Player provides a on screen interface and video player for Longmynd compatible tuners.
+#    Copyright © 2022 Tim Clark
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import argparse, contextlib, os, shutil, tempfile
+from benchmarks import replay
+import rydeplayer.common
+import rydeplayer.sources.common
+import rydeplayer.sources.longmynd
+
+# Replays a longmynd status FIFO capture through lmManager.processStatus and times the parser
+# A capture can be made with: cat /home/pi/lmstatus > lmstatus.capture
+# Run from the repository root with: python3 -m benchmarks.lmstatus [capture]
+
+# build a capture that looks like a locked DVB-S2 signal if a real one isn't provided
+def syntheticCapture(frames):
+    capture = bytearray()
+    for frame in range(frames):
+        lines = [
+            (1, 4), (2, 1), (3, 0), (4, -16), (5, 3), (6, 741500+(frame%7)), (7, 0), (8, 0),
+            (9, 1500000), (10, 0), (11, 0), (12, 80+(frame%5)), (13, 'A71A'), (14, 'QO-100 Beacon'),
+            (15, 0), (16, 257), (17, 27), (16, 258), (17, 3), (18, 4), (19, 0), (20, 0), (21, 0),
+            (22, 0), (23, 0), (24, 0), (25, 0), (26, 2436), (27, 1904),
+            ]
+        for msgtype, value in lines:
+            capture += ('$'+str(msgtype)+','+str(value)+'\n').encode('utf-8')
+    return bytes(capture)
+
+def benchmark(capture, repeat, chunk):
+    lineCount = capture.count(b'\n')
+    chunks = replay.splitChunks(capture, chunk)
+    tempDir = tempfile.mkdtemp(prefix='rydebench')
+    sourceConfig = rydeplayer.sources.longmynd.config(binpath='/bin/false', mediapath=os.path.join(tempDir, 'lmmedia'), statuspath=os.path.join(tempDir, 'lmstatus'))
+    # the parser prints some status types, keep that cost in but not the output
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        lmMan = rydeplayer.sources.longmynd.lmManager(rydeplayer.sources.common.tunerConfig(), sourceConfig, rydeplayer.common.fdRegistry())
+        writeFd = os.open(sourceConfig.statuspath, os.O_WRONLY)
+        try:
+            result = replay.measure(lambda: replay.replayChunks(chunks, writeFd, lmMan.processStatus), repeat)
+        finally:
+            os.close(writeFd)
+            lmMan.cleanup()
+            shutil.rmtree(tempDir)
+    replay.report("longmynd status FIFO (lmManager.processStatus)", "lines", lineCount, result)
+    print("    final state: "+str(lmMan.getCoreState()))
+    return result
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(metavar="capture filename", dest='capture', help="longmynd status capture to replay. Default: synthetic capture", nargs='?', default=None)
+    parser.add_argument('--frames', type=int, default=2000, help="status frames in the synthetic capture")
+    parser.add_argument('--repeat', type=int, default=5, help="number of times to replay the capture")
+    parser.add_argument('--chunk', type=int, default=4096, help="bytes written to the FIFO between reads")
+    args = parser.parse_args()
+
+    if args.capture is None:
+        capture = syntheticCapture(args.frames)
+    else:
+        capture = replay.readCapture(args.capture)
+    benchmark(capture, args.repeat, args.chunk)
+
+if __name__ == '__main__':
+    run()
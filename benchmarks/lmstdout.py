@@ -0,0 +1,88 @@
+#    Ryde Player provides a on screen interface and video player for Longmynd compatible tuners.
+#    Copyright © 2022 Tim Clark
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import argparse, contextlib, os, shutil, tempfile
+from benchmarks import replay
+import rydeplayer.common
+import rydeplayer.sources.common
+import rydeplayer.sources.longmynd
+
+# Replays longmynd STDOUT through lmManager.processStdout and times the startup tracking
+# A capture can be made with: /home/pi/longmynd/longmynd ... > lmstdout.capture
+# Run from the repository root with: python3 -m benchmarks.lmstdout [capture]
+
+# startup output of a longmynd with a LNA equipped NIM, it must not contain any ERROR: lines or the manager stops
+startupLines = [
+    "Flow: main",
+    "Flow: Fifo Init",
+    "      Status: opened fifo ok",
+    "      Status: opened fifo ok",
+    "Flow: FTDI init",
+    "      Status: MPSSE init",
+    "      Status: MPSSE connected to Minitiouner S",
+    "Flow: NIM init",
+    "Flow: STV0910 init",
+    "      Status: STV0910 MID = 0x51, DID = 0x20",
+    "Flow: Tuner init",
+    "      Status: tuner:1, tuner init ok",
+    "Flow: LNA init",
+    "      Status: found new NIM with LNAs",
+    "      Status: found new NIM with LNAs",
+    "Flow: STV0910 start scan",
+    "Flow: Caught signal, demod state hunting",
+    ]
+
+def syntheticCapture(startups):
+    return ('\n'.join(startupLines)+'\n').encode('utf-8')*startups
+
+def benchmark(capture, repeat, chunk):
+    lineCount = capture.count(b'\n')
+    # longmynd writes whole lines to a pty, reading part of a line would split it in two
+    chunks = replay.splitLines(capture, chunk)
+    tempDir = tempfile.mkdtemp(prefix='rydebench')
+    sourceConfig = rydeplayer.sources.longmynd.config(binpath='/bin/false', mediapath=os.path.join(tempDir, 'lmmedia'), statuspath=os.path.join(tempDir, 'lmstatus'))
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        lmMan = rydeplayer.sources.longmynd.lmManager(rydeplayer.sources.common.tunerConfig(), sourceConfig, rydeplayer.common.fdRegistry())
+        # each replay starts from a fresh start() so the startup tracking is measured every time
+        def replayStartup():
+            lmMan.startupTracker.reset()
+            lmMan.lmstarted = False
+            return replay.replayChunks(chunks, lmMan.stdoutWritefd, lambda: lmMan.handleFD(lmMan.stdoutReadfd))
+        try:
+            result = replay.measure(replayStartup, repeat)
+        finally:
+            lmMan.cleanup()
+            shutil.rmtree(tempDir)
+    replay.report("longmynd STDOUT (lmManager.processStdout)", "lines", lineCount, result)
+    print("    started: "+str(lmMan.lmstarted))
+    return result
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(metavar="capture filename", dest='capture', help="longmynd STDOUT capture to replay. Default: synthetic capture", nargs='?', default=None)
+    parser.add_argument('--startups', type=int, default=500, help="startup sequences in the synthetic capture")
+    parser.add_argument('--repeat', type=int, default=5, help="number of times to replay the capture")
+    parser.add_argument('--chunk', type=int, default=1024, help="maximum bytes written to the pty between reads")
+    args = parser.parse_args()
+
+    if args.capture is None:
+        capture = syntheticCapture(args.startups)
+    else:
+        capture = replay.readCapture(args.capture)
+    benchmark(capture, args.repeat, args.chunk)
+
+if __name__ == '__main__':
+    run()
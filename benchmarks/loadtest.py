@@ -0,0 +1,190 @@
+#    Ryde Player provides a on screen interface and video player for Longmynd compatible tuners.
+#    Copyright © 2022 Tim Clark
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import argparse, contextlib, os, shutil, tempfile, time
+from benchmarks import replay # makes the stub modules available if the real ones aren't installed
+import rydeplayer.common
+import rydeplayer.sources.common
+import rydeplayer.sources.longmynd
+import rydeplayer.sources.combituner
+import rydeplayer.sources.rtmpstream
+import rydeplayer.tracing
+
+# Load tests the source manager thread with the stand-in tuner binaries instead of real tuners
+# Retunes or restarts the source at a fixed interval and drains the media FIFO like the player would, then reports
+# the status update and TS rates seen by the main thread and the tune latency histograms from the tracer
+# Run from the repository root with: python3 -m benchmarks.loadtest
+
+benchDir = os.path.dirname(os.path.abspath(__file__))
+
+# two presets for each source to switch between
+presets = {
+    'LONGMYND': (
+        {'band': {'source': 'LONGMYND', 'lofreq': 0, 'loside': 'SUM', 'pol': 'NONE', 'port': 'BOTTOM', 'gpioid': 0}, 'freq': 741500, 'sr': 1500},
+        {'band': {'source': 'LONGMYND', 'lofreq': 0, 'loside': 'SUM', 'pol': 'NONE', 'port': 'BOTTOM', 'gpioid': 0}, 'freq': 741525, 'sr': 333},
+        ),
+    'COMBITUNER': (
+        {'band': {'source': 'COMBITUNER', 'lofreq': 0, 'loside': 'SUM', 'gpioid': 0}, 'freq': 437000, 'bw': 333},
+        {'band': {'source': 'COMBITUNER', 'lofreq': 0, 'loside': 'SUM', 'gpioid': 0}, 'freq': 498000, 'bw': 1000},
+        ),
+    }
+
+class loadTest(object):
+    def __init__(self, args, tempDir):
+        self.args = args
+        # the stand-in binaries take their settings from the environment
+        os.environ['FAKETUNER_STARTTIME'] = str(args.starttime)
+        os.environ['FAKETUNER_LOCKTIME'] = str(args.locktime)
+        os.environ['FAKETUNER_STATUSRATE'] = str(args.statusrate)
+        os.environ['FAKETUNER_TSBITRATE'] = str(args.tsbitrate)
+        os.environ['FAKETUNER_FAILSTART'] = str(args.failstart)
+        self.sourceConfigs = {
+            rydeplayer.sources.common.sources.LONGMYND: rydeplayer.sources.longmynd.config(binpath=os.path.join(benchDir, 'fakelongmynd.py'), mediapath=os.path.join(tempDir, 'lmmedia'), statuspath=os.path.join(tempDir, 'lmstatus'), tsanalysis=args.tsanalysis, pidfilter=args.pidfilter),
+            rydeplayer.sources.common.sources.COMBITUNER: rydeplayer.sources.combituner.config(binpath=os.path.join(benchDir, 'fakecombituner.py'), mediapath=os.path.join(tempDir, 'ctmedia'), tsanalysis=args.tsanalysis, pidfilter=args.pidfilter),
+            rydeplayer.sources.common.sources.RTMPSTREAM: rydeplayer.sources.rtmpstream.config(),
+            }
+        self.tunerConfigs = []
+        for preset in presets[args.source]:
+            tunerConfig = rydeplayer.sources.common.tunerConfig()
+            tunerConfig.loadConfig(preset)
+            self.tunerConfigs.append(tunerConfig)
+        if args.source == 'LONGMYND':
+            rydeplayer.sources.common.usbDevices.setOverride([rydeplayer.sources.common.ftdiConfigs.MINITIOUNER])
+        else:
+            rydeplayer.sources.common.usbDevices.setOverride([rydeplayer.sources.common.ftdiConfigs.COMBITUNER])
+        self.fdRegistry = rydeplayer.common.fdRegistry()
+        self.mediaFd = None
+        self.mediaBuf = bytearray(65536)
+        self.mediaBytes = 0
+        self.statusUpdates = 0
+        self.retunes = 0
+        # set by a tune, cleared once TS from the new lock arrives
+        self.awaitingPicture = False
+        self.seenUnlock = False
+
+    def _statusCallback(self, status):
+        self.statusUpdates += 1
+
+    def _handleMedia(self, fd):
+        try:
+            count = os.readv(fd, [self.mediaBuf])
+        except BlockingIOError:
+            return
+        if count > 0:
+            self.mediaBytes += count
+            # there is no picture without the player, the first TS after the new lock is the closest milestone
+            # TS from before the tune can still be arriving until the source has been seen unlocked
+            state = self.sourceMan.getCoreState()
+            if self.awaitingPicture and self.seenUnlock and state.isLocked:
+                rydeplayer.tracing.tracer.mark('playing', state.traceGeneration)
+                self.awaitingPicture = False
+        else:
+            # the tuner closed its end, reopen the FIFO like the player does
+            self.fdRegistry.unregister(fd)
+            self.mediaFd = None
+            self.sourceMan.remedia()
+
+    # keep the registered media fd in step with the source, it changes when the FIFO is reopened
+    def _updateMediaFd(self):
+        newMediaFd = self.sourceMan.getMediaFd()
+        if newMediaFd != self.mediaFd:
+            if self.mediaFd is not None:
+                self.fdRegistry.unregister(self.mediaFd)
+            self.mediaFd = newMediaFd
+            self.fdRegistry.register(self.mediaFd, self._handleMedia)
+
+    def _tune(self, configIndex):
+        rydeplayer.tracing.tracer.start(self.args.source, 'preset'+str(configIndex))
+        self.awaitingPicture = True
+        self.seenUnlock = False
+        if self.args.mode == 'restart':
+            self.sourceMan.restart()
+        else:
+            self.sourceMan.reconfig(self.tunerConfigs[configIndex])
+
+    def run(self):
+        rydeplayer.tracing.tracer.start(self.args.source, 'preset0')
+        self.awaitingPicture = True
+        self.seenUnlock = True
+        self.sourceMan = rydeplayer.sources.common.sourceManagerThread(self.tunerConfigs[0], self.sourceConfigs, self.fdRegistry)
+        self.sourceMan.getStatus().addOnChangeCallback(self._statusCallback)
+        self.sourceMan.start()
+        startTime = time.monotonic()
+        nextTune = startTime + self.args.interval
+        configIndex = 0
+        while time.monotonic() - startTime < self.args.duration:
+            self._updateMediaFd()
+            if not self.sourceMan.getCoreState().isLocked:
+                self.seenUnlock = True
+            for fd, handler in self.fdRegistry.select(0.05):
+                handler(fd)
+            if self.args.interval > 0 and time.monotonic() >= nextTune:
+                if self.args.mode == 'retune':
+                    configIndex = (configIndex + 1) % len(self.tunerConfigs)
+                self._tune(configIndex)
+                self.retunes += 1
+                nextTune += self.args.interval
+        runTime = time.monotonic() - startTime
+        self.sourceMan.shutdown()
+        if self.mediaFd is not None:
+            self.fdRegistry.unregister(self.mediaFd)
+        self.fdRegistry.close()
+        return runTime
+
+    def report(self, runTime):
+        print(self.args.source+" load test, "+self.args.mode+" every "+str(self.args.interval)+"s for "+"{:.1f}".format(runTime)+"s")
+        print("    tunes: "+str(self.retunes))
+        print("    status updates: {:.1f}/s".format(self.statusUpdates/runTime))
+        print("    media: {:.3f} Mbit/s".format(self.mediaBytes*8/runTime/1000000))
+        trace = rydeplayer.tracing.tracer.dump()
+        for preset, histograms in trace['presets'].items():
+            print("    "+preset+" tune latency:")
+            for milestone, histogram in histograms.items():
+                if histogram['count'] > 0:
+                    print("        {}: {} tunes, mean {:.1f} ms, max {:.1f} ms".format(milestone, histogram['count'], histogram['mean'], histogram['max']))
+        incomplete = sum(1 for tune in trace['history'] if not tune['complete'])
+        print("    tunes replaced before any TS arrived: "+str(incomplete))
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--source', choices=list(presets), default='LONGMYND', help="tuner source to test")
+    parser.add_argument('--mode', choices=['retune', 'restart'], default='retune', help="switch presets or restart the same preset")
+    parser.add_argument('--interval', type=float, default=2, help="seconds between tunes, 0 to never retune")
+    parser.add_argument('--duration', type=float, default=20, help="seconds to run for")
+    parser.add_argument('--statusrate', type=float, default=10, help="status reports per second from the stand-in tuner")
+    parser.add_argument('--tsbitrate', type=int, default=1000000, help="TS bits per second from the stand-in tuner")
+    parser.add_argument('--starttime', type=float, default=0.5, help="seconds the stand-in tuner takes to start")
+    parser.add_argument('--locktime', type=float, default=0.5, help="seconds the stand-in tuner takes to lock")
+    parser.add_argument('--failstart', type=float, default=0, help="chance of the stand-in tuner failing to start")
+    parser.add_argument('--tsanalysis', action='store_true', help="run the TS analyser on the media")
+    parser.add_argument('--pidfilter', action='store_true', help="run the PID filter on the media")
+    parser.add_argument('--verbose', action='store_true', help="show the source output")
+    args = parser.parse_args()
+
+    tempDir = tempfile.mkdtemp(prefix='rydeload')
+    try:
+        test = loadTest(args, tempDir)
+        if args.verbose:
+            runTime = test.run()
+        else:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                runTime = test.run()
+        test.report(runTime)
+    finally:
+        shutil.rmtree(tempDir)
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,81 @@
+#    Ryde Player provides a on screen interface and video player for Longmynd compatible tuners.
+#    Copyright © 2022 Tim Clark
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import gc, os, sys, time, tracemalloc
+
+# Shared helpers for the replay benchmarks
+# the stub modules are only used if the real ones aren't installed, so the benchmarks run on a plain Linux box
+stubsPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stubs')
+if stubsPath not in sys.path:
+    sys.path.append(stubsPath)
+
+# time a replay function over a number of repeats and measure its allocations in one extra traced run
+# replayFunc is called with no arguments and returns the time spent in the code being measured
+def measure(replayFunc, repeat):
+    times = []
+    for i in range(repeat):
+        gc.collect()
+        times.append(replayFunc())
+    # net allocated blocks, a steady state parser should keep this near zero
+    gc.collect()
+    blocksBefore = sys.getallocatedblocks()
+    replayFunc()
+    gc.collect()
+    netBlocks = sys.getallocatedblocks() - blocksBefore
+    # peak memory allocated while replaying, tracemalloc slows everything down so it isn't timed
+    tracemalloc.start()
+    replayFunc()
+    peakBytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'best': min(times), 'netBlocks': netBlocks, 'peakBytes': peakBytes}
+
+def report(name, unit, messageCount, result):
+    bestTime = result['best']
+    print(name)
+    print("    {} per replay: {}".format(unit, messageCount))
+    print("    best replay: {:.2f} ms, {:.3f} us/{}, {:.0f} {}/s".format(bestTime*1000, bestTime*1e6/messageCount, unit, messageCount/bestTime, unit))
+    print("    allocations: {:.3f} net blocks/{}, {:.1f} peak traced bytes/{}".format(result['netBlocks']/messageCount, unit, result['peakBytes']/messageCount, unit))
+
+def readCapture(path):
+    with open(path, 'rb') as captureFile:
+        return captureFile.read()
+
+# split a capture into fixed size chunks, as a FIFO reader would see it
+def splitChunks(capture, chunkSize):
+    return [capture[offset:offset+chunkSize] for offset in range(0, len(capture), chunkSize)]
+
+# split a capture into chunks of whole lines no bigger than maxSize, as a line buffered process would write it
+def splitLines(capture, maxSize):
+    chunks = []
+    chunk = bytearray()
+    for line in capture.splitlines(keepends=True):
+        if len(chunk) + len(line) > maxSize and len(chunk) > 0:
+            chunks.append(bytes(chunk))
+            chunk = bytearray()
+        chunk += line
+    if len(chunk) > 0:
+        chunks.append(bytes(chunk))
+    return chunks
+
+# run a parser over chunks written one at a time to the file descriptor it reads from, returns the time spent parsing
+def replayChunks(chunks, writeFd, parseFunc):
+    parseTime = 0
+    for chunk in chunks:
+        os.write(writeFd, chunk)
+        startTime = time.perf_counter()
+        parseFunc()
+        parseTime += time.perf_counter() - startTime
+    return parseTime
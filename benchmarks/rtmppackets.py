@@ -0,0 +1,134 @@
+#    Ryde Player provides a on screen interface and video player for Longmynd compatible tuners.
+#    Copyright © 2022 Tim Clark
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import argparse, collections, contextlib, os, queue, socket, threading, time
+from benchmarks import replay
+import librtmp, librtmp.amf, librtmp.packet
+import rydeplayer.common
+import rydeplayer.sources.common
+import rydeplayer.sources.rtmpstream
+import rydeplayer.sources.longmynd # provides the default band for a new tunerConfig
+
+# Replays RTMP packets through the rtmpStreamManager read thread loop and times the packet handling and FLV muxing
+# The connection is replaced with one that plays back a synthetic stream, the FLV pipe is drained by a reader thread
+# Run from the repository root with: python3 -m benchmarks.rtmppackets
+
+replayPacket = collections.namedtuple('replayPacket', ['type', 'timestamp', 'body'])
+
+# plays back a list of packets in place of a librtmp connection
+# the read loop closes the ring when it reads the final flush, so that is held back until the writer thread has emptied the ring
+class replayConnection(object):
+    def __init__(self, packets, ring):
+        self.connected = True
+        self.packets = packets
+        self.nextPacket = 0
+        self.ring = ring
+
+    def read_packet(self):
+        packet = self.packets[self.nextPacket]
+        self.nextPacket += 1
+        if self.nextPacket == len(self.packets):
+            while self.ring.getMetrics()['depthTags'] > 0:
+                time.sleep(0.0001)
+        return packet
+
+    def handle_packet(self, packet):
+        pass
+
+def _controlPacket(messageType):
+    return replayPacket(librtmp.packet.PACKET_TYPE_CONTROL, 0, messageType.to_bytes(2, byteorder='big')+bytes(4))
+
+def _amfPacket(packetType, *values):
+    return replayPacket(packetType, 0, b''.join(librtmp.amf.encode_amf(value) for value in values))
+
+# a 25fps H.264 stream with AAC audio, a keyframe every gop frames, ended by a stream flush
+def syntheticStream(seconds, gop=50, keyframeSize=20000, interframeSize=2000, audioSize=200):
+    packets = [
+        _controlPacket(0), # stream begin
+        _amfPacket(librtmp.packet.PACKET_TYPE_INVOKE, 'onStatus', 0, None, {'level': 'status', 'code': 'NetStream.Play.Start', 'description': 'Started playing'}),
+        _amfPacket(librtmp.packet.PACKET_TYPE_INFO, 'onMetaData', {'width': 1280.0, 'height': 720.0, 'videocodecid': 7.0, 'audiocodecid': 10.0}),
+        ]
+    keyframe = b'\x17\x01' + bytes(keyframeSize-2)
+    interframe = b'\x27\x01' + bytes(interframeSize-2)
+    audio = b'\xaf\x01' + bytes(audioSize-2)
+    for frame in range(seconds*25):
+        timestamp = frame*40
+        packets.append(replayPacket(librtmp.packet.PACKET_TYPE_VIDEO, timestamp, keyframe if frame%gop == 0 else interframe))
+        packets.append(replayPacket(librtmp.packet.PACKET_TYPE_AUDIO, timestamp, audio))
+        packets.append(replayPacket(librtmp.packet.PACKET_TYPE_AUDIO, timestamp+20, audio))
+        if frame%25 == 0:
+            packets.append(_controlPacket(6)) # ping
+    packets.append(_controlPacket(1)) # stream flush
+    return packets
+
+def _drainPipe(readFd, byteCount):
+    while True:
+        data = os.read(readFd, 65536)
+        if len(data) < 1:
+            break
+        byteCount[0] += len(data)
+    os.close(readFd)
+
+def benchmark(packets, repeat):
+    sourceConfig = rydeplayer.sources.rtmpstream.config()
+    rtmpMan = rydeplayer.sources.rtmpstream.rtmpStreamManager(rydeplayer.sources.common.tunerConfig(), sourceConfig, rydeplayer.common.fdRegistry())
+    eventQueue = queue.Queue()
+    commQueue = queue.Queue()
+    ringMetrics = []
+    flvBytes = [0]
+    # the replay runs much faster than real time, size the ring to hold all of it so nothing is dropped and every packet is muxed
+    ringSize = 2*sum(len(packet.body)+rydeplayer.sources.rtmpstream.mediaRing.tagOverhead for packet in packets)
+
+    # one complete play of the stream, from the start control packet to the flush
+    def replayStream():
+        rPipeFd, wPipeFd = os.pipe()
+        drainThread = threading.Thread(target=_drainPipe, args=(rPipeFd, flvBytes))
+        drainThread.start()
+        ring = rydeplayer.sources.rtmpstream.mediaRing(ringSize, ringSize, ringSize//2)
+        startTime = time.perf_counter()
+        # returns once the flush has been read, by then every tag has been muxed into the pipe
+        rtmpMan._readThreadLoop(replayConnection(packets, ring), wPipeFd, ring, collections.Counter(), rtmpMan.sendSockEvent, eventQueue, commQueue, 5, 5, 0)
+        replayTime = time.perf_counter() - startTime
+        drainThread.join()
+        ringMetrics.append(ring.getMetrics())
+        # the events aren't needed, drain them so they don't build up
+        while not eventQueue.empty():
+            eventQueue.get()
+        while True:
+            try:
+                rtmpMan.recvSockEvent.recv(4096, socket.MSG_DONTWAIT)
+            except BlockingIOError:
+                break
+        return replayTime
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            result = replay.measure(replayStream, repeat)
+        finally:
+            rtmpMan.cleanup()
+    replay.report("RTMP packets (rtmpStreamManager._readThreadLoop)", "packets", len(packets), result)
+    print("    FLV bytes per replay: "+str(flvBytes[0]//(repeat+2))+", media buffer drops: "+str(sum(metrics['dropCount'] for metrics in ringMetrics)))
+    return result
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=int, default=120, help="length of the synthetic stream")
+    parser.add_argument('--repeat', type=int, default=5, help="number of times to replay the stream")
+    args = parser.parse_args()
+    benchmark(syntheticStream(args.seconds), args.repeat)
+
+if __name__ == '__main__':
+    run()
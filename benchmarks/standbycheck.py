@@ -0,0 +1,120 @@
+#    Ryde Player provides a on screen interface and video player for Longmynd compatible tuners.
+#    Copyright © 2022 Tim Clark
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import sys, time
+from benchmarks import replay # makes the stub modules available if the real ones aren't installed
+import librtmp
+import rydeplayer.common
+import rydeplayer.sources.common
+import rydeplayer.sources.longmynd
+import rydeplayer.sources.combituner
+import rydeplayer.sources.rtmpstream
+
+# Checks that switching to a neighbouring RTMP preset uses the standby connection kept for it
+# the player sends the reconfig and then the standby presets for the new neighbours, which no longer include the preset being switched to
+# it is checked straight after the standbys connect and again after staying on a preset for longer than a standby can idle, with a failed first connect
+# Run from the repository root with: python3 -m benchmarks.standbycheck
+
+# Stand-in RTMP connection that connects instantly and never receives anything
+class fakeConnection(object):
+    failConnects = 0 # number of connects still to fail
+
+    def __init__(self, url, **kwargs):
+        self.playpath = kwargs.get('playpath')
+        self.connected = False
+
+    def set_option(self, key, value):
+        pass
+
+    def connect(self):
+        if fakeConnection.failConnects > 0:
+            fakeConnection.failConnects -= 1
+            raise librtmp.RTMPError("Fake connection refused")
+        self.connected = True
+
+    def read_packet(self):
+        time.sleep(0.05)
+        raise librtmp.RTMPTimeoutError("No data from the fake connection")
+
+    def handle_packet(self, packet):
+        pass
+
+    def close(self):
+        self.connected = False
+
+def makePreset(streamname):
+    preset = rydeplayer.sources.common.tunerConfig()
+    preset.loadConfig({'band': {'source': 'RTMPSTREAM', 'domain': 'rtmp.example.com', 'rtmpapp': 'live', 'gpioid': 0}, 'streamname': streamname})
+    return preset
+
+# wait for the condition to become true, returns False if it doesn't in time
+def waitFor(condition, timeout = 5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+# switch from the second preset to the third after dwell seconds, returns True if the standby connection was used
+def checkSwitch(dwell):
+    presets = [makePreset(streamname) for streamname in ['one', 'two', 'three']]
+    sourceConfigs = {
+        rydeplayer.sources.common.sources.LONGMYND: rydeplayer.sources.longmynd.config(),
+        rydeplayer.sources.common.sources.COMBITUNER: rydeplayer.sources.combituner.config(),
+        rydeplayer.sources.common.sources.RTMPSTREAM: rydeplayer.sources.rtmpstream.config(standby=True),
+        }
+    fdRegistry = rydeplayer.common.fdRegistry()
+    sourceMan = rydeplayer.sources.common.sourceManagerThread(presets[1], sourceConfigs, fdRegistry)
+    rtmpMan = sourceMan.sourceMan
+    sourceMan.start()
+    # standby connections either side of the second preset
+    sourceMan.setStandbyConfigs([presets[2], presets[0]])
+    ready = waitFor(lambda: len(rtmpMan.standbyConnections) == 2 and all(standby.isReady() for standby in list(rtmpMan.standbyConnections.values())))
+    if not ready:
+        print("FAIL: standby connections never became ready")
+        sourceMan.shutdown()
+        return False
+    time.sleep(dwell)
+    standbyConnection = rtmpMan.standbyConnections[rtmpMan._standbyKey(presets[2])].rtmpConnection
+    # switch to the third preset the way the player does, the new neighbours are the second and first presets
+    sourceMan.reconfig(presets[2])
+    sourceMan.setStandbyConfigs([presets[0], presets[1]])
+    switched = waitFor(lambda: rtmpMan.rtmpConnection is not None and rtmpMan.rtmpConnection.playpath == 'three')
+    taken = switched and rtmpMan.rtmpConnection is standbyConnection and standbyConnection.connected
+    sourceMan.shutdown()
+    fdRegistry.close()
+    if not switched:
+        print("FAIL: the source never switched to the third preset after "+str(dwell)+"s")
+    elif not taken:
+        print("FAIL: the switch after "+str(dwell)+"s opened a new connection instead of using the standby one")
+    else:
+        print("OK: the switch after "+str(dwell)+"s used the standby connection")
+    return taken
+
+def run():
+    rydeplayer.sources.rtmpstream.librtmp.RTMP = fakeConnection
+    # shorten the standby timings so a long dwell takes a few seconds
+    rydeplayer.sources.rtmpstream.standbyConnection.maxAge = 1.5
+    rydeplayer.sources.rtmpstream.standbyConnection.refreshAge = 1
+    rydeplayer.sources.rtmpstream.rtmpStreamManager.standbyServiceInterval = 0.25
+    quickSwitch = checkSwitch(0)
+    fakeConnection.failConnects = 1
+    dwellSwitch = checkSwitch(4)
+    return quickSwitch and dwellSwitch
+
+if __name__ == '__main__':
+    sys.exit(0 if run() else 1)
@@ -0,0 +1,29 @@
+#    Ryde Player provides a on screen interface and video player for Longmynd compatible tuners.
+#    Copyright © 2022 Tim Clark
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Minimal stand in for python-librtmp, enough for the RTMP source to be imported and for packets to be replayed through it
+import librtmp.packet
+import librtmp.amf
+
+class RTMPError(IOError):
+    pass
+
+class RTMPTimeoutError(RTMPError):
+    pass
+
+class RTMP(object):
+    def __init__(self, url, **kwargs):
+        raise RTMPError("No network connections in the benchmark stubs")
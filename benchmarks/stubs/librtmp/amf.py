@@ -0,0 +1,87 @@
+#    Ryde Player provides a on screen interface and video player for Longmynd compatible tuners.
+#    Copyright © 2022 Tim Clark
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import struct
+
+# AMF0 encoder and decoder covering the types RTMP servers send in metadata and status messages
+
+def _decodeValue(data, offset):
+    marker = data[offset]
+    offset += 1
+    if marker == 0x00: # number
+        return struct.unpack_from('>d', data, offset)[0], offset+8
+    elif marker == 0x01: # boolean
+        return data[offset] != 0, offset+1
+    elif marker == 0x02: # string
+        return _decodeString(data, offset)
+    elif marker == 0x03: # object
+        return _decodeObject(data, offset)
+    elif marker == 0x05 or marker == 0x06: # null and undefined
+        return None, offset
+    elif marker == 0x08: # ECMA array
+        return _decodeObject(data, offset+4)
+    elif marker == 0x0A: # strict array
+        count = struct.unpack_from('>I', data, offset)[0]
+        offset += 4
+        values = []
+        for i in range(count):
+            value, offset = _decodeValue(data, offset)
+            values.append(value)
+        return values, offset
+    raise ValueError("Unsupported AMF0 type "+str(marker))
+
+def _decodeString(data, offset):
+    length = struct.unpack_from('>H', data, offset)[0]
+    offset += 2
+    return bytes(data[offset:offset+length]).decode('utf-8'), offset+length
+
+def _decodeObject(data, offset):
+    values = {}
+    while True:
+        key, offset = _decodeString(data, offset)
+        if key == '' and data[offset] == 0x09: # object end
+            return values, offset+1
+        values[key], offset = _decodeValue(data, offset)
+
+def decode_amf(data):
+    values = []
+    offset = 0
+    while offset < len(data):
+        value, offset = _decodeValue(data, offset)
+        values.append(value)
+    return values
+
+def _encodeString(value):
+    encoded = value.encode('utf-8')
+    return struct.pack('>H', len(encoded)) + encoded
+
+def _encodeValue(value):
+    if value is None:
+        return b'\x05'
+    elif isinstance(value, bool):
+        return b'\x01' + (b'\x01' if value else b'\x00')
+    elif isinstance(value, (int, float)):
+        return b'\x00' + struct.pack('>d', value)
+    elif isinstance(value, str):
+        return b'\x02' + _encodeString(value)
+    elif isinstance(value, dict):
+        return b'\x03' + b''.join(_encodeString(key) + _encodeValue(item) for key, item in value.items()) + b'\x00\x00\x09'
+    elif isinstance(value, (list, tuple)):
+        return b'\x0A' + struct.pack('>I', len(value)) + b''.join(_encodeValue(item) for item in value)
+    raise ValueError("Unsupported type for AMF0")
+
+def encode_amf(*values):
+    return b''.join(_encodeValue(value) for value in values)
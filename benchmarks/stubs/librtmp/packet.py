@@ -0,0 +1,36 @@
+#    Ryde Player provides a on screen interface and video player for Longmynd compatible tuners.
+#    Copyright © 2022 Tim Clark
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+PACKET_TYPE_CHUNK_SIZE = 0x01
+PACKET_TYPE_BYTES_READ_REPORT = 0x03
+PACKET_TYPE_CONTROL = 0x04
+PACKET_TYPE_SERVER_BW = 0x05
+PACKET_TYPE_CLIENT_BW = 0x06
+PACKET_TYPE_AUDIO = 0x08
+PACKET_TYPE_VIDEO = 0x09
+PACKET_TYPE_FLEX_STREAM_SEND = 0x0F
+PACKET_TYPE_FLEX_SHARED_OBJECT = 0x10
+PACKET_TYPE_FLEX_MESSAGE = 0x11
+PACKET_TYPE_INFO = 0x12
+PACKET_TYPE_SHARED_OBJECT = 0x13
+PACKET_TYPE_INVOKE = 0x14
+PACKET_TYPE_FLASH_VIDEO = 0x16
+
+class RTMPPacket(object):
+    def __init__(self, type, timestamp, body):
+        self.type = type
+        self.timestamp = timestamp
+        self.body = body
@@ -0,0 +1,34 @@
+#    Ryde Player provides a on screen interface and video player for Longmynd compatible tuners.
+#    Copyright © 2022 Tim Clark
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import enum
+
+class FtdiEeprom(object):
+    class CFG1(enum.IntFlag):
+        CLK_IDLE_STATE = 1 << 0
+        DATA_LSB = 1 << 1
+        FLOW_CONTROL = 1 << 2
+        HIGH_CURRENTDRIVE = 1 << 4
+        HIGH_CURRENTDRIVE_R = 1 << 5
+        SUSPEND_PULL_DOWNS = 1 << 6
+
+    properties = ()
+
+    def open(self, device):
+        raise IOError("No USB devices in the benchmark stubs")
+
+    def close(self):
+        pass
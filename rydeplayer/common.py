@@ -14,7 +14,7 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-import enum
+import enum, selectors, collections, time
 
 class navEvent(enum.Enum):
     UP     = (enum.auto(), 'UP',     None)
@@ -95,3 +95,93 @@ class validTracker(object):
 
     def isValid(self):
         return self.valid
+
+# persistent registry of readable file descriptors for an event loop
+# each fd maps directly to its handler so dispatch doesn't need to search the managers
+class fdRegistry(object):
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+
+    def register(self, fd, handler):
+        self.selector.register(fd, selectors.EVENT_READ, handler)
+
+    def unregister(self, fd):
+        try:
+            self.selector.unregister(fd)
+        except (KeyError, ValueError):
+            pass
+
+    def registerAll(self, fds, handler):
+        for fd in fds:
+            self.register(fd, handler)
+
+    def unregisterAll(self, fds):
+        for fd in fds:
+            self.unregister(fd)
+
+    # wait for ready fds and yield them with their handler
+    # fds unregistered by an earlier handler in the same wakeup are skipped
+    def select(self, timeout = None):
+        ready = self.selector.select(timeout)
+        fdMap = self.selector.get_map()
+        for key, events in ready:
+            if fdMap.get(key.fd) is key:
+                yield (key.fileobj, key.data)
+
+    def close(self):
+        self.selector.close()
+
+# bounded log that keeps the most recent entries within an entry count and approximate byte budget
+# timestamps are kept as monotonic floats and only formatted when the log is dumped
+class ringLog(object):
+    def __init__(self, maxEntries = 1000, maxBytes = 256*1024):
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.entries = collections.deque()
+        self.size = 0
+        self.dropped = 0
+
+    @staticmethod
+    def _entrySize(entry):
+        if isinstance(entry, (str, bytes, bytearray)):
+            return len(entry)
+        elif isinstance(entry, tuple):
+            return sum(ringLog._entrySize(part) for part in entry)
+        else:
+            return 8
+
+    def append(self, entry):
+        entrySize = self._entrySize(entry)
+        self.entries.append((time.monotonic(), entry, entrySize))
+        self.size += entrySize
+        # drop the oldest entries until it fits, always keep the newest
+        while len(self.entries) > 1 and (len(self.entries) > self.maxEntries or self.size > self.maxBytes):
+            oldTime, oldEntry, oldSize = self.entries.popleft()
+            self.size -= oldSize
+            self.dropped += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        for entryTime, entry, entrySize in self.entries:
+            yield entry
+
+    # formatted log lines, optionally only the last count lines
+    def dump(self, count = None):
+        lines = []
+        if self.dropped > 0 and (count is None or count >= len(self.entries)):
+            lines.append("... "+str(self.dropped)+" earlier log entries dropped")
+        entries = list(self.entries)
+        if count is not None:
+            entries = entries[-count:]
+        # convert the monotonic times to wall clock times now rather than on every append
+        wallOffset = time.time() - time.monotonic()
+        for entryTime, entry, entrySize in entries:
+            lines.append(time.strftime("%m/%d/%Y, %H:%M:%S", time.localtime(entryTime + wallOffset))+" "+str(entry))
+        return lines
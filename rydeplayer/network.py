@@ -17,6 +17,7 @@
 import socket, json
 import rydeplayer.sources.common
 import rydeplayer.common
+import rydeplayer.tracing
 
 class networkConfig(object):
     def __init__(self):
@@ -55,10 +56,13 @@ class networkConfig(object):
 
 
 class networkManager(object):
-    def __init__(self, config, eventCallback, muteCallback, debugFunctions):
+    def __init__(self, config, eventCallback, muteCallback, recordCallback, debugFunctions, statusCallback, fdRegistry):
         self.config = config
+        self.fdRegistry = fdRegistry
         self.eventCallback = eventCallback
         self.muteCallback = muteCallback
+        self.recordCallback = recordCallback
+        self.statusCallback = statusCallback
         self.debugFunctions = debugFunctions
         self.activeConnections = dict()
         if self.config.network.enabled:
@@ -67,12 +71,18 @@ class networkManager(object):
             self.mainSock.setblocking(0)
             self.mainSock.bind((self.config.network.bindaddr, self.config.network.port))
             self.mainSock.listen(5)
+            self.fdRegistry.register(self.mainSock, self.handleFD)
             self.commands = { # dict of commands and handler functions
                     "getBands":  self.getBands,
                     "setTune":   self.setTune,
                     "setMute":   self.setMute,
+                    "setRecording": self.setRecording,
+                    "getRecording": self.getRecording,
                     "sendEvent": self.sendEvent,
                     "debugFire": self.debugFire,
+                    "getTSHealth": self.getTSHealth,
+                    "getTuneTrace": self.getTuneTrace,
+                    "getMediaBuffer": self.getMediaBuffer,
                     }
             self.eventMap = dict()
             for thisEvent in rydeplayer.common.navEvent:
@@ -97,15 +107,18 @@ class networkManager(object):
             connection, addr = fd.accept()
             connection.setblocking(0)
             self.activeConnections[connection] = bytes()
+            self.fdRegistry.register(connection, self.handleFD)
         elif fd in self.activeConnections:
             dataStr = fd.recv(1024)
             if dataStr:
                 self.activeConnections[fd]+=dataStr
                 if len(self.activeConnections[fd]) > (100*1024): # 100kB command limit
                     del self.activeConnections[fd]
+                    self.fdRegistry.unregister(fd)
                     fd.shutdown(socket.SHUT_RDWR)
                     fd.close()
                     print("Network command too long, chopping")
+                    return stop
                 try:
                     data = json.loads(self.activeConnections[fd])
                 except json.JSONDecodeError:
@@ -114,6 +127,7 @@ class networkManager(object):
                 fd.send(bytes(json.dumps(result),encoding="utf-8"))
             else:
                 del self.activeConnections[fd]
+                self.fdRegistry.unregister(fd)
                 fd.shutdown(socket.SHUT_RDWR)
                 fd.close()
         return stop
@@ -174,6 +188,23 @@ class networkManager(object):
         self.muteCallback(command['mute'])
         return (result, False)
 
+    def setRecording(self, command):
+        result = {'success':True}
+        if 'recording' not in command:
+            result['success'] = False
+            result['error'] = "No recording state specified"
+            return (result, False)
+        if not isinstance(command['recording'], bool):
+            result['success'] = False
+            result['error'] = "Recording is not a bool"
+            return (result, False)
+        self.recordCallback(command['recording'])
+        return (result, False)
+
+    def getRecording(self, command):
+        result = {'success':True, 'recording': self.statusCallback().getRecording()}
+        return (result, False)
+
     def sendEvent(self, command):
         result = {'success':True}
         if 'event' not in command:
@@ -200,3 +231,30 @@ class networkManager(object):
             return (result, False)
         self.debugFunctions[command['function']]()
         return (result, False)
+
+    def getTSHealth(self, command):
+        result = {'success':True}
+        health = self.statusCallback().getTSHealth()
+        if health is None:
+            result['success'] = False
+            result['error'] = "No TS health available, enable tsanalysis for the source"
+            return (result, False)
+        result['health'] = health._asdict()
+        # JSON object keys have to be strings
+        result['health']['pidBitrates'] = {str(pid): bitrate for pid, bitrate in health.pidBitrates.items()}
+        return (result, False)
+
+    def getTuneTrace(self, command):
+        result = {'success':True, 'trace': rydeplayer.tracing.tracer.dump()}
+        return (result, False)
+
+    def getMediaBuffer(self, command):
+        result = {'success':True}
+        mediaBuffer = self.statusCallback().getMediaBuffer()
+        if mediaBuffer is None:
+            result['success'] = False
+            result['error'] = "No media buffer available, only running RTMP streams have one"
+            return (result, False)
+        result['buffer'] = mediaBuffer
+        result['unforwardedPackets'] = self.statusCallback().getUnforwardedPackets()
+        return (result, False)
@@ -29,6 +29,7 @@ class AvailableModules(enum.Enum):
     PROGRAM = enum.auto()
     FREQ = enum.auto()
     BW = enum.auto()
+    TSHEALTH = enum.auto()
 
 # Enum containing configurable timer lengths
 class TimerLength(enum.Enum):
@@ -42,19 +43,14 @@ class Group(object):
         self.controller = controller
         self.modules = {}
 
-    # enable, disable and move modules to match this group
+    # enable, disable and move modules to match this group, the controller pushes the changes with the rest of the main loop iteration
     def activate(self):
-        moduleLayoutChanged = False
         for moduleName, module in self.controller.getModules().items():
             if moduleName in self.modules:
-                if module.setRect(self.modules[moduleName], True):
-                    moduleLayoutChanged = True
-                if module.setEnabled(True):
-                    moduleLayoutChanged = True
-            elif module.setEnabled(False):
-                moduleLayoutChanged = True
-        if moduleLayoutChanged:
-            self.controller.updateLayer()
+                module.setRect(self.modules[moduleName])
+                module.setEnabled(True)
+            else:
+                module.setEnabled(False)
 
     # Set the layout details of this group
     def setModules(self, modules):
@@ -211,6 +207,8 @@ class Controller(object):
         # Create display layer
         self.dispmanxlayer = pydispmanx.dispmanxLayer(3)
         self.surface = pygame.image.frombuffer(self.dispmanxlayer, self.dispmanxlayer.size, 'RGBA')
+        # areas changed since the layer was last pushed
+        self.damage = []
         # Initialise modules
         self.modules = dict()
         self.modules[AvailableModules.PLAYERID]=rydeplayer.osd.modules.textDisplay(self.theme, self.draw, theme.relativeRect(rydeplayer.common.datumCornerEnum.TL, 0.03, 0.03, 0.25, 0.04), self.player.getPlayerID())
@@ -219,19 +217,21 @@ class Controller(object):
         self.modules[AvailableModules.VOLUME]=rydeplayer.osd.modules.volume(self.theme, self.draw, theme.relativeRect(rydeplayer.common.datumCornerEnum.TR, 0.25, 0.03, 0.2, 0.15), self.player.getVolume())
         self.player.addVolumeCallback(self.modules[AvailableModules.VOLUME].updateVal)
         self.modules[AvailableModules.SIGLEVEL]=rydeplayer.osd.modules.sigLevel(self.theme, self.draw, theme.relativeRect(rydeplayer.common.datumCornerEnum.TR, 0.03, 0.15, 0.2, 0.15))
-        self.sourceStatus.addOnChangeCallback(self.modules[AvailableModules.SIGLEVEL].updateVal)
+        self.sourceStatus.addOnChangeCallback(self.modules[AvailableModules.SIGLEVEL].updateVal, 'signalLevel')
         self.modules[AvailableModules.REPORT]=rydeplayer.osd.modules.report(self.theme, self.draw, theme.relativeRect(rydeplayer.common.datumCornerEnum.TR, 0.03, 0.32, 0.2, 0.15))
-        self.sourceStatus.addOnChangeCallback(self.modules[AvailableModules.REPORT].updateVal)
+        self.sourceStatus.addOnChangeCallback(self.modules[AvailableModules.REPORT].updateVal, 'signalReport')
         self.modules[AvailableModules.POWERLEVEL]=rydeplayer.osd.modules.powerLevel(self.theme, self.draw, theme.relativeRect(rydeplayer.common.datumCornerEnum.TR, 0.03, 0.49, 0.2, 0.15))
-        self.sourceStatus.addOnChangeCallback(self.modules[AvailableModules.POWERLEVEL].updateVal)
+        self.sourceStatus.addOnChangeCallback(self.modules[AvailableModules.POWERLEVEL].updateVal, 'powerLevel')
         self.modules[AvailableModules.PROGRAM]=rydeplayer.osd.modules.program(self.theme, self.draw, theme.relativeRect(rydeplayer.common.datumCornerEnum.BC, 0, 0.03, 0.73, 0.2))
-        self.sourceStatus.addOnChangeCallback(self.modules[AvailableModules.PROGRAM].updateVal)
+        self.sourceStatus.addOnChangeCallback(self.modules[AvailableModules.PROGRAM].updateVal, 'program')
         self.tunerConfig.addCallbackFunction(self._updatePresetName)
         self._updatePresetName(self.tunerConfig)
         self.modules[AvailableModules.FREQ]=rydeplayer.osd.modules.freq(self.theme, self.draw, theme.relativeRect(rydeplayer.common.datumCornerEnum.BR, 0.03, 0.03, 0.25, 0.04))
-        self.sourceStatus.addOnChangeCallback(self.modules[AvailableModules.FREQ].updateVal)
+        self.sourceStatus.addOnChangeCallback(self.modules[AvailableModules.FREQ].updateVal, 'signalSource')
         self.modules[AvailableModules.BW]=rydeplayer.osd.modules.bw(self.theme, self.draw, theme.relativeRect(rydeplayer.common.datumCornerEnum.BR, 0.03, 0.07, 0.25, 0.04))
-        self.sourceStatus.addOnChangeCallback(self.modules[AvailableModules.BW].updateVal)
+        self.sourceStatus.addOnChangeCallback(self.modules[AvailableModules.BW].updateVal, 'signalBandwidth')
+        self.modules[AvailableModules.TSHEALTH]=rydeplayer.osd.modules.tsHealth(self.theme, self.draw, theme.relativeRect(rydeplayer.common.datumCornerEnum.BL, 0.03, 0.03, 0.3, 0.04))
+        self.sourceStatus.addOnChangeCallback(self.modules[AvailableModules.TSHEALTH].updateVal, 'tsHealth')
         # Initalise groups
         self.activeGroup = Group(self.theme, self)
         self.activeGroup.setModules(config.getActiveGroup())
@@ -253,28 +253,50 @@ class Controller(object):
     def getModules(self):
         return self.modules
 
-    # Draw module on the screen, passed as callback to modules
-    def draw(self, module, boxes = None, deferRedraw=False):
-        # paint everything out
+    # Mark the module as needing painting, passed as callback to modules
+    # nothing is painted until updateLayer so all the changes from one main loop iteration go to the screen together
+    def draw(self, module, boxes = None):
         if boxes is None:
             boxes = [module.getRect()]
-        for box in boxes:
-            self.surface.fill(self.theme.colours.transparent, box)
-        # paint everything that is enabled back in
-        blitPairs = []
-        for module in self.modules.values():
-            if module.getEnabled():
-                modulerect = module.getRect()
-                if modulerect.collidelist(boxes) >= 0:
-                    modulesurface = module.getSurface()
-                    for box in boxes:
-                        blitPairs.append((modulesurface, modulerect))# , modulerect.clip(box))) do it the slow way, pending pygame fix
-        self.surface.blits(blitPairs)
-        # Allow defering final update if multiple modules as being updated
-        if not deferRedraw:
-            self.dispmanxlayer.updateLayer()
+        self.damage.extend(boxes)
 
+    # merge the damaged areas until no two overlap or touch the same enabled module, so each module is blitted at most once
+    def _mergeDamage(self, modulerects):
+        screenrect = self.surface.get_rect()
+        regions = [box.clip(screenrect) for box in self.damage]
+        regions = [region for region in regions if region.width > 0 and region.height > 0]
+        merged = True
+        while merged:
+            merged = False
+            for i in range(len(regions)):
+                for j in range(i+1, len(regions)):
+                    if regions[i].colliderect(regions[j]) or any(modulerect.colliderect(regions[i]) and modulerect.colliderect(regions[j]) for modulerect in modulerects):
+                        regions[i] = regions[i].union(regions.pop(j))
+                        merged = True
+                        break
+                if merged:
+                    break
+        return regions
+
+    # Paint the damaged areas and push the layer to the screen, called once per main loop iteration
     def updateLayer(self):
+        if len(self.damage) == 0:
+            return
+        enabledModules = [module for module in self.modules.values() if module.getEnabled()]
+        regions = self._mergeDamage([module.getRect() for module in enabledModules])
+        self.damage = []
+        # paint everything out
+        for region in regions:
+            self.surface.fill(self.theme.colours.transparent, region)
+        # paint the part of everything enabled that is in a damaged area back in
+        blitTriples = []
+        for module in enabledModules:
+            modulerect = module.getRect()
+            regionIndex = modulerect.collidelist(regions)
+            if regionIndex >= 0:
+                cliprect = modulerect.clip(regions[regionIndex])
+                blitTriples.append((module.getSurface(), cliprect, cliprect.move(-modulerect.x, -modulerect.y)))
+        self.surface.blits(blitTriples, doreturn=False)
         self.dispmanxlayer.updateLayer()
 
     # Activate the OSD activated group if not already active at a higer priority
@@ -33,7 +33,7 @@ class generic(object):
         return self.rect
 
     # resize the module with a new rect
-    def setRect(self, newrect, deferRedraw = False):
+    def setRect(self, newrect):
         oldrect = self.rect.copy()
         if newrect is None:
             newrect = self.defaultRect.copy() # so we don't have to rely on something not changing it
@@ -41,7 +41,7 @@ class generic(object):
             self.rect = newrect
             self.surface = pygame.Surface(self.rect.size, pygame.SRCALPHA)
             # pass the old rect too to make sure it is painted out
-            self.redraw([oldrect, newrect], deferRedraw=deferRedraw)
+            self.redraw([oldrect, newrect])
             return True
         else:
             return False
@@ -49,10 +49,10 @@ class generic(object):
     def getSurface(self):
         return self.surface
 
-    def setEnabled(self, enabled, deferRedraw = False):
+    def setEnabled(self, enabled):
         if(self.enabled != enabled):
             self.enabled = enabled
-            self.redraw(deferRedraw=deferRedraw)
+            self.redraw()
             return True
         else:
             return False
@@ -63,12 +63,12 @@ class generic(object):
     def updateVal(self, newval):
         self.redraw()
 
-    def redraw(self, rects = None, deferRedraw = False):
+    def redraw(self, rects = None):
         if(self.drawCallback is not None):
             if(rects is None):
-                self.drawCallback(self, deferRedraw = deferRedraw)
+                self.drawCallback(self)
             else:
-                self.drawCallback(self, rects, deferRedraw = deferRedraw)
+                self.drawCallback(self, rects)
 
 # generic module for displaying a small numeric value
 class meterDisplay(generic):
@@ -83,7 +83,7 @@ class meterDisplay(generic):
         self.meterConfig = None
         self.renderedMeterConfig = None
 
-    def redraw(self, rects = None, deferRedraw = False):
+    def redraw(self, rects = None):
         # if the layout needs recalcuating because its new, moved or changed size
         if(self.renderedbox is None or self.renderedbox != self.rect or self.meterConfig != self.renderedMeterConfig):
             self.surface.fill(self.theme.colours.transparent)
@@ -93,9 +93,11 @@ class meterDisplay(generic):
                 meterbar.right = self.rect.width
                 textwidth = self.rect.width - meterbar.width # total width available for the text
                 staticfontsize = self.theme.fontSysSizeOptimize(self.renderedMeterConfig.staticText, textwidth*0.8, 'freesans')
-                staticfont = self.theme.fontLib.SysFont('freesans', staticfontsize) # font for the static unit text
+                staticfont = self.theme.getSysFont('freesans', staticfontsize) # font for the static unit text
                 dynamicfontsize = self.theme.fontSysSizeOptimize("25.5", textwidth*0.8, 'freesans')
-                self.dynamicfont = self.theme.fontLib.SysFont('freesans', dynamicfontsize) # font for the actual report value
+                self.dynamicfont = self.theme.getSysFont('freesans', dynamicfontsize) # font for the actual report value
+                self.dynamicAtlas = self.theme.getGlyphAtlas('freesans', dynamicfontsize, self.theme.colours.white, self.theme.colours.black, 1) # prerendered glyphs for the value
+                self.dynamicAtlas.addChars(self.renderedMeterConfig.prefixText)
                 textheight = staticfont.get_linesize() + self.dynamicfont.get_linesize()
                 self.textbox = pygame.Rect((0,0), (textwidth, textheight))
                 self.textbox.centery=self.rect.height/2 # center the box containing the text vertically in the bigger box
@@ -114,12 +116,12 @@ class meterDisplay(generic):
                 valueText = "-"
             else:
                 valueText = self.renderedMeterConfig.prefixText + str(self.value)
-            dynamicTextSurface = self.theme.outlineFontRender(valueText, self.dynamicfont, self.theme.colours.white, self.theme.colours.black, 1)
-            self.dynamicTextRect = dynamicTextSurface.get_rect()
+            # compose the value from the glyph atlas straight onto the module surface
+            self.dynamicTextRect = pygame.Rect((0,0), self.dynamicAtlas.size(valueText))
             self.dynamicTextRect.top = self.textbox.top
             self.dynamicTextRect.centerx = self.textbox.centerx
-            self.surface.blit(dynamicTextSurface, self.dynamicTextRect)
-        super().redraw(rects, deferRedraw)
+            self.dynamicAtlas.renderTo(self.surface, self.dynamicTextRect.topleft, valueText)
+        super().redraw(rects)
 
     def updateVal(self, newval):
         if self.meterConfig is not None:
@@ -176,7 +178,7 @@ class mute(generic):
         self.mute = newval
         self.redraw()
 
-    def redraw(self, rects = None, deferRedraw = False):
+    def redraw(self, rects = None):
         # module has changed size, resize the image to match the new size
         if(min(self.rect.size)!=self.iconSize):
             self.iconSize = min(self.rect.size)
@@ -189,7 +191,7 @@ class mute(generic):
             self.surface.blit(self.iconSurface,(0,0))
         else:
             self.surface.fill(self.theme.colours.transparent)
-        super().redraw(rects, deferRedraw)
+        super().redraw(rects)
 
 class program(generic):
     def __init__ (self, theme, drawCallback, rect):
@@ -224,7 +226,7 @@ class program(generic):
             self.presetName = newval
         self.redraw()
 
-    def redraw(self, rects = None, deferRedraw = False):
+    def redraw(self, rects = None):
         drawAll = False
         if self.renderedbox is None or self.renderedbox != self.rect:
             drawAll = True
@@ -236,14 +238,14 @@ class program(generic):
             self.serviceRect = pygame.Rect((contentboxleft.x, self.providerRect.bottom),(contentboxleft.width, contentboxleft.height/3))
             serviceDetailsBox = pygame.Rect((contentboxleft.x-self.rect.height*0.05,(contentboxleft.height/3)+contentboxleft.top),(contentboxleft.width+self.rect.height*0.1, (contentboxleft.height/3)*2))
             self.surface.fill(self.theme.colours.white, serviceDetailsBox)
-            self.largeFont = self.theme.fontLib.SysFont('freesans', self.theme.fontSysSizeOptimizeHeight(contentboxleft.height/3, 'freesans')) # font for the large program details
+            self.largeFont = self.theme.getSysFont('freesans', self.theme.fontSysSizeOptimizeHeight(contentboxleft.height/3, 'freesans')) # font for the large program details
             # right box
             contentboxright = pygame.Rect((contentboxleft.right+self.rect.height*0.2,self.rect.height*0.1),((self.rect.width-(self.rect.height*0.5))*0.4, self.rect.height*0.8)) # right content box
             self.modulationRect = pygame.Rect((contentboxright.x,contentboxright.top),(contentboxright.width, contentboxright.height/3))
             self.pidsRect = pygame.Rect((contentboxright.x,(contentboxright.height/3)+contentboxright.top),(contentboxright.width, (contentboxright.height/3)*2)) # 
             pidsColBox = pygame.Rect((self.pidsRect.x-self.rect.height*0.05,self.pidsRect.top),(self.pidsRect.width+self.rect.height*0.1, self.pidsRect.height)) # pids content box
             self.surface.fill(self.theme.colours.white, pidsColBox)
-            self.smallFont = self.theme.fontLib.SysFont('freesans', self.theme.fontSysSizeOptimizeHeight(self.pidsRect.height/4, 'freesans')) # font for the large program details
+            self.smallFont = self.theme.getSysFont('freesans', self.theme.fontSysSizeOptimizeHeight(self.pidsRect.height/4, 'freesans')) # font for the large program details
 
         if drawAll or self.presetName != self.renderedPresetName:
             self.renderedPresetName = self.presetName
@@ -308,7 +310,7 @@ class program(generic):
                 if rendered >= 4:
                     break
 
-        super().redraw(rects, deferRedraw)
+        super().redraw(rects)
 
 # module that displays the a numeric value with units
 class textDisplay(generic):
@@ -328,12 +330,12 @@ class textDisplay(generic):
             self.value = None
             self.redraw()
 
-    def redraw(self, rects = None, deferRedraw = False):
+    def redraw(self, rects = None):
         # if the layout needs recalcuating because its new, moved or changed size
         if self.renderedbox is None or self.renderedbox != self.rect:
             self.surface.fill(self.theme.colours.transparent)
             dynamicfontsize = self.theme.fontSysSizeOptimizeHeight(self.rect.height, 'freesans')
-            self.dynamicfont = self.theme.fontLib.SysFont('freesans', dynamicfontsize) # font for value to be displayed
+            self.dynamicfont = self.theme.getSysFont('freesans', dynamicfontsize) # font for value to be displayed
             self.renderedbox = self.rect.copy()
         # render a blank if it is not set
         if self.value is None :
@@ -347,7 +349,7 @@ class textDisplay(generic):
         self.dynamicTextRect.centery = self.rect.height/2
         self.dynamicTextRect.left = 0;
         self.surface.blit(dynamicTextSurface, self.dynamicTextRect)
-        super().redraw(rects, deferRedraw)
+        super().redraw(rects)
 
 # module that displays the a numeric value with units
 class numericDisplay(generic):
@@ -375,12 +377,12 @@ class numericDisplay(generic):
             self.value = None
             self.redraw()
 
-    def redraw(self, rects = None, deferRedraw = False):
+    def redraw(self, rects = None):
         # if the layout needs recalcuating because its new, moved or changed size
         if self.renderedbox is None or self.renderedbox != self.rect:
             self.surface.fill(self.theme.colours.transparent)
             dynamicfontsize = self.theme.fontSysSizeOptimizeHeight(self.rect.height, 'freesans')
-            self.dynamicfont = self.theme.fontLib.SysFont('freesans', dynamicfontsize) # font for value to be displayed
+            self.dynamicfont = self.theme.getSysFont('freesans', dynamicfontsize) # font for value to be displayed
             self.renderedbox = self.rect.copy()
         # render a blank if it is not set
         if self.value is None or self.numericConfig is None:
@@ -395,7 +397,7 @@ class numericDisplay(generic):
         self.dynamicTextRect.centery = self.rect.height/2
         self.dynamicTextRect.right = self.rect.width
         self.surface.blit(dynamicTextSurface, self.dynamicTextRect)
-        super().redraw(rects, deferRedraw)
+        super().redraw(rects)
 
 # module that displays the current frequency
 class freq(numericDisplay):
@@ -414,3 +416,18 @@ class bw(numericDisplay):
     def updateVal(self, newval):
         self.numericConfig = newval.getSignalBandwidthMeta()
         super().updateVal(newval)
+
+# module that displays the transport stream health counters
+class tsHealth(textDisplay):
+    def __init__ (self, theme, drawCallback, rect):
+        super().__init__(theme, drawCallback, rect, None)
+
+    def updateVal(self, newval):
+        health = newval.getTSHealth()
+        if health is None:
+            newvalue = None
+        else:
+            newvalue = "CC:{} TEI:{} PCR:{:.0f}us {:.2f}Mb/s".format(health.ccErrors, health.teiErrors, health.pcrJitter, health.bitrate/1000000)
+        if newvalue != self.value:
+            self.value = newvalue
+            self.redraw()
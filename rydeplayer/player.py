@@ -14,7 +14,7 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-import pygame, pygame.ftfont, vlc, select, pydispmanx, yaml, os, pkg_resources, argparse, importlib, functools, sys, socket, hashlib, base64
+import pygame, pygame.ftfont, vlc, pydispmanx, yaml, os, pkg_resources, argparse, importlib, functools, sys, socket, hashlib, base64, json, collections
 import rydeplayer.sources.common
 import rydeplayer.sources.longmynd
 import rydeplayer.sources.combituner
@@ -24,14 +24,153 @@ import rydeplayer.gpio
 import rydeplayer.network
 import rydeplayer.common
 import rydeplayer.watchdog
+import rydeplayer.tracing
 import rydeplayer.states.gui
 import rydeplayer.states.playback
 import rydeplayer.osd.display
 import rydeplayer.osd.modules
 
+# Font metrics for each font and size, kept between runs so the font size solvers don't have to build every candidate font
+# metrics are stored against a hash of the font file so they are measured again if the font changes
+class fontMetricsCache(object):
+    cacheVersion = 1
+
+    def __init__(self, fontLib, path = None):
+        self.fontLib = fontLib
+        self.path = path
+        self.fontKeys = {} # font name to the key its metrics are stored under
+        self.fonts = {} # font key to its metrics, line sizes and text widths keyed by font size
+        self.dirty = False
+        if self.path is not None:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as cacheFile:
+                cache = json.load(cacheFile)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print("Can't load font metrics cache: "+str(e))
+            return
+        if isinstance(cache, dict) and cache.get('version') == self.cacheVersion and isinstance(cache.get('fonts'), dict):
+            self.fonts = cache['fonts']
+
+    def save(self):
+        if self.path is None or not self.dirty:
+            return
+        try:
+            tmpPath = self.path+'.tmp'
+            with open(tmpPath, 'w') as cacheFile:
+                json.dump({'version': self.cacheVersion, 'fonts': self.fonts}, cacheFile)
+            os.replace(tmpPath, self.path)
+            self.dirty = False
+        except OSError as e:
+            print("Can't save font metrics cache: "+str(e))
+
+    # the key is the font library and a hash of the font file SysFont will load for this name
+    def _fontKey(self, fontname):
+        if fontname not in self.fontKeys:
+            fontPath = pygame.font.match_font(fontname)
+            if fontPath is None:
+                # SysFont falls back to the default font
+                fontKey = self.fontLib.__name__+':default:'+pygame.font.get_default_font()
+            else:
+                fileHash = hashlib.sha1()
+                try:
+                    with open(fontPath, 'rb') as fontFile:
+                        for block in iter(lambda: fontFile.read(65536), b''):
+                            fileHash.update(block)
+                    fontKey = self.fontLib.__name__+':'+fileHash.hexdigest()
+                except OSError:
+                    fontKey = self.fontLib.__name__+':'+fontPath
+            self.fontKeys[fontname] = fontKey
+        return self.fontKeys[fontname]
+
+    # metrics for a font size, measuring the text width if it isn't already known
+    def _getSizeMetrics(self, fontname, fontsize, text = None):
+        fontMetrics = self.fonts.setdefault(self._fontKey(fontname), {})
+        sizeMetrics = fontMetrics.get(str(fontsize))
+        if sizeMetrics is None or (text is not None and text not in sizeMetrics['widths']):
+            fontCandidate = self.fontLib.SysFont(fontname, fontsize)
+            if sizeMetrics is None:
+                sizeMetrics = {'linesize': fontCandidate.get_linesize(), 'widths': {}}
+                fontMetrics[str(fontsize)] = sizeMetrics
+            if text is not None:
+                sizeMetrics['widths'][text] = fontCandidate.size(text)[0]
+            del(fontCandidate)
+            self.dirty = True
+        return sizeMetrics
+
+    def getWidth(self, fontname, fontsize, text):
+        return self._getSizeMetrics(fontname, fontsize, text)['widths'][text]
+
+    def getLinesize(self, fontname, fontsize):
+        return self._getSizeMetrics(fontname, fontsize)['linesize']
+
+# Pre-rendered outlined glyphs for text that changes often but only uses a few characters, like the meter values
+# text is composed by blitting the cached glyphs instead of rendering and outlining the whole string each time
+# glyphs that aren't in the atlas yet are rendered the first time they are used
+class outlineGlyphAtlas(object):
+    defaultChars = "0123456789-+. "
+
+    def __init__(self, font, gfcolor, ocolor, opx, circlepoints, chars = defaultChars):
+        self.font = font
+        self.gfcolor = gfcolor
+        self.ocolor = ocolor
+        self.opx = opx
+        self.circlepoints = circlepoints
+        self.height = font.get_height() + 2 * opx
+        self.glyphs = {} # character to its advance, outline surface and fill surface
+        self.addChars(chars)
+
+    def addChars(self, chars):
+        for char in chars:
+            if char not in self.glyphs:
+                self._renderGlyph(char)
+
+    # the outline and the fill are kept separate so the outline of a glyph never covers the fill of its neighbour
+    def _renderGlyph(self, char):
+        fillsurface = self.font.render(char, True, self.gfcolor)
+        advance = fillsurface.get_width()
+        glyphsurface = self.font.render(char, True, self.ocolor)
+        outlinesurface = pygame.Surface((advance + 2 * self.opx, self.height), pygame.SRCALPHA)
+        outlinesurface.fill((0, 0, 0, 0))
+        for dx, dy in self.circlepoints:
+            outlinesurface.blit(glyphsurface, (dx + self.opx, dy + self.opx))
+        self.glyphs[char] = (advance, outlinesurface, fillsurface)
+        return self.glyphs[char]
+
+    def _getGlyph(self, char):
+        glyph = self.glyphs.get(char)
+        if glyph is None:
+            glyph = self._renderGlyph(char)
+        return glyph
+
+    # size of the text as outlineFontRender would draw it
+    def size(self, text):
+        return (sum(self._getGlyph(char)[0] for char in text) + 2 * self.opx, self.height)
+
+    # draw the text onto a surface with its top left corner at pos, all the outlines go down before any of the fills
+    def renderTo(self, surface, pos, text):
+        glyphs = [self._getGlyph(char) for char in text]
+        x = pos[0]
+        for advance, outlinesurface, fillsurface in glyphs:
+            surface.blit(outlinesurface, (x, pos[1]))
+            x += advance
+        x = pos[0] + self.opx
+        for advance, outlinesurface, fillsurface in glyphs:
+            surface.blit(fillsurface, (x, pos[1] + self.opx))
+            x += advance
+
 # container for the theme
 class Theme(object):
-    def __init__(self, displaySize, ftfont=False):
+    maxFontSize = 2048 # font size solvers treat anything bigger as not fitting
+    sysFontCacheSize = 32 # fonts kept loaded for the OSD modules and GUI states
+    glyphAtlasCacheSize = 8 # glyph atlases kept for the OSD meters
+    outlineTextCacheBytes = 8*1024*1024 # memory budget for rendered outlined text
+
+    def __init__(self, displaySize, ftfont=False, fontMetricsCachePath=None):
         self.colours = type('colours', (object,), {
             'transparent': (0,0,0,0),
             'transpBack': (0,0,0,51),
@@ -48,6 +187,12 @@ class Theme(object):
             self.fontLib = pygame.ftfont
         else:
             self.fontLib = pygame.font
+        self.ftfont = ftfont
+        self.fontMetrics = fontMetricsCache(self.fontLib, fontMetricsCachePath)
+        self._sysFontCache = collections.OrderedDict() # least recently used first
+        self._glyphAtlasCache = collections.OrderedDict() # least recently used first
+        self._outlineTextCache = collections.OrderedDict() # least recently used first
+        self._outlineTextCacheUsed = 0 # bytes of surfaces in the outlined text cache
         self.displayWidth = int(displaySize[0])
         self.displayHeight = int(displaySize[1])
         self.menuWidth = int(self.displayWidth/4)
@@ -57,40 +202,57 @@ class Theme(object):
         menuH1FontSize=self.fontSysSizeOptimize('BATC Ryde Project', self.menuWidth*0.85, 'freesans')
         inCharFontSize=self.fontSysSizeOptimize('Err', menuH1FontSize-(self.menuWidth*0.01), 'freesans')
         self.fonts = type('fonts', (object,), {
-            'menuH1': self.fontLib.SysFont('freesans', menuH1FontSize),
-            'playStateTitle' :  self.fontLib.SysFont('freesans', playStateTitleFontSize),
-            'inCharFont' :  self.fontLib.SysFont('freesans', inCharFontSize),
+            'menuH1': self.getSysFont('freesans', menuH1FontSize),
+            'playStateTitle' :  self.getSysFont('freesans', playStateTitleFontSize),
+            'inCharFont' :  self.getSysFont('freesans', inCharFontSize),
             })
         self.errCharSurface = pygame.transform.rotate(self.fonts.inCharFont.render("Err", True, self.colours.black), 90)
         self._circlecache = {}
         self.logofile = pkg_resources.resource_stream('rydeplayer.resources', 'logo_menu.png')
         self.muteicon = pkg_resources.resource_stream('rydeplayer.resources', 'icon_mute.png')
 
-    # calculate the largest font size that you can render the given test in as still be less than width
-    def fontSysSizeOptimize(self, text, width, fontname):
+    # shared system font instances, finding and loading a font file is slow so recently used ones are kept
+    # fonts are shared between users so their style must not be changed
+    def getSysFont(self, fontname, fontsize):
+        key = (fontname, fontsize, self.ftfont)
+        font = self._sysFontCache.get(key)
+        if font is None:
+            font = self.fontLib.SysFont(fontname, fontsize)
+            self._sysFontCache[key] = font
+            if len(self._sysFontCache) > self.sysFontCacheSize:
+                self._sysFontCache.popitem(last=False)
+        else:
+            self._sysFontCache.move_to_end(key)
+        return font
+
+    # largest font size for which fits returns True, -1 if none do, relies on the metrics growing with the font size
+    def _fontSizeSearch(self, fits):
         fontsize = -1
-        while True:
-            fontCandidate = self.fontLib.SysFont(fontname, fontsize+1)
-            fontwidth = fontCandidate.size(text)[0]
-            del(fontCandidate)
-            if(fontwidth > width):
-                break
-            else:
-                fontsize += 1
+        if fits(0):
+            # double the size until it doesn't fit then binary search between the last two sizes
+            low = 0
+            high = 1
+            while high <= self.maxFontSize and fits(high):
+                low = high
+                high *= 2
+            high = min(high, self.maxFontSize+1)
+            while high - low > 1:
+                mid = (low + high)//2
+                if fits(mid):
+                    low = mid
+                else:
+                    high = mid
+            fontsize = low
+        self.fontMetrics.save()
         return fontsize
 
+    # calculate the largest font size that you can render the given test in as still be less than width
+    def fontSysSizeOptimize(self, text, width, fontname):
+        return self._fontSizeSearch(lambda fontsize: self.fontMetrics.getWidth(fontname, fontsize, text) <= width)
+
     # calculate the largest font size that has a line height less than height
     def fontSysSizeOptimizeHeight(self, height, fontname):
-        fontsize = -1
-        while True:
-            fontCandidate = self.fontLib.SysFont(fontname, fontsize+1)
-            fontheight = fontCandidate.get_linesize()
-            del(fontCandidate)
-            if(fontheight > height):
-                break
-            else:
-                fontsize += 1
-        return fontsize
+        return self._fontSizeSearch(lambda fontsize: self.fontMetrics.getLinesize(fontname, fontsize) <= height)
 
     # size and position a pygame rectangle using screen size independent units and a datum corner
     def relativeRect(self, datum, xEdgeDistance, yEdgeDistance, width, height):
@@ -147,7 +309,24 @@ class Theme(object):
         return points
 
     # render font with different coloured outline
+    # recently rendered text is kept up to a memory budget, the surfaces are shared so they must not be modified
     def outlineFontRender(self, text, font, gfcolor, ocolor, opx=2):
+        key = (text, font, tuple(gfcolor), tuple(ocolor), opx)
+        surf = self._outlineTextCache.get(key)
+        if surf is None:
+            surf = self._outlineFontRenderUncached(text, font, gfcolor, ocolor, opx)
+            surfBytes = surf.get_width() * surf.get_height() * surf.get_bytesize()
+            if surfBytes <= self.outlineTextCacheBytes:
+                self._outlineTextCache[key] = surf
+                self._outlineTextCacheUsed += surfBytes
+                while self._outlineTextCacheUsed > self.outlineTextCacheBytes:
+                    oldKey, oldSurf = self._outlineTextCache.popitem(last=False)
+                    self._outlineTextCacheUsed -= oldSurf.get_width() * oldSurf.get_height() * oldSurf.get_bytesize()
+        else:
+            self._outlineTextCache.move_to_end(key)
+        return surf
+
+    def _outlineFontRenderUncached(self, text, font, gfcolor, ocolor, opx):
         textsurface = font.render(text, True, gfcolor)
         w = textsurface.get_width() + 2 * opx
         h = font.get_height()
@@ -165,6 +344,19 @@ class Theme(object):
         surf.blit(textsurface, (opx, opx))
         return surf
 
+    # glyph atlas for drawing often changing text in a shared system font with an outline
+    def getGlyphAtlas(self, fontname, fontsize, gfcolor, ocolor, opx=2):
+        key = (fontname, fontsize, self.ftfont, gfcolor, ocolor, opx)
+        atlas = self._glyphAtlasCache.get(key)
+        if atlas is None:
+            atlas = outlineGlyphAtlas(self.getSysFont(fontname, fontsize), gfcolor, ocolor, opx, self._circlepoints(opx))
+            self._glyphAtlasCache[key] = atlas
+            if len(self._glyphAtlasCache) > self.glyphAtlasCacheSize:
+                self._glyphAtlasCache.popitem(last=False)
+        else:
+            self._glyphAtlasCache.move_to_end(key)
+        return atlas
+
 
 
 # power menu UI state machine
@@ -203,7 +395,7 @@ class guiState(rydeplayer.states.gui.SuperStates):
             callback()
 
     # generate the menu states based on current config capabilites
-    def _genMenuStates(self, config, debugFunctions, toggleMuteFunc, adjVolFunc, superMenu):
+    def _genMenuStates(self, config, debugFunctions, toggleMuteFunc, adjVolFunc, recordFunc, superMenu):
         # get variables for current config
         tunerConfigVars = config.tuner.getVars()
         # generate config specific menu items
@@ -278,7 +470,20 @@ class guiState(rydeplayer.states.gui.SuperStates):
             mainMenuStates[firstkey].up = 'audio'
             lastkey = 'audio'
             mainMenuStates["audio-sel"].setParentLabel(mainMenuStates['audio'])
-        
+
+        # add record menu if any source can record
+        if config.recordingAvailable():
+            recordMenuStates = {
+                'recstart' : rydeplayer.states.gui.SubMenuItemFunction(self.theme, 'Start Recording', 'recstop', 'recstop', functools.partial(recordFunc,True)),
+                'recstop' : rydeplayer.states.gui.SubMenuItemFunction(self.theme, 'Stop Recording', 'recstart', 'recstart', functools.partial(recordFunc,False))
+            }
+            mainMenuStates['record-sel'] = rydeplayer.states.gui.SubMenuGeneric(self.theme, 'record', recordMenuStates, 'recstart')
+            mainMenuStates['record'] = rydeplayer.states.gui.MenuItem(self.theme, "Record", lastkey, firstkey, "record-sel")
+            mainMenuStates[lastkey].down = 'record'
+            mainMenuStates[firstkey].up = 'record'
+            lastkey = 'record'
+            mainMenuStates["record-sel"].setParentLabel(mainMenuStates['record'])
+
         # add debug menu if enabled in config
         if config.debug.enableMenu:
             # generate debug menu states
@@ -306,10 +511,10 @@ class guiState(rydeplayer.states.gui.SuperStates):
 
         return (mainMenuStates, firstkey, cleanupFunc)
 
-    def startup(self, config, debugFunctions, toggleMuteFunc, adjVolumeFunc):
+    def startup(self, config, debugFunctions, toggleMuteFunc, adjVolumeFunc, recordFunc):
         # top level state machine
         self.state_dict = {
-            'menu': rydeplayer.states.gui.Menu(self.theme, 'home', functools.partial(self._genMenuStates, config, debugFunctions, toggleMuteFunc, adjVolumeFunc)),
+            'menu': rydeplayer.states.gui.Menu(self.theme, 'home', functools.partial(self._genMenuStates, config, debugFunctions, toggleMuteFunc, adjVolumeFunc, recordFunc)),
             'home': Home(self.theme, self.osd)
         }
         self.state_name = "home"
@@ -392,12 +597,22 @@ class rydeConfig(object):
             'autoplay': True,
             'disableHardwareCodec': True,
             'useFTfont': False,
+            'tracePath': '/home/pi/rydetrace.json',
+            'fontCachePath': '/home/pi/.rydefontcache.json',
+            'fakeTuners': None,
             })
         self.configRev = 3
     #setter for default values
     def setAutoplay(self, newval):
         self.debug.autoplay = newval
 
+    # are any of the sources setup to record
+    def recordingAvailable(self):
+        for sourceConfig in self.sourceConfigs.values():
+            if getattr(sourceConfig, 'recordpath', None) is not None:
+                return True
+        return False
+
     # parse config dict
     def loadConfig(self, config):
         perfectConfig = True
@@ -589,6 +804,39 @@ class rydeConfig(object):
                         else:
                             print("Invalid debug font library config, skipping")
                             perfectConfig = False
+                    if 'tracePath' in config['debug']:
+                        if isinstance(config['debug']['tracePath'], str):
+                            self.debug.tracePath = config['debug']['tracePath']
+                        else:
+                            print("Invalid debug trace path config, skipping")
+                            perfectConfig = False
+                    if 'fontCachePath' in config['debug']:
+                        if isinstance(config['debug']['fontCachePath'], str) or config['debug']['fontCachePath'] is None:
+                            self.debug.fontCachePath = config['debug']['fontCachePath']
+                        else:
+                            print("Invalid debug font cache path config, skipping")
+                            perfectConfig = False
+                    if 'fakeTuners' in config['debug']:
+                        if config['debug']['fakeTuners'] is None:
+                            self.debug.fakeTuners = None
+                        elif isinstance(config['debug']['fakeTuners'], list):
+                            fakeTuners = []
+                            for tunerName in config['debug']['fakeTuners']:
+                                tunerType = None
+                                if isinstance(tunerName, str):
+                                    for configType in [rydeplayer.sources.common.ftdiConfigs, rydeplayer.sources.common.picoConfigs]:
+                                        for configOpt in configType:
+                                            if configOpt.canIdentify and configOpt.name == tunerName.upper():
+                                                tunerType = configOpt
+                                if tunerType is None:
+                                    print("Invalid debug fake tuner type, skipping")
+                                    perfectConfig = False
+                                else:
+                                    fakeTuners.append(tunerType)
+                            self.debug.fakeTuners = fakeTuners
+                        else:
+                            print("Invalid debug fake tuners config, skipping")
+                            perfectConfig = False
                 else:
                     print("Invalid debug config, skipping")
                     perfectConfig = False
@@ -652,7 +900,7 @@ class player(object):
 
         # setup ui core
         pygame.init()
-        self.theme = Theme(pydispmanx.getDisplaySize(), self.config.debug.useFTfont)
+        self.theme = Theme(pydispmanx.getDisplaySize(), self.config.debug.useFTfont, self.config.debug.fontCachePath)
         self.playbackState = rydeplayer.states.playback.StateDisplay(self.theme)
 
         print(self.config.tuner)
@@ -665,9 +913,23 @@ class player(object):
         self.volume = self.config.audio.volumeOnStartup
         self.volumeCallbacks = []
 
+        # parts of the state that need reconciling on the next updateState
+        self.audioDirty = True
+        self.lastVLCState = None
+
+        # persistent registry of fds for the main event loop
+        self.fdRegistry = rydeplayer.common.fdRegistry()
+
+        # stand in for the USB tuners when testing without hardware
+        if self.config.debug.fakeTuners is not None:
+            rydeplayer.sources.common.usbDevices.setOverride(self.config.debug.fakeTuners)
+
         # setup source 
-        self.sourceMan = rydeplayer.sources.common.sourceManagerThread(self.config.tuner, self.config.sourceConfigs)
+        self.sourceMan = rydeplayer.sources.common.sourceManagerThread(self.config.tuner, self.config.sourceConfigs, self.fdRegistry)
+        # start the trace before the source sees the new config
+        self.config.tuner.addCallbackFunction(self.traceRetune)
         self.config.tuner.addCallbackFunction(self.sourceMan.reconfig)
+        self.config.tuner.addCallbackFunction(self.updateStandbyPresets)
 
         # setup vlc
         self.recvVLCEvent, self.sendVLCEvent = socket.socketpair()
@@ -677,14 +939,14 @@ class player(object):
         # setup on screen display
         self.osd = rydeplayer.osd.display.Controller(self.theme, self.config.osd, self.sourceMan.getStatus(), self, self.config.tuner)
 
-        debugFunctions = {'Restart Source':self.sourceReset, 'Force VLC':self.vlcStop, 'Abort VLC': self.vlcAbort }
+        debugFunctions = {'Restart Source':self.sourceReset, 'Force VLC':self.vlcStop, 'Abort VLC': self.vlcAbort, 'Dump Tune Trace': self.dumpTuneTrace }
 
         # start ui
         self.app = guiState(self.theme, self.config.shutdownBehavior, self, self.osd)
-        self.app.startup(self.config, debugFunctions, self.toggleMute, self.adjustVolumeByStep)
+        self.app.startup(self.config, debugFunctions, self.toggleMute, self.adjustVolumeByStep, self.setRecording)
 
         # start network
-        self.netMan = rydeplayer.network.networkManager(self.config, self.stepSM, self.setMute, debugFunctions)
+        self.netMan = rydeplayer.network.networkManager(self.config, self.stepSM, self.setMute, self.setRecording, debugFunctions, self.sourceMan.getStatus, self.fdRegistry)
 
         # setup source watchdog
         self.watchdog = rydeplayer.watchdog.sourceWatchdog(self.config.sourceWatchdog, self.sourceReset)
@@ -697,8 +959,18 @@ class player(object):
         self.gpioMan = rydeplayer.gpio.gpioManager(self.stepSM, self.config.gpio, self.config.tuner)
         self.config.tuner.addCallbackFunction(self.gpioMan.setBandOutFromPreset)
 
+        # register fds that don't change for the life of the player
+        self.fdRegistry.registerAll(self.irMan.getFDs(), self.irMan.handleFD)
+        self.fdRegistry.registerAll(self.gpioMan.getFDs(), self.gpioMan.handleFD)
+        self.fdRegistry.registerAll(self.osd.getFDs(), self.osd.handleFD)
+        self.fdRegistry.registerAll(self.watchdog.getFDs(), self.watchdog.handleFD)
+        self.fdRegistry.registerAll(self.watchdogService.getFDs(), self.watchdogService.handleFD)
+        self.fdRegistry.register(self.recvVLCEvent, lambda fd: self.vlcStopOnEndMain())
+
         # start source
+        self.traceRetune(self.config.tuner)
         self.sourceMan.start()
+        self.updateStandbyPresets()
         print("Ready")
         self.monotonicState = 0;
 
@@ -706,14 +978,15 @@ class player(object):
         quit = False
         # main event loop
         while not quit:
-            # need to regen every loop, lm stdout handler changes on lm restart
-            fds = self.irMan.getFDs() + self.sourceMan.getFDs() + self.gpioMan.getFDs() + self.osd.getFDs() + self.netMan.getFDs() + self.watchdog.getFDs() + self.watchdogService.getFDs() + [self.recvVLCEvent]
-            r, w, x = select.select(fds, [], [])
-            for fd in r:
-                quit = self.handleEvent(fd)
-                self.updateState()
+            # push the OSD changes from startup or the last iteration to the screen in one go before waiting
+            self.osd.updateLayer()
+            # managers with changing fds keep the registry up to date themselves
+            for fd, handler in self.fdRegistry.select():
+                quit = handler(fd)
                 if quit:
                     break
+            # one reconciliation pass per wakeup however many fds were ready
+            self.updateState()
         self.shutdown(self.app.shutdownState)
 
     def getPlayerID(self):
@@ -728,7 +1001,7 @@ class player(object):
     def setMute(self,newMute):
         if self.mute != newMute:
             self.mute = newMute
-            self.vlcPlayer.audio_set_mute(newMute)
+            self.audioDirty = True
             for callback in self.muteCallbacks:
                 callback(newMute)
 
@@ -738,6 +1011,10 @@ class player(object):
     def toggleMute(self):
         self.setMute(not self.mute)
 
+    # recording happens in the source thread, the status reports when it is running
+    def setRecording(self, recording):
+        self.sourceMan.setRecording(recording)
+
     def addVolumeCallback(self, callback):
         self.volumeCallbacks.append(callback)
 
@@ -751,7 +1028,7 @@ class player(object):
             newVolume = 0
         if self.volume != newVolume:
             self.volume = newVolume
-            self.vlcPlayer.audio_set_volume(newVolume)
+            self.audioDirty = True
             for callback in self.volumeCallbacks:
                 callback(newVolume)
 
@@ -775,7 +1052,8 @@ class player(object):
         else:
             return ""
 
-    def switchPresetRelative(self, offset):
+    # find the preset offset from the current tune, None if there isn't one
+    def getPresetRelative(self, offset):
         presetkeys = list(self.config.presets.keys())
         if len(presetkeys) > 0:
             newindex = None
@@ -787,8 +1065,23 @@ class player(object):
                 elif offset < 0:
                     newindex = len(presetkeys)-1
             if newindex is not None:
-                self.config.tuner.setConfigToMatch(presetkeys[newindex])
-                self.osd.activate(3, rydeplayer.osd.display.TimerLength.USERTRIGGER)
+                return presetkeys[newindex]
+        return None
+
+    def switchPresetRelative(self, offset):
+        newPreset = self.getPresetRelative(offset)
+        if newPreset is not None:
+            self.config.tuner.setConfigToMatch(newPreset)
+            self.osd.activate(3, rydeplayer.osd.display.TimerLength.USERTRIGGER)
+
+    # let the source prepare the presets either side of the current one
+    def updateStandbyPresets(self, newConfig = None):
+        standbyPresets = []
+        for offset in [1, -1]:
+            preset = self.getPresetRelative(offset)
+            if preset is not None and preset != self.config.tuner and preset not in standbyPresets:
+                standbyPresets.append(preset)
+        self.sourceMan.setStandbyConfigs(standbyPresets)
 
     def shutdown(self, behaviour):
         self.vlcStop()
@@ -803,27 +1096,6 @@ class player(object):
         elif behaviour is rydeplayer.common.shutdownBehavior.SYSREST:
             os.system("sudo shutdown -r now")
 
-    def handleEvent(self, fd):
-        quit = False
-        # handle ready file descriptors
-        if(fd in self.irMan.getFDs()):
-            quit = self.irMan.handleFD(fd)
-        elif(fd in self.sourceMan.getFDs()):
-            self.sourceMan.handleFD(fd)
-        elif(fd in self.gpioMan.getFDs()):
-            quit = self.gpioMan.handleFD(fd)
-        elif(fd in self.osd.getFDs()):
-            quit = self.osd.handleFD(fd)
-        elif(fd in self.netMan.getFDs()):
-            quit = self.netMan.handleFD(fd)
-        elif(fd in self.watchdog.getFDs()):
-            self.watchdog.handleFD(fd)
-        elif(fd in self.watchdogService.getFDs()):
-            self.watchdogService.handleFD(fd)
-        elif(fd == self.recvVLCEvent):
-            self.vlcStopOnEndMain()
-        return quit
-
     def updateState(self):
         # update playback state
         state = self.sourceMan.getCoreState()
@@ -839,6 +1111,7 @@ class player(object):
                     if (not self.sourceMan.waitForMediaHangup()) or self.vlcMediaFD != self.sourceMan.getMediaFd():
                         self.vlcStop()
                     print("Param Restart")
+                    rydeplayer.tracing.tracer.mark('paramrestart', state.traceGeneration)
                 if self.vlcPlayer.get_state() not in [vlc.State.Playing, vlc.State.Opening] and self.config.debug.autoplay:
                     self.vlcPlay()
                     self.osd.activate(4, rydeplayer.osd.display.TimerLength.PROGRAMTRIGGER)
@@ -861,9 +1134,18 @@ class player(object):
             if self.config.debug.autoplay and not self.sourceMan.waitForMediaHangup():
                 self.vlcStop()
 #               print("parsed:"+str(vlcMedia.is_parsed()))
-        self.vlcPlayer.audio_set_mute(self.mute)
-        self.vlcPlayer.audio_set_volume(self.volume)
-        print(self.vlcPlayer.get_state())
+        vlcState = self.vlcPlayer.get_state()
+        if vlcState != self.lastVLCState:
+            # vlc recreates its audio output when playback changes so reapply the audio settings
+            self.lastVLCState = vlcState
+            self.audioDirty = True
+            print(vlcState)
+            if vlcState == vlc.State.Playing:
+                rydeplayer.tracing.tracer.mark('playing', self.vlcTraceGeneration)
+        if self.audioDirty:
+            self.audioDirty = False
+            self.vlcPlayer.audio_set_mute(self.mute)
+            self.vlcPlayer.audio_set_volume(self.volume)
 
     # Step the state machine with a navEvent
     def stepSM(self, code):
@@ -883,6 +1165,9 @@ class player(object):
             del(self.vlcMedia)
             self.vlcMedia = self.vlcInstance.media_new_fd(self.vlcMediaFD)
         self.vlcPlayer.set_media(self.vlcMedia)
+        # playback is for the tune the source is on, not necessarily the latest request
+        self.vlcTraceGeneration = self.sourceMan.getCoreState().traceGeneration
+        rydeplayer.tracing.tracer.mark('vlcplay', self.vlcTraceGeneration)
         self.vlcPlayer.play()
     def vlcStop(self):
         self.vlcPlayer.stop()
@@ -915,6 +1200,9 @@ class player(object):
         vlcEvents.event_attach(vlc.EventType.MediaPlayerEndReached, self.vlcStopOnEndEvent)
         self.vlcMediaFD = self.sourceMan.getMediaFd()
         self.vlcMedia = self.vlcInstance.media_new_fd(self.vlcMediaFD)
+        self.audioDirty = True
+        self.lastVLCState = None
+        self.vlcTraceGeneration = 0
 
     def vlcStopOnEndEvent(self, event):
         self.sendVLCEvent.send(b"\x00")
@@ -931,6 +1219,16 @@ class player(object):
         self.sourceMan.restart()
         self.vlcStop()
 
+    # time each tune from the request to video playing
+    def traceRetune(self, newConfig):
+        presetName = self.getPresetName(newConfig)
+        if presetName == "":
+            presetName = "Manual"
+        rydeplayer.tracing.tracer.start(newConfig.getBand().getSource().name, presetName)
+
+    def dumpTuneTrace(self):
+        rydeplayer.tracing.tracer.dumpFile(self.config.debug.tracePath)
+
 def run():
     parser = argparse.ArgumentParser()
     parser.add_argument(metavar="config filename", dest='conffile', help="YAML config file to try and load. Default: config.yaml", nargs='?', default='config.yaml')
@@ -17,9 +17,7 @@
 import enum, os, stat, subprocess, pty, select, copy, fcntl, collections, time, socket, queue, threading
 import rydeplayer.common
 import rydeplayer.sources.common
-import pyftdi.ftdi
-import pyftdi.usbtools
-import pyftdi.eeprom
+import rydeplayer.tracing
 
 class DVBTVersionEnum(enum.Enum):
     DVBT = enum.auto()
@@ -49,6 +47,13 @@ DVBTModulationEnum = genDVBTModulationEnum()
 
 # Container for tuner status data with change callbacks
 class tunerStatus(rydeplayer.sources.common.sourceStatus):
+    statusFields = rydeplayer.sources.common.sourceStatus.statusFields + ('ssi', 'sqi', 'snr', 'per', 'bw')
+    displayFields = {
+            **rydeplayer.sources.common.sourceStatus.displayFields,
+            'signalLevel':     frozenset(['snr']),
+            'signalReport':    frozenset(['sqi']),
+            'signalBandwidth': frozenset(['bw']),
+            }
     def __init__(self):
         super().__init__()
         self.ssi = None
@@ -277,7 +282,7 @@ class modPartialType(object):
         return other.asTuple() == self.asTuple()
 
 class combiTunerManager(object):
-    def __init__(self, config, sourceConfig):
+    def __init__(self, config, sourceConfig, fdRegistry):
         # path to the combituner binary
         self.ctpath = sourceConfig.binpath
         self.mediaFIFOfilename = sourceConfig.mediapath
@@ -287,24 +292,29 @@ class combiTunerManager(object):
             print("made")
         elif(not stat.S_ISFIFO(os.stat(self.mediaFIFOfilename).st_mode)):
             print("media pipe is not a fifo")
-        self.vlcMediaFd = os.open(self.mediaFIFOfilename, flags=os.O_NONBLOCK|os.O_RDONLY) # an open file descriptor to pass to vlc (or another player)
         rpipe, self.stdoutWritefd = pty.openpty() # a pty for interacting with combituners STDOUT, couldn't get pipes to work
         flags = fcntl.fcntl(rpipe, fcntl.F_GETFL)
         flags |= os.O_NONBLOCK
         fcntl.fcntl(rpipe, fcntl.F_SETFL, flags)
         self.stdoutReadfd = os.fdopen(rpipe, 'r')
         self.process = None
-        self.statelog = [] # log of important things from CombiTuners STDOUT
-        self.ctlog = [] # a complete CombiTuner output log, for debugging
+        self.statelog = rydeplayer.common.ringLog(200, 16*1024) # log of important things from CombiTuners STDOUT
+        self.ctlog = rydeplayer.common.ringLog(2000, 256*1024) # a complete CombiTuner output log, for debugging
         self.ctrunning = False
         self.ctlocked = False
         self.activeConfig = config.copyConfig()
         self.lastState = { 'locked':None, 'modcode': modPartialType() }
         self.changeRefState = copy.deepcopy(self.lastState)
         self.stateMonotonic = 0
+        self.traceGeneration = 0 # generation of the tune trace the current work is for
         self.tunerStatus = tunerStatus()
+        # the TS on its way from the media FIFO to the player, through the optional relay that filters, analyses and records it
+        self.mediaPath = rydeplayer.sources.common.tsMediaPath(self.mediaFIFOfilename, sourceConfig, self.tunerStatus, "CombiTuner")
         # state type for the core combituner state
-        self.coreStateType = collections.namedtuple('coreState', ['isRunning', 'isStarted', 'isLocked', 'monotonicState'])
+        self.coreStateType = collections.namedtuple('coreState', ['isRunning', 'isStarted', 'isLocked', 'monotonicState', 'traceGeneration'])
+        # registry to keep up to date when the stdout fd is reopened
+        self.fdRegistry = fdRegistry
+        self.fdRegistry.registerAll(self.getFDs(), self.handleFD)
 
     def reconfig(self, config):
         """reconfigures CombiTuner"""
@@ -312,26 +322,35 @@ class combiTunerManager(object):
             self.activeConfig = config.copyConfig()
             print(self.activeConfig)
             self.restart()
+    def setStandbyConfigs(self, configs):
+        """standby tuning isn't supported, there is only one tuner"""
+        pass
+    def setRecording(self, enabled):
+        """start or stop recording the TS to disk"""
+        self.mediaPath.setRecording(enabled)
     def waitForMediaHangup(self):
         return False
     def remedia(self):
-        os.close(self.vlcMediaFd)
-        self.vlcMediaFd = os.open(self.mediaFIFOfilename, flags=os.O_NONBLOCK, mode=os.O_RDONLY) # an open file descriptor to pass to vlc (or another player)
+        self.mediaPath.remedia()
     def getMediaFd(self):
-        return self.vlcMediaFd
+        return self.mediaPath.getMediaFd()
+    def getMediaRelay(self):
+        return self.mediaPath.getMediaRelay()
     def getFDs(self):
-        return [self.stdoutReadfd]
+        fds = [self.stdoutReadfd]
+        return fds + self.mediaPath.getFDs()
     def getStatus(self):
         return self.tunerStatus
     def handleFD(self, fd):
         """handles a file descriptor that has data to read"""
-        fdCallbacks = dict()
-        fdCallbacks[self.stdoutReadfd] = self.processStdout
-        if(fd in fdCallbacks):
-            fdCallbacks[fd]()
+        if fd is self.stdoutReadfd:
+            with self.tunerStatus.batch():
+                self.processStdout()
+        elif fd in self.mediaPath.getFDs():
+            self.mediaPath.handleFD(fd)
     def getCoreState(self):
         """gets the core system state in a single call"""
-        state = self.coreStateType(self.isRunning(), self.isStarted(), self.isLocked(), self.getMonotonicState())
+        state = self.coreStateType(self.isRunning(), self.isStarted(), self.isLocked(), self.getMonotonicState(), self.traceGeneration)
         return state
     def isStarted(self):
         if(self.process != None):
@@ -357,6 +376,8 @@ class combiTunerManager(object):
                 return False
         else:
             return False
+    def setTraceGeneration(self, generation):
+        self.traceGeneration = generation
     def getMonotonicState(self):
         return self.stateMonotonic
     
@@ -386,6 +407,7 @@ class combiTunerManager(object):
                         stop=True
                 elif newline.lstrip().startswith("locked"):
                     self.ctlocked = True
+                    rydeplayer.tracing.tracer.mark('locked', self.traceGeneration)
                 elif newline.lstrip().startswith("Unlocked"):
                     self.ctlocked = False
                     self.lastState['modcode']= modPartialType()
@@ -450,6 +472,7 @@ class combiTunerManager(object):
                                 reqlines.remove(line)
                         if len(reqlines)<1:
                             self.ctrunning = True
+                            rydeplayer.tracing.tracer.mark('started', self.traceGeneration)
                             print("ct started")
                 self.lastState['locked'] = self.ctlocked
                 if self.lastState != self.changeRefState : # if the signal parameters have changed
@@ -515,6 +538,7 @@ class combiTunerManager(object):
             newline = rawnewline.rstrip()
             self.ctlog.append(newline)
 
+        self.fdRegistry.unregisterAll(self.getFDs())
         self.stdoutReadfd.close()
         #open a clean buffer ready for the restart
 
@@ -523,10 +547,11 @@ class combiTunerManager(object):
         flags |= os.O_NONBLOCK
         fcntl.fcntl(rpipe, fcntl.F_SETFL, flags)
         self.stdoutReadfd = os.fdopen(rpipe, 'r')
+        self.fdRegistry.registerAll(self.getFDs(), self.handleFD)
         self.process = None
         #TODO: parse this and display a meaningful message on screen
         if dumpOutput:
-            for logline in self.ctlog:
+            for logline in self.ctlog.dump():
                 print(logline)
 
     def cleanup(self):
@@ -539,43 +564,33 @@ class combiTunerManager(object):
                 break
             newline = rawnewline.rstrip()
             self.ctlog.append(newline)
+        self.fdRegistry.unregisterAll(self.getFDs())
         self.stdoutReadfd.close()
-        os.close(self.vlcMediaFd)
-
-    def _fetchFtdiDevices(self):
-        pyftdi.usbtools.UsbTools.flush_cache()
-        foundDevices = pyftdi.ftdi.Ftdi.list_devices("ftdi://ftdi:2232h/1")
-        devices = {}
-        for deviceDesc in foundDevices:
-            device = pyftdi.usbtools.UsbTools.get_device(deviceDesc[0])
-            eeprom = pyftdi.eeprom.FtdiEeprom()
-            eeprom.open(device)
-            signature = []
-            for prop in sorted(list(eeprom.properties)+['product']):
-                signature.append((prop,getattr(eeprom, prop)))
-            devices[deviceDesc]=frozenset(signature)
-            eeprom.close()
-            device.reset()
-            pyftdi.usbtools.UsbTools.release_device(device)
-        return devices
+        self.mediaPath.close()
+
+    def _findTuner(self):
+        devices = rydeplayer.sources.common.usbDevices.getFtdiDevices()
+        validTuners = [rydeplayer.sources.common.ftdiConfigs.COMBITUNER.configSet]
+        for device in devices:
+            if devices[device] in validTuners:
+                return device
+        return None
 
     def start(self):
         if self.activeConfig.isValid():
             if self.process == None :
-                devices = self._fetchFtdiDevices()
-                validTuners = [rydeplayer.sources.common.ftdiConfigs.COMBITUNER.configSet]
-                foundDevice = None
-                for device in devices:
-                    if devices[device] in validTuners:
-                        foundDevice = device
-                        break
+                foundDevice = self._findTuner()
+                if foundDevice is None:
+                    # the cache may be out of date, try again with a full scan
+                    rydeplayer.sources.common.usbDevices.invalidate()
+                    foundDevice = self._findTuner()
                 if foundDevice is not None:
                     print("start")
                     self.ctrunning = False
                     self.ctlocked = False
 #                    self.autoresetdetect = False
-                    self.statelog=[]
-                    self.ctlog=[]
+                    self.statelog.clear()
+                    self.ctlog.clear()
                     freqstr = str(self.activeConfig.band.mapReqToTune(self.activeConfig.freq.getValue()))
                     bwstr = str(self.activeConfig.bw.getValue())
                     args = [self.ctpath, '-m', 'dvbt', '-f', freqstr, '-b', bwstr, '-n', self.mediaFIFOfilename]
@@ -583,6 +598,7 @@ class combiTunerManager(object):
 
                     print(args)
                     self.process = subprocess.Popen(args, stdout=self.stdoutWritefd, stderr=subprocess.STDOUT, bufsize=0)
+                    rydeplayer.tracing.tracer.mark('spawn', self.traceGeneration)
 #                    self.tunerStatus.onChangeFire()
                 else:
                     print("No CombiTuner USB module found")
@@ -596,13 +612,15 @@ class combiTunerManager(object):
             self.stop()
         self.start()
 
-class config(object):
-    def __init__(self, binpath = '/home/pi/combituner/CombiTunerExpress', mediapath = '/home/pi/ctmedia'):
+class config(rydeplayer.sources.common.tsMediaConfig):
+    def __init__(self, binpath = '/home/pi/combituner/CombiTunerExpress', mediapath = '/home/pi/ctmedia', pidfilter = False, tsanalysis = False, recordpath = None, recordsegmentsize = 1073741824):
+        super().__init__("CombiTuner", pidfilter, tsanalysis, recordpath, recordsegmentsize)
         self.binpath = binpath
         self.mediapath = mediapath
 
     def loadConfig(self, config):
-        perfectConfig = True
+        # the relay settings and the check that it is a dict are shared with the other tuners
+        perfectConfig = super().loadConfig(config)
         if isinstance(config, dict):
             if 'binpath' in config:
                 if isinstance(config['binpath'], str):
@@ -617,9 +635,6 @@ class config(object):
                 else:
                     print("Invalid CombiTuner media FIFO path")
                     perfectConfig = False
-        else:
-            print("Invalid CombiTuner config")
-            perfectConfig = False
         return perfectConfig
 
 class band(rydeplayer.sources.common.tunerBandRF):
@@ -14,8 +14,9 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-import enum, os, stat, subprocess, pty, select, copy, fcntl, collections, time, socket, queue, threading
+import enum, os, stat, subprocess, pty, copy, fcntl, collections, time, socket, queue, threading, contextlib, select, array
 import rydeplayer.common
+import rydeplayer.tracing
 import pyftdi.ftdi
 import pyftdi.usbtools
 import pyftdi.eeprom
@@ -194,9 +195,144 @@ class ftdiConfigs(enum.Enum):
     def canIdentify(self):
         return self._canIdentify
 
+# Cache of the USB tuners and their signatures so a retune doesn't have to open every device
+# the devices are only enumerated again when the USB device list in sysfs changes
+class usbDeviceRegistry(object):
+    sysfsPath = '/sys/bus/usb/devices'
+    # stands in for a real device when discovery is overridden, the tuner binaries only need its bus and address
+    fakeDeviceType = collections.namedtuple('fakeUsbDevice', ['bus', 'address'])
+    fakeBus = 255
+
+    def __init__(self):
+        self.enumerationStamp = None
+        self.ftdiDevices = None
+        self.picoDevices = None
+        # signatures keyed by bus, address and ids so a device that has been replugged is read again
+        self.ftdiSignatures = {}
+        self.picoSignatures = {}
+        # fake ftdi and pico devices reported instead of the real ones, None to use real discovery
+        self.overrideDevices = None
+
+    # report fake devices for a list of ftdiConfigs and picoConfigs tuner types instead of the real USB devices
+    # for running against stand-in tuner binaries without any hardware, None goes back to real discovery
+    def setOverride(self, tunerTypes):
+        if tunerTypes is None:
+            self.overrideDevices = None
+        else:
+            ftdiDevices = {}
+            picoDevices = {}
+            for address, tunerType in enumerate(tunerTypes, start=1):
+                device = self.fakeDeviceType(self.fakeBus, address)
+                if isinstance(tunerType, picoConfigs):
+                    picoDevices[device] = tunerType.configSet
+                else:
+                    ftdiDevices[device] = tunerType.configSet
+            self.overrideDevices = (ftdiDevices, picoDevices)
+        self.invalidate()
+
+    # changes when a device is added or removed, None if it can't be checked and the devices should always be enumerated
+    def _getEnumerationStamp(self):
+        try:
+            return (os.stat(self.sysfsPath).st_mtime_ns, frozenset(os.listdir(self.sysfsPath)))
+        except OSError:
+            return None
+
+    def _revalidate(self):
+        stamp = self._getEnumerationStamp()
+        if stamp is None or stamp != self.enumerationStamp:
+            self.enumerationStamp = stamp
+            self.ftdiDevices = None
+            self.picoDevices = None
+
+    # force the next lookup to enumerate the devices, for when a cached device didn't work
+    def invalidate(self):
+        self.enumerationStamp = None
+        self.ftdiDevices = None
+        self.picoDevices = None
+
+    # FT2232H devices and their EEPROM signatures, keyed by pyftdi device descriptor
+    def getFtdiDevices(self):
+        if self.overrideDevices is not None:
+            return self.overrideDevices[0]
+        self._revalidate()
+        if self.ftdiDevices is None:
+            self.ftdiDevices = self._fetchFtdiDevices()
+        return self.ftdiDevices
+
+    # all USB devices and their signatures, keyed by pyusb device
+    def getPicoDevices(self):
+        if self.overrideDevices is not None:
+            return self.overrideDevices[1]
+        self._revalidate()
+        if self.picoDevices is None:
+            self.picoDevices = self._fetchPicoDevices()
+        return self.picoDevices
+
+    def _fetchFtdiDevices(self):
+        pyftdi.usbtools.UsbTools.flush_cache()
+        foundDevices = pyftdi.ftdi.Ftdi.list_devices("ftdi://ftdi:2232h/1")
+        devices = {}
+        signatures = {}
+        for deviceDesc in foundDevices:
+            key = (deviceDesc[0].bus, deviceDesc[0].address, deviceDesc[0].vid, deviceDesc[0].pid, deviceDesc[0].sn)
+            if key in self.ftdiSignatures:
+                signatures[key] = self.ftdiSignatures[key]
+            else:
+                # reading the EEPROM needs the device opened and reset afterwards, only do it for new devices
+                device = pyftdi.usbtools.UsbTools.get_device(deviceDesc[0])
+                eeprom = pyftdi.eeprom.FtdiEeprom()
+                eeprom.open(device)
+                signature = []
+                for prop in sorted(list(eeprom.properties)+['product']):
+                    signature.append((prop,getattr(eeprom, prop)))
+                signatures[key] = frozenset(signature)
+                eeprom.close()
+                device.reset()
+                pyftdi.usbtools.UsbTools.release_device(device)
+            devices[deviceDesc[0]] = signatures[key]
+        self.ftdiSignatures = signatures
+        return devices
+
+    def _fetchPicoDevices(self):
+        foundDevices = list(usb.core.find(find_all=1))
+        devices = {}
+        signatures = {}
+        for device in foundDevices:
+            key = (device.bus, device.address, device.idVendor, device.idProduct)
+            if key in self.picoSignatures:
+                signatures[key] = self.picoSignatures[key]
+            else:
+                signature = []
+                for prop in sorted(list(picoConfigs.getKeys())):
+                    try:
+                        attr=getattr(device, prop)
+                    except ValueError:
+                        attr=None
+                    signature.append((prop,attr))
+                signatures[key] = frozenset(signature)
+            devices[device] = signatures[key]
+        self.picoSignatures = signatures
+        return devices
+
+# shared by all the USB tuner sources
+usbDevices = usbDeviceRegistry()
+
 class sourceStatus(object):
     numericConfig = collections.namedtuple('numericConfig', ["staticUnits", "unitMagnitude", "processValueFunc"])
     meterConfig = collections.namedtuple('meterConfig', ["staticText", "prefixText", "processValueFunc"])
+    # fields that are transferred between status objects, subclasses add their own
+    statusFields = ('modulation', 'dvbVersion', 'pids', 'provider', 'service', 'freq', 'tsHealth', 'recording')
+    # fields each type of display depends on, display callbacks only fire when one of these changes
+    displayFields = {
+            'powerLevel':      frozenset(),
+            'signalLevel':     frozenset(),
+            'signalReport':    frozenset(),
+            'signalSource':    frozenset(['freq']),
+            'signalBandwidth': frozenset(),
+            'program':         frozenset(['modulation', 'dvbVersion', 'pids', 'provider', 'service']),
+            'tsHealth':        frozenset(['tsHealth']),
+            'recording':       frozenset(['recording']),
+            }
     def __init__(self):
         self.onChangeCallbacks = []
         self.modulation = None
@@ -205,21 +341,44 @@ class sourceStatus(object):
         self.dvbVersion = None
         self.pids = {}
         self.freq = None
+        self.tsHealth = None
+        self.recording = False
+        self.batchDepth = 0
+        self.batchChanged = False
 
-    def addOnChangeCallback(self, callback):
-        self.onChangeCallbacks.append(callback)
+    # display is an optional key of displayFields, the callback is then only fired for changes relevant to it
+    def addOnChangeCallback(self, callback, display = None):
+        self.onChangeCallbacks.append((callback, display))
 
     def removeOnChangeCallback(self, callback):
-        self.onChangeCallbacks.remove(callback)
+        self.onChangeCallbacks = [registered for registered in self.onChangeCallbacks if registered[0] != callback]
 
     def addCallbacksFrom(self, fromconfig):
         fromCallbacks = fromconfig.onChangeCallbacks
         toCallbacks = fromCallbacks.copy()
         self.onChangeCallbacks.extend(toCallbacks)
 
-    def onChangeFire(self):
-        for callback in self.onChangeCallbacks:
-            callback(self)
+    # fire the change callbacks, if the changed fields are known only the interested displays are updated
+    def onChangeFire(self, changedFields = None):
+        if self.batchDepth > 0:
+            # notify once at the end of the batch instead
+            self.batchChanged = True
+            return
+        for callback, display in self.onChangeCallbacks:
+            if changedFields is None or display is None or not self.displayFields[display].isdisjoint(changedFields):
+                callback(self)
+
+    # group a set of updates so callbacks only see a single change at the end, batches can be nested
+    @contextlib.contextmanager
+    def batch(self):
+        self.batchDepth += 1
+        try:
+            yield self
+        finally:
+            self.batchDepth -= 1
+            if self.batchDepth == 0 and self.batchChanged:
+                self.batchChanged = False
+                self.onChangeFire()
 
     def setProvider(self, newval):
         if(isinstance(newval, str)):
@@ -254,6 +413,34 @@ class sourceStatus(object):
         else:
             return False
 
+    def setTSHealth(self, newval):
+        if newval is None or isinstance(newval, tsHealthType):
+            if self.tsHealth != newval:
+                self.tsHealth = newval
+                self.onChangeFire()
+                return True
+            else:
+                return False
+        else:
+            return False
+
+    def getTSHealth(self):
+        return self.tsHealth
+
+    def setRecording(self, newval):
+        if(isinstance(newval, bool)):
+            if self.recording != newval:
+                self.recording = newval
+                self.onChangeFire()
+                return True
+            else:
+                return False
+        else:
+            return False
+
+    def getRecording(self):
+        return self.recording
+
     def getDVBVersion(self):
         return self.dvbVersion
 
@@ -286,9 +473,40 @@ class sourceStatus(object):
     def getSignalBandwidthMeta(self):
         return None
 
+    # media buffer levels and drops, only sources that buffer the media have them
+    def getMediaBuffer(self):
+        return None
+
+    # counts of the packets a source handled itself rather than passing to the player, by kind
+    def getUnforwardedPackets(self):
+        return None
+
     def getModulation(self):
         return self.modulation
 
+    # get the fields that have changed since the snapshot was taken, the snapshot is updated to match
+    def getDelta(self, snapshot):
+        delta = {}
+        for field in self.statusFields:
+            value = getattr(self, field)
+            if field not in snapshot or snapshot[field] != value:
+                if isinstance(value, dict):
+                    value = value.copy()
+                snapshot[field] = value
+                delta[field] = value
+        return delta
+
+    # apply a delta from getDelta and notify only the callbacks that care about the changed fields
+    def applyDelta(self, delta):
+        changedFields = set()
+        for field, value in delta.items():
+            if getattr(self, field) != value:
+                setattr(self, field, value)
+                changedFields.add(field)
+        if len(changedFields) > 0:
+            self.onChangeFire(changedFields)
+        return changedFields
+
     def copyStatus(self):
         newstatus = self.__class__()
         newstatus.setStatusToMatch(self)
@@ -322,6 +540,14 @@ class sourceStatus(object):
         if self.freq != newFreq:
             self.freq = newFreq
             changed = True
+        newTSHealth = fromStatus.getTSHealth()
+        if self.tsHealth != newTSHealth:
+            self.tsHealth = newTSHealth
+            changed = True
+        newRecording = fromStatus.getRecording()
+        if self.recording != newRecording:
+            self.recording = newRecording
+            changed = True
         return changed
 
 class tunerBand(object):
@@ -1080,24 +1306,573 @@ class tunerConfig(rydeplayer.common.validTracker):
         #TODO: display band info
         return output
 
+# Transport stream health counters, fed packet by packet from the TS relay thread
+class tsAnalyser(object):
+    reportInterval = 1 # seconds between health reports
+    pcrClock = 27000000
+    pcrWrap = (1<<33)*300
+    pcrMaxGap = pcrClock//10 # PCRs should be no more than 100ms apart
+
+    # notifyFd is written to when a new report is available from getReport
+    def __init__(self, notifyFd):
+        self.notifyFd = notifyFd
+        self.lastCC = array.array('b', [-1])*8192
+        self.intervalPackets = array.array('L', [0])*8192
+        self.packetIndex = 0
+        self.lastPCR = {}
+        self.pcrRate = None # TS bitrate estimated from the PCRs
+        self.pcrJitterMax = 0
+        # error totals since the analyser started
+        self.ccErrors = 0
+        self.teiErrors = 0
+        self.pcrErrors = 0
+        self.intervalStart = time.monotonic()
+        self.report = None
+
+    def getReport(self):
+        return self.report
+
+    def processPacket(self, buf, offset, pid):
+        self.packetIndex += 1
+        self.intervalPackets[pid] += 1
+        if buf[offset+1] & 0x80:
+            # the demodulator couldn't correct this packet, the rest of the header can't be trusted
+            self.teiErrors += 1
+            return
+        if pid == 0x1FFF:
+            return
+        flags = buf[offset+3]
+        discontinuity = False
+        if flags & 0x20 and buf[offset+4] > 0: # adaptation field
+            adaptationFlags = buf[offset+5]
+            discontinuity = adaptationFlags & 0x80
+            if adaptationFlags & 0x10 and buf[offset+4] >= 7:
+                pcrBase = (buf[offset+6] << 25) | (buf[offset+7] << 17) | (buf[offset+8] << 9) | (buf[offset+9] << 1) | (buf[offset+10] >> 7)
+                self._processPCR(pid, pcrBase*300 + (((buf[offset+10] & 0x01) << 8) | buf[offset+11]), discontinuity)
+        if flags & 0x10: # the counter only increments on packets with a payload
+            cc = flags & 0x0f
+            lastCC = self.lastCC[pid]
+            # a single duplicate packet is allowed
+            if lastCC >= 0 and not discontinuity and cc != ((lastCC + 1) & 0x0f) and cc != lastCC:
+                self.ccErrors += 1
+            self.lastCC[pid] = cc
+
+    # compare the PCR with where it should be given the TS bitrate, the error is the PCR jitter
+    def _processPCR(self, pid, pcr, discontinuity):
+        lastPCR = self.lastPCR.get(pid)
+        self.lastPCR[pid] = (pcr, self.packetIndex)
+        if lastPCR is None or discontinuity:
+            return
+        pcrDelta = (pcr - lastPCR[0]) % self.pcrWrap
+        if pcrDelta == 0 or pcrDelta > self.pcrMaxGap:
+            self.pcrErrors += 1
+            return
+        bits = (self.packetIndex - lastPCR[1])*188*8
+        rate = bits*self.pcrClock/pcrDelta
+        if self.pcrRate is None:
+            self.pcrRate = rate
+        else:
+            jitter = abs(pcrDelta - bits*self.pcrClock/self.pcrRate)
+            if jitter > self.pcrJitterMax:
+                self.pcrJitterMax = jitter
+            self.pcrRate += (rate - self.pcrRate)/16
+
+    # called after each read, publishes a report if the interval is over
+    def endBuffer(self, syncLosses):
+        now = time.monotonic()
+        elapsed = now - self.intervalStart
+        if elapsed < self.reportInterval:
+            return
+        pidBitrates = {}
+        for pid, packets in enumerate(self.intervalPackets):
+            if packets > 0:
+                pidBitrates[pid] = int(packets*188*8/elapsed)
+        self.report = tsHealthType(self.ccErrors, self.teiErrors, syncLosses, self.pcrErrors,
+                self.pcrJitterMax*1000000/self.pcrClock, sum(pidBitrates.values()), pidBitrates)
+        self.intervalPackets = array.array('L', [0])*8192
+        self.pcrJitterMax = 0
+        self.intervalStart = now
+        try:
+            os.write(self.notifyFd, b"\x00")
+        except BlockingIOError:
+            pass # there is already an unread notification
+
+# error totals, the worst PCR jitter in the last interval in us and the bitrates over the last interval in bits/s
+tsHealthType = collections.namedtuple('tsHealth', ['ccErrors', 'teiErrors', 'syncErrors', 'pcrErrors', 'pcrJitter', 'bitrate', 'pidBitrates'])
+
+# Records the TS to a series of files from its own thread so slow storage never holds up playback
+class tsRecorder(object):
+    writeBufferSize = 1024*1024
+    maxQueuedBytes = 16*1024*1024 # data is dropped rather than queued past this
+
+    # failNotifyFd is written to if the recording stops because of a write error
+    def __init__(self, path, segmentSize, failNotifyFd = None):
+        self.path = path
+        self.segmentSize = segmentSize
+        self.failNotifyFd = failNotifyFd
+        self.namePrefix = time.strftime("ryde-%Y%m%d-%H%M%S")
+        self.queue = collections.deque()
+        self.queuedBytes = 0
+        self.droppedBytes = 0
+        self.writtenBytes = 0
+        self.segmentCount = 0
+        self.failed = False
+        self.running = True
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._threadLoop, daemon=True)
+        self.thread.start()
+
+    # add some data to the recording, never blocks
+    def put(self, data):
+        with self.condition:
+            if self.queuedBytes + len(data) > self.maxQueuedBytes or self.failed:
+                self.droppedBytes += len(data)
+                return
+            self.queue.append(data)
+            self.queuedBytes += len(data)
+            self.condition.notify()
+
+    def isFailed(self):
+        return self.failed
+
+    def getStats(self):
+        return {'written': self.writtenBytes, 'dropped': self.droppedBytes, 'segments': self.segmentCount}
+
+    # stop recording, anything already queued is written first
+    def close(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join()
+
+    def _openSegment(self):
+        self.segmentCount += 1
+        filename = os.path.join(self.path, self.namePrefix+"-{:03d}.ts".format(self.segmentCount))
+        return open(filename, 'wb', buffering=self.writeBufferSize)
+
+    def _threadLoop(self):
+        segmentFile = None
+        segmentBytes = 0
+        try:
+            while True:
+                with self.condition:
+                    while self.running and len(self.queue) < 1:
+                        self.condition.wait()
+                    if len(self.queue) < 1:
+                        break
+                    chunks = list(self.queue)
+                    self.queue.clear()
+                    self.queuedBytes = 0
+                for chunk in chunks:
+                    if segmentFile is None or segmentBytes >= self.segmentSize:
+                        if segmentFile is not None:
+                            segmentFile.close()
+                        segmentFile = self._openSegment()
+                        segmentBytes = 0
+                    segmentFile.write(chunk)
+                    segmentBytes += len(chunk)
+                    self.writtenBytes += len(chunk)
+        except OSError as e:
+            print("Recording failed: "+str(e))
+            self.failed = True
+            if self.failNotifyFd is not None:
+                try:
+                    os.write(self.failNotifyFd, b"\x00")
+                except BlockingIOError:
+                    pass # there is already an unread notification
+        finally:
+            if segmentFile is not None:
+                segmentFile.close()
+
+# Relays a transport stream from a source to a pipe for the player
+# if a PID source is provided only the PAT, SDT, PMTs, PCR and the elementary streams of the program being shown are passed on
+class tsRelay(object):
+    packetSize = 188
+    syncByte = 0x47
+    alwaysPIDs = frozenset([0x00, 0x11]) # PAT and SDT
+
+    # pidSource returns the current elementary stream PIDs as a dict keyed by PID, the stream is passed unfiltered until it has some
+    # healthNotifyFd enables the TS analyser, it is written to when a new health report is available
+    def __init__(self, inFd, pidSource = None, healthNotifyFd = None):
+        self.inFd = inFd
+        self.pidSource = pidSource
+        self.recorder = None
+        if healthNotifyFd is None:
+            self.analyser = None
+        else:
+            self.analyser = tsAnalyser(healthNotifyFd)
+        self.outReadFd, self.outWriteFd = os.pipe()
+        fcntl.fcntl(self.outWriteFd, fcntl.F_SETFL, os.O_NONBLOCK)
+        self.pmtPIDs = frozenset()
+        self.pmtPCRPIDs = {} # PMT PID to the PCR PID it lists
+        self.pcrPIDs = frozenset()
+        self.lastPIDs = None
+        self.allowedPIDs = None
+        # statistics
+        self.pidCounts = collections.Counter()
+        self.droppedPackets = 0
+        self.syncLosses = 0
+        self.running = True
+        self.thread = threading.Thread(target=self._threadLoop, daemon=True)
+        self.thread.start()
+
+    def getOutputFd(self):
+        return self.outReadFd
+
+    def getPIDCounts(self):
+        return dict(self.pidCounts)
+
+    def getStats(self):
+        return {'pids': self.getPIDCounts(), 'dropped': self.droppedPackets, 'syncLosses': self.syncLosses}
+
+    # the unfiltered TS is passed to the recorder when one is set
+    def setRecorder(self, recorder):
+        self.recorder = recorder
+
+    def getTSHealth(self):
+        if self.analyser is None:
+            return None
+        return self.analyser.getReport()
+
+    # stop relaying, the reader sees the end of the stream but the output fd stays valid until close
+    def stop(self):
+        if self.outWriteFd is not None:
+            self.running = False
+            self.thread.join()
+            os.close(self.outWriteFd)
+            self.outWriteFd = None
+
+    def close(self):
+        self.stop()
+        os.close(self.outReadFd)
+
+    def _updateAllowedPIDs(self):
+        if self.pidSource is None:
+            return
+        esPIDs = frozenset(pid for pid in self.pidSource() if isinstance(pid, int))
+        if len(esPIDs) < 1:
+            self.allowedPIDs = None
+        else:
+            self.allowedPIDs = self.alwaysPIDs | self.pmtPIDs | self.pcrPIDs | esPIDs
+
+    # offset of the PSI section in a packet starting a section, None if there isn't one
+    def _sectionStart(self, buf, offset):
+        payload = offset + 4
+        if buf[offset+3] & 0x20: # adaptation field
+            payload += 1 + buf[offset+4]
+        if payload >= offset + self.packetSize:
+            return None
+        section = payload + 1 + buf[payload] # skip the pointer field
+        if section + 12 > offset + self.packetSize:
+            return None
+        return section
+
+    def _parsePAT(self, buf, offset):
+        section = self._sectionStart(buf, offset)
+        if section is None or buf[section] != 0x00:
+            return
+        sectionEnd = min(section + 3 + (((buf[section+1] & 0x0f) << 8) | buf[section+2]) - 4, offset + self.packetSize - 4) # without the CRC
+        pmtPIDs = set()
+        for program in range(section + 8, sectionEnd - 3, 4):
+            programNumber = (buf[program] << 8) | buf[program+1]
+            if programNumber != 0: # 0 is the NIT
+                pmtPIDs.add(((buf[program+2] & 0x1f) << 8) | buf[program+3])
+        pmtPIDs = frozenset(pmtPIDs)
+        if pmtPIDs != self.pmtPIDs:
+            # the PCR PIDs of the old programs are no longer needed
+            self.pmtPIDs = pmtPIDs
+            self.pmtPCRPIDs = {pmtPID: pcrPID for pmtPID, pcrPID in self.pmtPCRPIDs.items() if pmtPID in pmtPIDs}
+            self.pcrPIDs = frozenset(self.pmtPCRPIDs.values())
+            self._updateAllowedPIDs()
+
+    def _parsePMT(self, buf, offset, pid):
+        section = self._sectionStart(buf, offset)
+        if section is None or buf[section] != 0x02:
+            return
+        pcrPID = ((buf[section+8] & 0x1f) << 8) | buf[section+9]
+        if self.pmtPCRPIDs.get(pid) != pcrPID:
+            self.pmtPCRPIDs[pid] = pcrPID
+            self.pcrPIDs = frozenset(self.pmtPCRPIDs.values())
+            self._updateAllowedPIDs()
+
+    # filter the complete packets in the buffer, returns the runs of packets to pass on as views of the buffer and how many bytes were used
+    # the buffer holds 256 packets so there are never more runs than writev accepts
+    def _filter(self, buf, view, end):
+        runs = []
+        offset = 0
+        runStart = 0 # start of the current run of packets being passed on
+        packetSize = self.packetSize
+        pidCounts = self.pidCounts
+        analyser = self.analyser
+        while offset + packetSize <= end:
+            if buf[offset] != self.syncByte:
+                # lost sync, skip ahead to the next sync byte
+                self.syncLosses += 1
+                if offset > runStart:
+                    runs.append(view[runStart:offset])
+                nextSync = buf.find(self.syncByte, offset+1, end)
+                if nextSync < 0:
+                    offset = end
+                else:
+                    offset = nextSync
+                runStart = offset
+                continue
+            pid = ((buf[offset+1] & 0x1f) << 8) | buf[offset+2]
+            pidCounts[pid] += 1
+            if analyser is not None:
+                analyser.processPacket(buf, offset, pid)
+            if buf[offset+1] & 0x40: # payload unit start
+                if pid == 0x00:
+                    self._parsePAT(buf, offset)
+                elif pid in self.pmtPIDs:
+                    self._parsePMT(buf, offset, pid)
+            if self.allowedPIDs is not None and pid not in self.allowedPIDs:
+                self.droppedPackets += 1
+                if offset > runStart:
+                    runs.append(view[runStart:offset])
+                runStart = offset + packetSize
+            offset += packetSize
+        if offset > runStart:
+            runs.append(view[runStart:offset])
+        return runs, offset
+
+    # write the runs to the output pipe, a single run is written directly and several are gathered with writev so nothing is copied
+    def _write(self, runs, poller):
+        first = 0 # index of the first run with data left to write
+        written = 0 # bytes of the first run already written
+        while first < len(runs) and self.running:
+            try:
+                if len(runs) - first == 1:
+                    written += os.write(self.outWriteFd, runs[first][written:])
+                elif written > 0:
+                    written += os.writev(self.outWriteFd, [runs[first][written:]] + runs[first+1:])
+                else:
+                    written = os.writev(self.outWriteFd, runs[first:])
+            except BlockingIOError:
+                poller.poll(100)
+                continue
+            # step through the runs that have now been fully written
+            while first < len(runs) and written >= len(runs[first]):
+                written -= len(runs[first])
+                first += 1
+
+    def _threadLoop(self):
+        inPoller = select.poll()
+        inPoller.register(self.inFd, select.POLLIN)
+        outPoller = select.poll()
+        outPoller.register(self.outWriteFd, select.POLLOUT)
+        buf = bytearray(self.packetSize*256)
+        view = memoryview(buf)
+        pending = 0 # bytes of a partial packet at the start of the buffer
+        while self.running:
+            if len(inPoller.poll(100)) < 1:
+                continue
+            try:
+                count = os.readv(self.inFd, [view[pending:]])
+            except BlockingIOError:
+                continue
+            except OSError as e:
+                print("TS relay read failed: "+str(e))
+                break
+            if count == 0:
+                # the source isn't writing to the FIFO at the moment
+                time.sleep(0.1)
+                continue
+            if self.pidSource is not None:
+                pids = self.pidSource()
+                if pids is not self.lastPIDs:
+                    self.lastPIDs = pids
+                    self._updateAllowedPIDs()
+            end = pending + count
+            recorder = self.recorder
+            if recorder is not None:
+                recorder.put(bytes(view[pending:end]))
+            runs, used = self._filter(buf, view, end)
+            # the runs are views of the buffer so are written before the partial packet is moved to the start
+            self._write(runs, outPoller)
+            pending = end - used
+            if pending > 0:
+                view[:pending] = view[used:end]
+            if self.analyser is not None:
+                self.analyser.endBuffer(self.syncLosses)
+        view.release()
+
+# The TS from a tuner's media FIFO on its way to the player
+# a relay is put in the path for the life of the source if the PID filter, TS analysis or recording are configured
+# so starting or stopping a recording never changes the media fd the player is reading
+class tsMediaPath(object):
+    def __init__(self, mediaFIFOfilename, sourceConfig, tunerStatus, sourceName):
+        self.mediaFIFOfilename = mediaFIFOfilename
+        self.tunerStatus = tunerStatus
+        self.sourceName = sourceName # for messages
+        self.pidFilter = sourceConfig.pidfilter
+        self.recordPath = sourceConfig.recordpath
+        self.recordSegmentSize = sourceConfig.recordsegmentsize
+        self.recorder = None
+        if self.recordPath is not None:
+            # the recorder thread notifies the source thread if it fails
+            self.recordFailReadFd, self.recordFailWriteFd = self._openNotifyPipe()
+        else:
+            self.recordFailReadFd = None
+            self.recordFailWriteFd = None
+        if sourceConfig.tsanalysis:
+            # the relay thread notifies the source thread of new health reports
+            self.tsHealthReadFd, self.tsHealthWriteFd = self._openNotifyPipe()
+        else:
+            self.tsHealthReadFd = None
+            self.tsHealthWriteFd = None
+        self.needsRelay = self.pidFilter or self.tsHealthWriteFd is not None or self.recordPath is not None
+        self.vlcMediaFd = os.open(self.mediaFIFOfilename, flags=os.O_NONBLOCK|os.O_RDONLY) # an open file descriptor to pass to vlc (or another player)
+        self._openRelay()
+
+    def _openNotifyPipe(self):
+        readFd, writeFd = os.pipe()
+        fcntl.fcntl(readFd, fcntl.F_SETFL, os.O_NONBLOCK)
+        fcntl.fcntl(writeFd, fcntl.F_SETFL, os.O_NONBLOCK)
+        return (readFd, writeFd)
+
+    def _openRelay(self):
+        if self.needsRelay:
+            pidSource = self.tunerStatus.getPIDs if self.pidFilter else None
+            self.relay = tsRelay(self.vlcMediaFd, pidSource, self.tsHealthWriteFd)
+            self.relay.setRecorder(self.recorder)
+        else:
+            self.relay = None
+
+    def _closeRelay(self):
+        if self.relay is not None:
+            self.relay.close()
+            self.relay = None
+
+    def getMediaFd(self):
+        if self.relay is not None:
+            return self.relay.getOutputFd()
+        return self.vlcMediaFd
+
+    def getMediaRelay(self):
+        return self.relay
+
+    # reopen the media FIFO, a recording carries on through the new relay
+    def remedia(self):
+        self._closeRelay()
+        os.close(self.vlcMediaFd)
+        self.vlcMediaFd = os.open(self.mediaFIFOfilename, flags=os.O_NONBLOCK, mode=os.O_RDONLY) # an open file descriptor to pass to vlc (or another player)
+        self._openRelay()
+
+    def setRecording(self, enabled):
+        if enabled and self.recorder is None:
+            if self.recordPath is None:
+                print(self.sourceName+" recording path not configured")
+                return
+            self.recorder = tsRecorder(self.recordPath, self.recordSegmentSize, self.recordFailWriteFd)
+            self.relay.setRecorder(self.recorder)
+        elif not enabled and self.recorder is not None:
+            self.relay.setRecorder(None)
+            self.recorder.close()
+            self.recorder = None
+        self.tunerStatus.setRecording(self.recorder is not None)
+
+    def getFDs(self):
+        fds = []
+        if self.tsHealthReadFd is not None:
+            fds.append(self.tsHealthReadFd)
+        if self.recordFailReadFd is not None:
+            fds.append(self.recordFailReadFd)
+        return fds
+
+    def handleFD(self, fd):
+        if fd == self.tsHealthReadFd:
+            self._drainNotifyPipe(fd)
+            # publish the latest report
+            if self.relay is not None:
+                self.tunerStatus.setTSHealth(self.relay.getTSHealth())
+        elif fd == self.recordFailReadFd:
+            self._drainNotifyPipe(fd)
+            # stop a failed recording so the status and the Record menu show it has stopped
+            if self.recorder is not None and self.recorder.isFailed():
+                self.setRecording(False)
+
+    def _drainNotifyPipe(self, fd):
+        try:
+            while len(os.read(fd, 64)) == 64:
+                pass
+        except BlockingIOError:
+            pass
+
+    def close(self):
+        self._closeRelay()
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+        os.close(self.vlcMediaFd)
+        for fd in [self.tsHealthReadFd, self.tsHealthWriteFd, self.recordFailReadFd, self.recordFailWriteFd]:
+            if fd is not None:
+                os.close(fd)
+
+# Config shared by the sources with a TS media FIFO, for the relay between the FIFO and the player
+class tsMediaConfig(object):
+    def __init__(self, sourceName, pidfilter = False, tsanalysis = False, recordpath = None, recordsegmentsize = 1073741824):
+        self.sourceName = sourceName # for messages
+        self.pidfilter = pidfilter
+        self.tsanalysis = tsanalysis
+        self.recordpath = recordpath
+        self.recordsegmentsize = recordsegmentsize
+
+    def loadConfig(self, config):
+        perfectConfig = True
+        if isinstance(config, dict):
+            if 'pidfilter' in config:
+                if isinstance(config['pidfilter'], bool):
+                    self.pidfilter = config['pidfilter']
+                else:
+                    print("Invalid "+self.sourceName+" PID filter setting")
+                    perfectConfig = False
+            if 'tsanalysis' in config:
+                if isinstance(config['tsanalysis'], bool):
+                    self.tsanalysis = config['tsanalysis']
+                else:
+                    print("Invalid "+self.sourceName+" TS analysis setting")
+                    perfectConfig = False
+            if 'recordpath' in config:
+                if isinstance(config['recordpath'], str) and os.path.isdir(config['recordpath']):
+                    self.recordpath = config['recordpath']
+                elif config['recordpath'] is None:
+                    self.recordpath = None
+                else:
+                    print("Invalid "+self.sourceName+" recording directory")
+                    perfectConfig = False
+            if 'recordsegmentsize' in config:
+                if isinstance(config['recordsegmentsize'], int) and config['recordsegmentsize'] > 0:
+                    self.recordsegmentsize = config['recordsegmentsize']
+                else:
+                    print("Invalid "+self.sourceName+" recording segment size")
+                    perfectConfig = False
+        else:
+            print("Invalid "+self.sourceName+" config")
+            perfectConfig = False
+        return perfectConfig
+
 # Events to send to source thread
 class eventsToThread(enum.Enum):
     RECONFIG = enum.auto()
     START = enum.auto()
     RESTART = enum.auto()
     SHUTDOWN = enum.auto()
+    STANDBY = enum.auto()
+    RECORD = enum.auto()
 
 # Event to receive from source thread
 class eventsFromThread(enum.Enum):
-    NEWFULLSTATUS = enum.auto()
+    NEWSTATUSDELTA = enum.auto()
     NEWCORESTATE = enum.auto()
     NEWMEDIAFD = enum.auto()
 
 # threaded wrapper around source
 class sourceManagerThread(object):
-    def __init__(self, config, sourceConfigs):
+    def __init__(self, config, sourceConfigs, fdRegistry):
         self.sourceConfigs = sourceConfigs
         self.sourceStatus = None
+        self.fdRegistry = fdRegistry # main loop fd registry
         self._threadSetup(config)
         self.coreStateMain = self.coreStateThread
         self.thread.start()
@@ -1109,14 +1884,22 @@ class sourceManagerThread(object):
         # socket and queue to communicate from source thread
         self.fromRecvSock, self.fromSendSock = socket.socketpair()
         self.fromEventQueue = queue.Queue()
+        self.fdRegistry.register(self.fromRecvSock, self.handleMainFD)
+        # fd registry for the source thread loop, the source manager keeps its own fds up to date in it
+        self.threadFdRegistry = rydeplayer.common.fdRegistry()
+        self.threadFdRegistry.register(self.toRecvSock, self.handleThreadFD)
         self.currentSource = config.getBand().getSource()
         newSourceStatus = self.currentSource.getSource().getNewStatus()()
         if self.sourceStatus is not None:
             newSourceStatus.addCallbacksFrom(self.sourceStatus)
         self.sourceStatus = newSourceStatus
 
-        self.sourceMan = self.currentSource.getSource().getManager()(config, self.sourceConfigs[self.currentSource])
+        self.sourceMan = self.currentSource.getSource().getManager()(config, self.sourceConfigs[self.currentSource], self.threadFdRegistry)
         self.sourceMan.getStatus().addOnChangeCallback(self.statusCallbackThread)
+        # last status values sent from the thread and the sequence numbers of the deltas
+        self.statusSnapshotThread = {}
+        self.statusSeqThread = 0
+        self.statusSeqMain = 0
         # trackers for the state in and out of the thread
         self.coreStateThread = self.sourceMan.getCoreState()
         # setup intial media file descriptors
@@ -1128,7 +1911,7 @@ class sourceManagerThread(object):
 
     def reconfig(self, config):
         if config.getBand().getSource() == self.currentSource:
-            self.toEventQueue.put((eventsToThread.RECONFIG, config.copyConfig()))
+            self.toEventQueue.put((eventsToThread.RECONFIG, (config.copyConfig(), rydeplayer.tracing.tracer.getGeneration())))
             self.toSendSock.send(b"\x00")
         else:
             # replace thread when source changes
@@ -1155,26 +1938,35 @@ class sourceManagerThread(object):
         return self.sourceStatus
 
     def statusCallbackThread(self, newStatus):
-        self.fromEventQueue.put((eventsFromThread.NEWFULLSTATUS, newStatus.copyStatus()))
-        self.fromSendSock.send(b"\x00")
+        # only send the fields that changed since the last delta
+        delta = newStatus.getDelta(self.statusSnapshotThread)
+        if len(delta) > 0:
+            self.statusSeqThread += 1
+            self.fromEventQueue.put((eventsFromThread.NEWSTATUSDELTA, (self.statusSeqThread, delta)))
+            self.fromSendSock.send(b"\x00")
 
     def handleMainFD(self, fd):
         # handle events coming from the source thread
-        newStatus = None
+        statusDelta = {}
         while not self.fromEventQueue.empty():
             fd.recv(1) # there should always be the same number of chars in the socket as items in the queue
             queueCommand, queueArg = self.fromEventQueue.get()
-            if queueCommand == eventsFromThread.NEWFULLSTATUS:
-                newStatus = queueArg
+            if queueCommand == eventsFromThread.NEWSTATUSDELTA:
+                seq, delta = queueArg
+                if seq != self.statusSeqMain + 1:
+                    print("Status delta out of sequence, expected "+str(self.statusSeqMain + 1)+" got "+str(seq))
+                self.statusSeqMain = seq
+                # merge deltas that arrived together so the status is only applied once
+                statusDelta.update(delta)
             elif queueCommand == eventsFromThread.NEWCORESTATE:
                 self.coreStateMain = queueArg
             elif queueCommand == eventsFromThread.NEWMEDIAFD:
                 self.mediaFdCacheMain = queueArg
-        if newStatus is not None:
-            self.sourceStatus.setStatusToMatch(newStatus)
+        if len(statusDelta) > 0:
+            self.sourceStatus.applyDelta(statusDelta)
 
     def handleThreadFD(self, fd):
-        # handle events inside the source thread
+        # handle control events inside the source thread, source fds are dispatched directly by the registry
         quit = False
         if fd == self.toRecvSock:
             newconfig = None
@@ -1182,21 +1974,36 @@ class sourceManagerThread(object):
                 fd.recv(1) # there should always be the same number of chars in the socket as items in the queue
                 queueCommand, queueArg = self.toEventQueue.get()
                 if queueCommand == eventsToThread.RECONFIG:
+                    # only the last of a run of reconfigs is applied
                     newconfig = queueArg
-                elif queueCommand == eventsToThread.START:
+                    continue
+                # anything else sees the reconfigs queued before it, the standby presets are sent after the tune they surround
+                if newconfig is not None and queueCommand != eventsToThread.SHUTDOWN:
+                    self._applyReconfig(newconfig)
+                newconfig = None
+                if queueCommand == eventsToThread.START:
+                    self.sourceMan.setTraceGeneration(queueArg)
                     self.sourceMan.start()
                 elif queueCommand == eventsToThread.RESTART:
+                    self.sourceMan.setTraceGeneration(queueArg)
                     self.sourceMan.restart()
                 elif queueCommand == eventsToThread.SHUTDOWN:
                     self.sourceMan.stop()
                     quit = True
+                elif queueCommand == eventsToThread.STANDBY:
+                    self.sourceMan.setStandbyConfigs(queueArg)
+                elif queueCommand == eventsToThread.RECORD:
+                    self.sourceMan.setRecording(queueArg)
             if newconfig is not None and not quit:
-                self.sourceMan.reconfig(newconfig)
-
-        elif fd in self.sourceMan.getFDs():
-            self.sourceMan.handleFD(fd)
+                self._applyReconfig(newconfig)
         return quit
 
+    # a reconfig carries the generation of the tune trace it was requested for
+    def _applyReconfig(self, reconfig):
+        newconfig, traceGeneration = reconfig
+        self.sourceMan.setTraceGeneration(traceGeneration)
+        self.sourceMan.reconfig(newconfig)
+
     def handleFD(self, fd):
         if fd in self.getMainFDs():
             self.handleMainFD(fd)
@@ -1205,11 +2012,21 @@ class sourceManagerThread(object):
         return self.coreStateMain
 
     def start(self):
-        self.toEventQueue.put((eventsToThread.START, None))
+        self.toEventQueue.put((eventsToThread.START, rydeplayer.tracing.tracer.getGeneration()))
         self.toSendSock.send(b"\x00")
 
     def restart(self):
-        self.toEventQueue.put((eventsToThread.RESTART, None))
+        self.toEventQueue.put((eventsToThread.RESTART, rydeplayer.tracing.tracer.getGeneration()))
+        self.toSendSock.send(b"\x00")
+
+    # configs the user is likely to switch to next, sources that support it can prepare them in advance
+    def setStandbyConfigs(self, configs):
+        self.toEventQueue.put((eventsToThread.STANDBY, [config.copyConfig() for config in configs]))
+        self.toSendSock.send(b"\x00")
+
+    # start or stop recording the received stream, only sources with a transport stream can record
+    def setRecording(self, enabled):
+        self.toEventQueue.put((eventsToThread.RECORD, enabled))
         self.toSendSock.send(b"\x00")
 
     def shutdown(self):
@@ -1218,6 +2035,8 @@ class sourceManagerThread(object):
         self.thread.join()
         # cleanup things source normally has a version of open
         self.sourceMan.cleanup()
+        self.threadFdRegistry.close()
+        self.fdRegistry.unregister(self.fromRecvSock)
         self.toRecvSock.close()
         self.toSendSock.close()
         self.fromRecvSock.close()
@@ -1227,19 +2046,18 @@ class sourceManagerThread(object):
         # thread main loop
         quit = False
         while not quit:
-            fds = self.getThreadFDs()
-            r, w, x = select.select(fds, [], [])
-            for fd in r:
-                quit = self.handleThreadFD(fd)
+            for fd, handler in self.threadFdRegistry.select():
+                quit = handler(fd)
                 if quit:
                     break
-            newCoreState = self.sourceMan.getCoreState()
-            if newCoreState != self.coreStateThread:
-                self.coreStateThread = newCoreState
-                self.fromEventQueue.put((eventsFromThread.NEWCORESTATE, newCoreState))
-                self.fromSendSock.send(b"\x00")
+            # the media fd goes first so the player has it when a state change makes it restart playback
             newMediaFd = self.sourceMan.getMediaFd()
             if newMediaFd != self.mediaFdCacheThread:
                 self.mediaFdCacheThread = newMediaFd
                 self.fromEventQueue.put((eventsFromThread.NEWMEDIAFD, newMediaFd))
                 self.fromSendSock.send(b"\x00")
+            newCoreState = self.sourceMan.getCoreState()
+            if newCoreState != self.coreStateThread:
+                self.coreStateThread = newCoreState
+                self.fromEventQueue.put((eventsFromThread.NEWCORESTATE, newCoreState))
+                self.fromSendSock.send(b"\x00")
@@ -14,13 +14,10 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-import enum, os, stat, subprocess, pty, select, copy, fcntl, collections, time, socket, queue, threading, bisect
+import enum, os, stat, subprocess, pty, select, copy, fcntl, collections, time, socket, queue, threading, array, yaml
 import rydeplayer.common
 import rydeplayer.sources.common
-import pyftdi.ftdi
-import pyftdi.usbtools
-import pyftdi.eeprom
-import usb.core
+import rydeplayer.tracing
 
 class inPortEnum(enum.Enum):
     TOP = enum.auto()
@@ -75,8 +72,84 @@ class DVBSModulationEnum(rydeplayer.sources.common.sourceModeEnum):
         self.longName = longName
         self.threshold = threshold
 
+# Maps the AGC readings from a NIM to a power level in dBm
+# Calibration points are expanded into a flat table covering every possible AGC value so a lookup is a single index
+class agcCalibration(object):
+    tableSize = 65536 # AGC readings are 16 bit
+
+    def __init__(self, agc1Points, agc2Points):
+        self.agc1Points = tuple(sorted(agc1Points.items()))
+        self.agc2Points = tuple(sorted(agc2Points.items()))
+        self.agc1Table = self._buildTable(self.agc1Points)
+        self.agc2Table = self._buildTable(self.agc2Points)
+
+    # each AGC value maps to the power of the closest calibration point, the lower point wins a tie
+    def _buildTable(self, points):
+        table = array.array('b')
+        start = 0
+        for index in range(len(points)-1):
+            lowerAGC, lowerPwr = points[index]
+            upperAGC, upperPwr = points[index+1]
+            end = min(max((lowerAGC + upperAGC)//2 + 1, start), self.tableSize)
+            table.extend(array.array('b', [lowerPwr]) * (end - start))
+            start = end
+        table.extend(array.array('b', [points[-1][1]]) * (self.tableSize - start))
+        return table
+
+    def lookup(self, agc1, agc2):
+        if agc1 > 0:
+            return self.agc1Table[min(agc1, self.tableSize-1)]
+        else:
+            return self.agc2Table[min(max(agc2, 0), self.tableSize-1)]
+
+    # load calibration points from a YAML file with agc1 and agc2 maps of AGC reading to dBm
+    @classmethod
+    def loadFile(cls, path):
+        try:
+            with open(path, 'r') as calibrationFile:
+                calibration = yaml.safe_load(calibrationFile)
+        except (IOError, yaml.YAMLError) as e:
+            print(e)
+            return None
+        if not isinstance(calibration, dict):
+            print("AGC calibration file invalid")
+            return None
+        tables = []
+        for tableName in ['agc1', 'agc2']:
+            if tableName not in calibration or not isinstance(calibration[tableName], dict) or len(calibration[tableName]) < 1:
+                print("AGC calibration "+tableName+" table missing or empty")
+                return None
+            for agc, pwr in calibration[tableName].items():
+                if not isinstance(agc, int) or agc < 0 or agc >= cls.tableSize or not isinstance(pwr, int) or pwr < -128 or pwr > 127:
+                    print("Invalid AGC calibration point in "+tableName+": "+str(agc)+": "+str(pwr))
+                    return None
+            tables.append(calibration[tableName])
+        return cls(*tables)
+
+defaultAGCCalibration = agcCalibration({
+        1: -70, 10: -69, 21800: -68, 25100: -67, 27100: -66, 28100: -65, 28900: -64, 29600: -63,
+        30100: -62, 30550: -61, 31000: -60, 31350: -59, 31700: -58, 32050: -57, 32400: -56, 32700: -55,
+        33000: -54, 33300: -53, 33600: -52, 33900: -51, 34200: -50, 34500: -49, 34750: -48, 35000: -47,
+        35250: -46, 35500: -45, 35750: -44, 36000: -43, 36200: -42, 36400: -41, 36600: -40, 36800: -39,
+        37000: -38, 37200: -37, 37400: -36, 37600: -35, 37700: -35,
+    }, {
+        182: -71, 200: -72, 225: -73, 255: -74, 290: -75, 325: -76, 360: -77, 400: -78,
+        450: -79, 500: -80, 560: -81, 625: -82, 700: -83, 780: -84, 880: -85, 1000: -86,
+        1140: -87, 1300: -88, 1480: -89, 1660: -90, 1840: -91, 2020: -92, 2200: -93, 2380: -94,
+        2560: -95, 2740: -96, 3200: -97,
+    })
+
 # Container for tuner status data with change callbacks
 class tunerStatus(rydeplayer.sources.common.sourceStatus):
+    agcCalibration = defaultAGCCalibration
+    statusFields = rydeplayer.sources.common.sourceStatus.statusFields + ('mer', 'sr', 'powerInd')
+    displayFields = {
+            **rydeplayer.sources.common.sourceStatus.displayFields,
+            'powerLevel':      frozenset(['powerInd']),
+            'signalLevel':     frozenset(['mer']),
+            'signalReport':    frozenset(['mer', 'modulation']),
+            'signalBandwidth': frozenset(['sr']),
+            }
     def __init__(self):
         super().__init__()
         self.mer = None
@@ -189,97 +262,15 @@ class tunerStatus(rydeplayer.sources.common.sourceStatus):
         else:
             return False
 
-    def updatePowerInd(self):
-        agc1Lookup = collections.OrderedDict()
-        agc1Lookup[1] = -70
-        agc1Lookup[10] = -69
-        agc1Lookup[21800] = -68
-        agc1Lookup[25100] = -67
-        agc1Lookup[27100] = -66
-        agc1Lookup[28100] = -65
-        agc1Lookup[28900] = -64
-        agc1Lookup[29600] = -63
-        agc1Lookup[30100] = -62
-        agc1Lookup[30550] = -61
-        agc1Lookup[31000] = -60
-        agc1Lookup[31350] = -59
-        agc1Lookup[31700] = -58
-        agc1Lookup[32050] = -57
-        agc1Lookup[32400] = -56
-        agc1Lookup[32700] = -55
-        agc1Lookup[33000] = -54
-        agc1Lookup[33300] = -53
-        agc1Lookup[33600] = -52
-        agc1Lookup[33900] = -51
-        agc1Lookup[34200] = -50
-        agc1Lookup[34500] = -49
-        agc1Lookup[34750] = -48
-        agc1Lookup[35000] = -47
-        agc1Lookup[35250] = -46
-        agc1Lookup[35500] = -45
-        agc1Lookup[35750] = -44
-        agc1Lookup[36000] = -43
-        agc1Lookup[36200] = -42
-        agc1Lookup[36400] = -41
-        agc1Lookup[36600] = -40
-        agc1Lookup[36800] = -39
-        agc1Lookup[37000] = -38
-        agc1Lookup[37200] = -37
-        agc1Lookup[37400] = -36
-        agc1Lookup[37600] = -35
-        agc1Lookup[37700] = -35
-
-        agc2Lookup = collections.OrderedDict()
-        agc2Lookup[182] = -71
-        agc2Lookup[200] = -72
-        agc2Lookup[225] = -73
-        agc2Lookup[255] = -74
-        agc2Lookup[290] = -75
-        agc2Lookup[325] = -76
-        agc2Lookup[360] = -77
-        agc2Lookup[400] = -78
-        agc2Lookup[450] = -79
-        agc2Lookup[500] = -80
-        agc2Lookup[560] = -81
-        agc2Lookup[625] = -82
-        agc2Lookup[700] = -83
-        agc2Lookup[780] = -84
-        agc2Lookup[880] = -85
-        agc2Lookup[1000] = -86
-        agc2Lookup[1140] = -87
-        agc2Lookup[1300] = -88
-        agc2Lookup[1480] = -89
-        agc2Lookup[1660] = -90
-        agc2Lookup[1840] = -91
-        agc2Lookup[2020] = -92
-        agc2Lookup[2200] = -93
-        agc2Lookup[2380] = -94
-        agc2Lookup[2560] = -95
-        agc2Lookup[2740] = -96
-        agc2Lookup[3200] = -97
+    def setAGCCalibration(self, newCalibration):
+        self.agcCalibration = newCalibration
+        return self.updatePowerInd()
 
+    def updatePowerInd(self):
         if self.agc1 is None or self.agc2 is None:
             newpwr = None
         else:
-            if self.agc1 > 0:
-                lookupDict = agc1Lookup
-                lookupVal = self.agc1
-            else:
-                lookupDict = agc2Lookup
-                lookupVal = self.agc2
-            agcKeys = list(lookupDict.keys())
-            # find where it would be inserted if it was a list
-            agcIndex = bisect.bisect_left(agcKeys,lookupVal)
-
-            if agcIndex >= len(agcKeys): # bigger than list use max value
-                closestKey = agcKeys[-1]
-            elif agcIndex <= 0: # smaller than list use min value
-                closestKey = agcKeys[0]
-            elif abs(agcKeys[agcIndex]-lookupVal) >= abs(agcKeys[agcIndex-1]-lookupVal): # check if n or n-1 is closer
-                closestKey = agcKeys[agcIndex - 1]
-            else:
-                closestKey = agcKeys[agcIndex]
-            newpwr = lookupDict[closestKey]
+            newpwr = self.agcCalibration.lookup(self.agc1, self.agc2)
         if self.powerInd != newpwr:
             self.powerInd = newpwr
             self.onChangeFire()
@@ -384,8 +375,60 @@ class tunerStatus(rydeplayer.sources.common.sourceStatus):
         if changed:
             self.onChangeFire()
 
+# Tracks the longmynd startup stages from its Status lines
+# counts are kept up to date as each line arrives so the status log never needs rescanning
+class lmStartupTracker(object):
+    lnaLines = ('found new NIM with LNAs', 'found an older NIM with no LNA')
+    # status line prefix and the stage it counts towards, a line only counts towards the first match
+    linePatterns = (
+            ('opened fifo ok', 'fifos'),
+            ('MPSSE',          'usb'),
+            ('STV0910 MID',    'stv'),
+            ('tuner:',         'tuner'),
+            (lnaLines[0],      'lnas'),
+            (lnaLines[1],      'lnas'),
+            )
+    # number of matching lines for each stage to be complete
+    stageCounts = {'fifos': 2, 'usb': 1, 'stv': 1, 'tuner': 1, 'lnas': 2}
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.startTime = time.monotonic()
+        self.counts = dict.fromkeys(self.stageCounts, 0)
+        self.stagesRemaining = len(self.stageCounts)
+        self.stageTimes = collections.OrderedDict() # seconds from reset to each stage completing, in completion order
+        self.started = False
+
+    # returns True when this line completes the startup
+    def processStatusLine(self, line):
+        for prefix, stage in self.linePatterns:
+            if line.startswith(prefix):
+                self.counts[stage] += 1
+                if self.counts[stage] == self.stageCounts[stage]:
+                    self.stageTimes[stage] = time.monotonic() - self.startTime
+                    self.stagesRemaining -= 1
+                    if self.stagesRemaining == 0:
+                        self.started = True
+                        return True
+                break
+        return False
+
+    def isStarted(self):
+        return self.started
+
+    def getStageTimes(self):
+        return self.stageTimes
+
+    def __str__(self):
+        stageStrings = []
+        for stage, stageTime in self.stageTimes.items():
+            stageStrings.append(stage+": "+"{:.3f}".format(stageTime)+"s")
+        return "lm startup stages - "+", ".join(stageStrings)
+
 class lmManager(object):
-    def __init__(self, config, sourceConfig):
+    def __init__(self, config, sourceConfig, fdRegistry):
         # path to the longmynd binary
         self.lmpath = sourceConfig.binpath
         self.mediaFIFOfilename = sourceConfig.mediapath
@@ -401,17 +444,20 @@ class lmManager(object):
             os.mkfifo(self.statusFIFOfilename)
         elif(not stat.S_ISFIFO(os.stat(self.statusFIFOfilename).st_mode)):
             print("status pipe is not a fifo")
-        self.vlcMediaFd =os.open(self.mediaFIFOfilename, flags=os.O_NONBLOCK|os.O_RDONLY) # an open file descriptor to pass to vlc (or another player)
-#        self.vlcMediaFd = None
-        self.statusFIFOfd = os.fdopen(os.open(self.statusFIFOfilename, flags=os.O_NONBLOCK|os.O_RDONLY), encoding="utf-8", errors="replace") # the status fifo file descriptor
+        # reusable buffer the status FIFO is read into, it only ever holds a few lines
+        self.statusBuf = bytearray(4096)
+        self.statusBufView = memoryview(self.statusBuf)
+        self._openStatusFIFO()
         rpipe, self.stdoutWritefd = pty.openpty() # a pty for interacting with longmynds STDOUT, couldn't get pipes to work
         flags = fcntl.fcntl(rpipe, fcntl.F_GETFL)
         flags |= os.O_NONBLOCK
         fcntl.fcntl(rpipe, fcntl.F_SETFL, flags)
         self.stdoutReadfd = os.fdopen(rpipe, 'r')
         self.process = None
-        self.statelog = [] # log of important things from longmynds STDOUT
-        self.lmlog = [] # a complete longmmynd output log, for debugging
+        self.laststart = 0
+        self.statelog = rydeplayer.common.ringLog(200, 16*1024) # log of important things from longmynds STDOUT
+        self.startupTracker = lmStartupTracker()
+        self.lmlog = rydeplayer.common.ringLog(2000, 256*1024) # a complete longmmynd output log, for debugging
         self.lmstarted = False
         self.statusrecv = False
         self.activeConfig = config.copyConfig()
@@ -428,9 +474,32 @@ class lmManager(object):
         self.lastState = { 'state':None, 'provider': '', 'service': '', 'modcode': None, 'pids': {} }
         self.changeRefState = copy.deepcopy(self.lastState)
         self.stateMonotonic = 0
+        self.traceGeneration = 0 # generation of the tune trace the current work is for
         self.tunerStatus = tunerStatus()
+        # the TS on its way from the media FIFO to the player, through the optional relay that filters, analyses and records it
+        self.mediaPath = rydeplayer.sources.common.tsMediaPath(self.mediaFIFOfilename, sourceConfig, self.tunerStatus, "longmynd")
+        self.tunerStatus.setAGCCalibration(sourceConfig.agcCalibration)
         # state type for the core longmynd state
-        self.coreStateType = collections.namedtuple('coreState', ['isRunning', 'isStarted', 'isLocked', 'monotonicState'])
+        self.coreStateType = collections.namedtuple('coreState', ['isRunning', 'isStarted', 'isLocked', 'monotonicState', 'traceGeneration'])
+        # status message type handlers, keyed by the number after the $
+        #TODO: handle more of the status messages
+        self.statusHandlers = {
+                1:  self._statusState,
+                6:  self._statusFreq,
+                9:  self._statusSR,
+                12: self._statusMer,
+                13: self._statusProvider,
+                14: self._statusService,
+                16: self._statusESPID,
+                17: self._statusESType,
+                18: self._statusModcode,
+                26: self._statusAGC1,
+                27: self._statusAGC2,
+                }
+        self.statusPrintTypes = frozenset([1, 6, 9, 12])
+        # registry to keep up to date when the status and stdout fds are reopened
+        self.fdRegistry = fdRegistry
+        self.fdRegistry.registerAll(self.getFDs(), self.handleFD)
 
     def reconfig(self, config):
         """reconfigures longmynd"""
@@ -438,27 +507,40 @@ class lmManager(object):
             self.activeConfig = config.copyConfig()
             print(self.activeConfig)
             self.restart()
+    def setStandbyConfigs(self, configs):
+        """standby tuning isn't supported, there is only one tuner"""
+        pass
+    def setRecording(self, enabled):
+        """start or stop recording the TS to disk"""
+        self.mediaPath.setRecording(enabled)
     def waitForMediaHangup(self):
         return False
     def remedia(self):
-        os.close(self.vlcMediaFd)
-        self.vlcMediaFd = os.open(self.mediaFIFOfilename, flags=os.O_NONBLOCK, mode=os.O_RDONLY) # an open file descriptor to pass to vlc (or another player)
+        self.mediaPath.remedia()
     def getMediaFd(self):
-        return self.vlcMediaFd
+        return self.mediaPath.getMediaFd()
+    def getMediaRelay(self):
+        return self.mediaPath.getMediaRelay()
+    def _openStatusFIFO(self):
+        """opens the status FIFO unbuffered so it can be read into the status buffer"""
+        self.statusFIFOfd = os.fdopen(os.open(self.statusFIFOfilename, flags=os.O_NONBLOCK|os.O_RDONLY), 'rb', buffering=0) # the status fifo file descriptor
+        self.statusBufLen = 0 # length of any partial line at the start of the buffer
     def getFDs(self):
-        return [self.statusFIFOfd, self.stdoutReadfd]
+        fds = [self.statusFIFOfd, self.stdoutReadfd]
+        return fds + self.mediaPath.getFDs()
     def getStatus(self):
         return self.tunerStatus
     def handleFD(self, fd):
         """handles a file descriptor that has data to read"""
-        fdCallbacks = dict()
-        fdCallbacks[self.stdoutReadfd] = self.processStdout
-        fdCallbacks[self.statusFIFOfd] = self.processStatus
-        if(fd in fdCallbacks):
-            fdCallbacks[fd]()
+        if fd is self.statusFIFOfd:
+            self.processStatus()
+        elif fd is self.stdoutReadfd:
+            self.processStdout()
+        elif fd in self.mediaPath.getFDs():
+            self.mediaPath.handleFD(fd)
     def getCoreState(self):
         """gets the core system state in a single call"""
-        state = self.coreStateType(self.isRunning(), self.isStarted(), self.isLocked(), self.getMonotonicState())
+        state = self.coreStateType(self.isRunning(), self.isStarted(), self.isLocked(), self.getMonotonicState(), self.traceGeneration)
         return state
     def isStarted(self):
         if(self.process != None):
@@ -484,95 +566,153 @@ class lmManager(object):
                 return False
         else:
             return False
+    def setTraceGeneration(self, generation):
+        self.traceGeneration = generation
     def getMonotonicState(self):
         return self.stateMonotonic
     
     def processStatus(self):
         """process the status FIFO data"""
-        #TODO: handle more of the status messages
-        lines =  self.statusFIFOfd.readlines()
-        for line in lines:
-            self.statusrecv = True
-            if(line[0] == '$'):
-                rawtype,rawval = line[1:].rstrip().split(',',1)
-                msgtype = int(rawtype)
-                if msgtype == 1: # State
-                    if int(rawval) == 3:
-                        self.tunerStatus.setDVBVersion(DVBSVersionEnum.DVBS)
-                    elif int(rawval) == 4:
-                        self.tunerStatus.setDVBVersion(DVBSVersionEnum.DVBS2)
-                    else:
-                        self.tunerStatus.setDVBVersion(None)
-                    if not self.hasPIDs:
-                        self.tunerStatus.setPIDs(self.pidCache)
-                    self.hasPIDs = False
-                    if self.lastState != self.changeRefState : # if the signal parameters have changed
-                        self.stateMonotonic += 1
-                        self.changeRefState = copy.deepcopy(self.lastState)
-                    self.lastState['state'] = int(rawval)
-                    if int(rawval) < 3: # if it is not locked, reset some state
-                        self.lastState['provider'] = ""
-                        self.lastState['service'] = ""
-                        self.lastState['modcode'] = None
-                        self.lastState['pids'] = {}
-                    if self.lastState != self.changeRefState : # if the signal parameters have changed
-                        self.stateMonotonic += 1
-                        self.changeRefState = copy.deepcopy(self.lastState)
-                elif msgtype == 6:
-                    currentBand = self.activeConfig.getBand()
-                    self.tunerStatus.setFreq(currentBand.mapTuneToReq(int(rawval)))
-                elif msgtype == 9:
-                    self.tunerStatus.setSR(float(rawval)/1000)
-                elif msgtype == 12:
-                    self.tunerStatus.setMer(float(rawval)/10)
-                elif msgtype == 13:
-                    self.tunerStatus.setProvider(str(rawval))
-                    self.lastState['provider'] = rawval
-                elif msgtype == 14:
-                    self.tunerStatus.setService(str(rawval))
-                    self.lastState['service'] = rawval
-                elif msgtype == 18:
-                    self.tunerStatus.setModcode(int(rawval))
-                    self.lastState['modcode'] = int(rawval)
-                elif msgtype == 26:
-                    self.tunerStatus.setAGC1(int(rawval))
-                elif msgtype == 27:
-                    self.tunerStatus.setAGC2(int(rawval))
-
-                # PID list accumulator
-                if msgtype == 16: # ES PID
-                    self.hasPIDs = True
-                    self.pidCacheWait = False
-                    if self.pidCachePair[0] == None:
-                        self.pidCachePair = (int(rawval), self.pidCachePair[1])
-                        if self.pidCachePair[1] != None:
-                            self.pidCache[pidCachePair[0]] = pidCachePair[1]
-                            self.pidCachePair = (None, None)
-                    else:
-                        self.pidCacheFault = True
-                        print("pid cache fault")
-                elif msgtype == 17: # ES Type
-                    self.hasPIDs = True
-                    self.pidCacheWait = False
-                    if self.pidCachePair[1] == None:
-                        self.pidCachePair = (self.pidCachePair[0], int(rawval))
-                        if self.pidCachePair[0] != None:
-                            self.pidCache[self.pidCachePair[0]] = self.pidCachePair[1]
-                            self.pidCachePair = (None, None)
-                    else:
-                        self.pidCacheFault = True
-                        print("pid cache fault")
-                # update pid status once we have them all (uness there was a fault)
-                elif not self.pidCacheWait:
-                    if not self.pidCacheFault:
-                        self.lastState['pids'] = self.pidCache
-                        self.tunerStatus.setPIDs(self.pidCache)
-                    self.pidCacheFault = False
-                    self.pidCacheWait = True
-                    self.pidCache = {}
-                    self.pidCachePair= (None,None)
-                if(msgtype in [1, 6, 9, 12]):
-                    print(str(msgtype)+":"+rawval)
+        # a read may hold several messages, deliver them as one status change
+        with self.tunerStatus.batch():
+            buf = self.statusBuf
+            while True:
+                # read straight into the end of the reusable buffer, after any partial line from the last read
+                try:
+                    count = self.statusFIFOfd.readinto(self.statusBufView[self.statusBufLen:])
+                except BlockingIOError:
+                    count = None
+                if not count: # nothing left to read or the writer has gone away
+                    break
+                end = self.statusBufLen + count
+                lineStart = 0
+                lineEnd = buf.find(b'\n', lineStart, end)
+                while lineEnd >= 0:
+                    self._processStatusLine(lineStart, lineEnd)
+                    lineStart = lineEnd + 1
+                    lineEnd = buf.find(b'\n', lineStart, end)
+                if lineStart == 0 and end == len(buf):
+                    print("status line too long, dropping")
+                    self.statusBufLen = 0
+                else:
+                    # move the partial line to the start of the buffer ready for the next read
+                    self.statusBufLen = end - lineStart
+                    if lineStart > 0 and self.statusBufLen > 0:
+                        self.statusBufView[:self.statusBufLen] = self.statusBufView[lineStart:end]
+
+    def _processStatusLine(self, start, end):
+        """parse a single status line held in the status buffer between start and end"""
+        buf = self.statusBuf
+        if not self.statusrecv:
+            rydeplayer.tracing.tracer.mark('firststatus', self.traceGeneration)
+        self.statusrecv = True
+        if end <= start or buf[start] != 0x24: # '$'
+            return
+        comma = buf.find(b',', start+1, end)
+        if comma < 0:
+            return
+        try:
+            msgtype = int(buf[start+1:comma])
+            rawval = buf[comma+1:end].rstrip()
+            handler = self.statusHandlers.get(msgtype)
+            if handler is not None:
+                handler(rawval)
+        except ValueError:
+            print("invalid status line")
+            return
+        # update pid status once we have them all (unless there was a fault)
+        if msgtype != 16 and msgtype != 17 and not self.pidCacheWait:
+            if not self.pidCacheFault:
+                self.lastState['pids'] = self.pidCache
+                self.tunerStatus.setPIDs(self.pidCache)
+            self.pidCacheFault = False
+            self.pidCacheWait = True
+            self.pidCache = {}
+            self.pidCachePair= (None,None)
+        if msgtype in self.statusPrintTypes:
+            print(str(msgtype)+":"+rawval.decode("utf-8", errors="replace"))
+
+    def _statusState(self, rawval):
+        state = int(rawval)
+        if state == 3:
+            self.tunerStatus.setDVBVersion(DVBSVersionEnum.DVBS)
+            rydeplayer.tracing.tracer.mark('locked', self.traceGeneration)
+        elif state == 4:
+            self.tunerStatus.setDVBVersion(DVBSVersionEnum.DVBS2)
+            rydeplayer.tracing.tracer.mark('locked', self.traceGeneration)
+        else:
+            self.tunerStatus.setDVBVersion(None)
+        if not self.hasPIDs:
+            self.tunerStatus.setPIDs(self.pidCache)
+        self.hasPIDs = False
+        if self.lastState != self.changeRefState : # if the signal parameters have changed
+            self.stateMonotonic += 1
+            self.changeRefState = copy.deepcopy(self.lastState)
+        self.lastState['state'] = state
+        if state < 3: # if it is not locked, reset some state
+            self.lastState['provider'] = ""
+            self.lastState['service'] = ""
+            self.lastState['modcode'] = None
+            self.lastState['pids'] = {}
+        if self.lastState != self.changeRefState : # if the signal parameters have changed
+            self.stateMonotonic += 1
+            self.changeRefState = copy.deepcopy(self.lastState)
+
+    def _statusFreq(self, rawval):
+        currentBand = self.activeConfig.getBand()
+        self.tunerStatus.setFreq(currentBand.mapTuneToReq(int(rawval)))
+
+    def _statusSR(self, rawval):
+        self.tunerStatus.setSR(float(rawval)/1000)
+
+    def _statusMer(self, rawval):
+        self.tunerStatus.setMer(float(rawval)/10)
+
+    def _statusProvider(self, rawval):
+        provider = rawval.decode("utf-8", errors="replace")
+        self.tunerStatus.setProvider(provider)
+        self.lastState['provider'] = provider
+
+    def _statusService(self, rawval):
+        service = rawval.decode("utf-8", errors="replace")
+        self.tunerStatus.setService(service)
+        self.lastState['service'] = service
+
+    def _statusModcode(self, rawval):
+        modcode = int(rawval)
+        self.tunerStatus.setModcode(modcode)
+        self.lastState['modcode'] = modcode
+
+    def _statusAGC1(self, rawval):
+        self.tunerStatus.setAGC1(int(rawval))
+
+    def _statusAGC2(self, rawval):
+        self.tunerStatus.setAGC2(int(rawval))
+
+    # PID list accumulator
+    def _statusESPID(self, rawval):
+        self.hasPIDs = True
+        self.pidCacheWait = False
+        if self.pidCachePair[0] == None:
+            self.pidCachePair = (int(rawval), self.pidCachePair[1])
+            if self.pidCachePair[1] != None:
+                self.pidCache[self.pidCachePair[0]] = self.pidCachePair[1]
+                self.pidCachePair = (None, None)
+        else:
+            self.pidCacheFault = True
+            print("pid cache fault")
+
+    def _statusESType(self, rawval):
+        self.hasPIDs = True
+        self.pidCacheWait = False
+        if self.pidCachePair[1] == None:
+            self.pidCachePair = (self.pidCachePair[0], int(rawval))
+            if self.pidCachePair[0] != None:
+                self.pidCache[self.pidCachePair[0]] = self.pidCachePair[1]
+                self.pidCachePair = (None, None)
+        else:
+            self.pidCacheFault = True
+            print("pid cache fault")
 
     def processStdout(self):
         """track the starup state of longmynd from its STDOUT"""
@@ -612,36 +752,20 @@ class lmManager(object):
                         self.lnaIniting = True
                         self.lnaErrorCount = 0
                 elif(newline.lstrip().startswith("Status:")):
-                    lnaLines = ['found new NIM with LNAs', 'found an older NIM with no LNA']
                     statusline = newline.lstrip()[8:]
 
-                    if(statusline in lnaLines):
+                    if(statusline in lmStartupTracker.lnaLines):
                         # stop tracking LNA initalisation errors and stop if there are more than expected errors
                         self.lnaIniting = False
                         self.lnaErrorCount = 0
                         if(self.lnaErrorCount > 1):
                             stop = True
                     self.statelog.append(statusline)
-                    fifosopen = 0
-                    usbopen = False
-                    stvopen = False
-                    tuneropen = False
-                    lnasfound = 0
-                    for line in self.statelog:
-                        if(line == 'opened fifo ok'):
-                            fifosopen += 1
-                        elif(line.startswith('MPSSE')):
-                            usbopen = True
-                        elif(line.startswith('STV0910 MID')):
-                            stvopen = True
-                        elif(line.startswith('tuner:')):
-                            tuneropen = True
-                        elif(line in lnaLines):
-                            lnasfound += 1
-    
-                    if(fifosopen==2 and usbopen and stvopen and tuneropen and lnasfound==2):
+                    if self.startupTracker.processStatusLine(statusline):
                         self.lmstarted = True
+                        rydeplayer.tracing.tracer.mark('started', self.traceGeneration)
                         print("lm started")
+                        print(self.startupTracker)
         if stop:
             self.stop(True,True)
 
@@ -700,20 +824,22 @@ class lmManager(object):
             newline = rawnewline.rstrip()
             self.lmlog.append(newline)
 
+        self.fdRegistry.unregisterAll(self.getFDs())
         self.stdoutReadfd.close()
         self.statusFIFOfd.close()
         #open a clean buffer ready for the restart
 
-        self.statusFIFOfd = os.fdopen(os.open(self.statusFIFOfilename, flags=os.O_NONBLOCK, mode=os.O_RDONLY), encoding="utf-8", errors="replace")
+        self._openStatusFIFO()
         rpipe, self.stdoutWritefd = pty.openpty()
         flags = fcntl.fcntl(rpipe, fcntl.F_GETFL)
         flags |= os.O_NONBLOCK
         fcntl.fcntl(rpipe, fcntl.F_SETFL, flags)
         self.stdoutReadfd = os.fdopen(rpipe, 'r')
+        self.fdRegistry.registerAll(self.getFDs(), self.handleFD)
         self.process = None
         #TODO: parse this and display a meaningful message on screen
         if dumpOutput:
-            for logline in self.lmlog:
+            for logline in self.lmlog.dump():
                 print(logline)
 
     def cleanup(self):
@@ -726,63 +852,54 @@ class lmManager(object):
                 break
             newline = rawnewline.rstrip()
             self.lmlog.append(newline)
+        self.fdRegistry.unregisterAll(self.getFDs())
         self.stdoutReadfd.close()
         self.statusFIFOfd.close()
-        os.close(self.vlcMediaFd)
-
-    def _fetchFtdiDevices(self):
-        pyftdi.usbtools.UsbTools.flush_cache()
-        foundDevices = pyftdi.ftdi.Ftdi.list_devices("ftdi://ftdi:2232h/1")
-        devices = {}
-        for deviceDesc in foundDevices:
-            device = pyftdi.usbtools.UsbTools.get_device(deviceDesc[0])
-            eeprom = pyftdi.eeprom.FtdiEeprom()
-            eeprom.open(device)
-            signature = []
-            for prop in sorted(list(eeprom.properties)+['product']):
-                signature.append((prop,getattr(eeprom, prop)))
-            devices[deviceDesc[0]]=frozenset(signature)
-            eeprom.close()
-            device.reset()
-            pyftdi.usbtools.UsbTools.release_device(device)
-        return devices
-
-    def _fetchPicoDevices(self):
-        foundDevices = list(usb.core.find(find_all=1))
-        devices = {}
-        for device in foundDevices:
-            signature = []
-            for prop in sorted(list(rydeplayer.sources.common.picoConfigs.getKeys())):
-                try:
-                    attr=getattr(device, prop)
-                except ValueError:
-                    attr=None
-                signature.append((prop,attr))
-            devices[device]=frozenset(signature)
-        return devices
+        self.mediaPath.close()
+
+    def _findTuner(self):
+        picoDevices = rydeplayer.sources.common.usbDevices.getPicoDevices()
+        ftdiDevices = rydeplayer.sources.common.usbDevices.getFtdiDevices()
+        ftdiValidTuners = [rydeplayer.sources.common.ftdiConfigs.MINITIOUNER.configSet, rydeplayer.sources.common.ftdiConfigs.MINITIOUNEREXPRESS.configSet, rydeplayer.sources.common.ftdiConfigs.MINITIOUNER_S.configSet, rydeplayer.sources.common.ftdiConfigs.MINITIOUNER_PRO_TS1.configSet, rydeplayer.sources.common.ftdiConfigs.MINITIOUNER_PRO_TS2.configSet]
+        picoValidTuners = [rydeplayer.sources.common.picoConfigs.PICOTUNER.configSet]
+        for device in picoDevices:
+            if picoDevices[device] in picoValidTuners:
+                return device
+        for device in ftdiDevices:
+            if ftdiDevices[device] in ftdiValidTuners:
+                return device
+        return None
 
     def start(self):
         if self.activeConfig.isValid():
             if self.process == None :
-                picoDevices = self._fetchPicoDevices()
-                ftdiDevices = self._fetchFtdiDevices()
-                devices = {}
-                devices.update(picoDevices)
-                devices.update(ftdiDevices)
-                ftdiValidTuners = [rydeplayer.sources.common.ftdiConfigs.MINITIOUNER.configSet, rydeplayer.sources.common.ftdiConfigs.MINITIOUNEREXPRESS.configSet, rydeplayer.sources.common.ftdiConfigs.MINITIOUNER_S.configSet, rydeplayer.sources.common.ftdiConfigs.MINITIOUNER_PRO_TS1.configSet, rydeplayer.sources.common.ftdiConfigs.MINITIOUNER_PRO_TS2.configSet]
-                picoValidTuners = [rydeplayer.sources.common.picoConfigs.PICOTUNER.configSet]
-                foundDevice = None
-                for device in devices:
-                    if (device in ftdiDevices and devices[device] in ftdiValidTuners) or (device in picoDevices and devices[device] in picoValidTuners):
-                        foundDevice = device
-                        break
+                foundDevice = self._findTuner()
+                if foundDevice is None:
+                    # the cache may be out of date, try again with a full scan
+                    rydeplayer.sources.common.usbDevices.invalidate()
+                    foundDevice = self._findTuner()
                 if foundDevice is not None:
                     print("start")
                     self.lmstarted = False
                     self.statusrecv = False
                     self.autoresetdetect = False
-                    self.statelog=[]
-                    self.lmlog=[]
+                    self.statelog.clear()
+                    self.startupTracker.reset()
+                    self.lmlog.clear()
+                    # forget the last lock, it was for the old tune
+                    self.hasPIDs = False
+                    self.pidCacheWait = True
+                    self.pidCacheFault = False
+                    self.pidCache = {}
+                    self.pidCachePair = (None,None)
+                    self.lastState['provider'] = ""
+                    self.lastState['service'] = ""
+                    self.lastState['modcode'] = None
+                    self.lastState['pids'] = {}
+                    with self.tunerStatus.batch():
+                        self.tunerStatus.setProvider("")
+                        self.tunerStatus.setService("")
+                        self.tunerStatus.setPIDs({})
                     args = [self.lmpath, '-t', self.mediaFIFOfilename, '-s', self.statusFIFOfilename, '-r', str(self.tsTimeout), '-u', str(foundDevice.bus), str(foundDevice.address)]
                     if self.activeConfig.band.getInputPort() == inPortEnum.BOTTOM:
                         args.append('-w')
@@ -805,6 +922,8 @@ class lmManager(object):
                     args.append(",".join(srStrings))
                     print(args)
                     self.process = subprocess.Popen(args, stdout=self.stdoutWritefd, stderr=subprocess.STDOUT, bufsize=0)
+                    self.laststart = time.monotonic()
+                    rydeplayer.tracing.tracer.mark('spawn', self.traceGeneration)
                 else:
                     print("No MiniTiouner USB module found")
             else:
@@ -813,20 +932,24 @@ class lmManager(object):
             print("Can't start, config invalid")
     def restart(self):
         if self.process is not None:
+            # give a new longmynd at least 0.2s before stopping it if it hasn't sent any status yet
             if not self.statusrecv:
-                time.sleep(0.2)
+                time.sleep(max(0.2-(time.monotonic()-self.laststart),0))
             self.stop()
         self.start()
 
-class config(object):
-    def __init__(self, binpath = '/home/pi/longmynd/longmynd', mediapath = '/home/pi/lmmedia', statuspath = '/home/pi/lmstatus', tstimeout = 5000):
+class config(rydeplayer.sources.common.tsMediaConfig):
+    def __init__(self, binpath = '/home/pi/longmynd/longmynd', mediapath = '/home/pi/lmmedia', statuspath = '/home/pi/lmstatus', tstimeout = 5000, pidfilter = False, tsanalysis = False, recordpath = None, recordsegmentsize = 1073741824):
+        super().__init__("longmynd", pidfilter, tsanalysis, recordpath, recordsegmentsize)
         self.binpath = binpath
         self.mediapath = mediapath
         self.statuspath = statuspath
         self.tstimeout = tstimeout
+        self.agcCalibration = defaultAGCCalibration
 
     def loadConfig(self, config):
-        perfectConfig = True
+        # the relay settings and the check that it is a dict are shared with the other tuners
+        perfectConfig = super().loadConfig(config)
         if isinstance(config, dict):
             if 'binpath' in config:
                 if isinstance(config['binpath'], str):
@@ -853,9 +976,17 @@ class config(object):
                 else:
                     print("Invalid longmynd TS timeout")
                     perfectConfig = False
-        else:
-            print("Invalid longmynd config")
-            perfectConfig = False
+            if 'agccalibration' in config:
+                if isinstance(config['agccalibration'], str):
+                    newCalibration = agcCalibration.loadFile(config['agccalibration'])
+                    if newCalibration is not None:
+                        self.agcCalibration = newCalibration
+                    else:
+                        print("Failed to load longmynd AGC calibration, using defaults")
+                        perfectConfig = False
+                else:
+                    print("Invalid longmynd AGC calibration path")
+                    perfectConfig = False
         return perfectConfig
 
 class band(rydeplayer.sources.common.tunerBandRF):
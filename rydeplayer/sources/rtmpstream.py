@@ -14,14 +14,46 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-import enum, os, copy, fcntl, collections, time, socket, threading, queue, librtmp, urllib.parse, datetime, select, string
+import enum, os, copy, fcntl, collections, time, socket, threading, queue, librtmp, urllib.parse, select, string, struct
 import rydeplayer.common
 import rydeplayer.sources.common
+import rydeplayer.tracing
 
 # Container for tuner status data with change callbacks
 class tunerStatus(rydeplayer.sources.common.sourceStatus):
+    statusFields = rydeplayer.sources.common.sourceStatus.statusFields + ('mediaBuffer', 'unforwardedPackets')
     def __init__(self):
         super().__init__()
+        self.mediaBuffer = None
+        self.unforwardedPackets = None
+
+    def setMediaBuffer(self, newval):
+        if newval is None or isinstance(newval, dict):
+            if self.mediaBuffer != newval:
+                self.mediaBuffer = newval
+                self.onChangeFire()
+                return True
+            else:
+                return False
+        else:
+            return False
+
+    def getMediaBuffer(self):
+        return self.mediaBuffer
+
+    def setUnforwardedPackets(self, newval):
+        if newval is None or isinstance(newval, dict):
+            if self.unforwardedPackets != newval:
+                self.unforwardedPackets = newval
+                self.onChangeFire()
+                return True
+            else:
+                return False
+        else:
+            return False
+
+    def getUnforwardedPackets(self):
+        return self.unforwardedPackets
 
     def setPIDs(self, audioPid, videoPid):
         audioCodecMap = {
@@ -52,6 +84,14 @@ class tunerStatus(rydeplayer.sources.common.sourceStatus):
 
     def setStatusToMatch(self, fromStatus):
         changed = super().setStatusToMatch(fromStatus)
+        newMediaBuffer = fromStatus.getMediaBuffer()
+        if self.mediaBuffer != newMediaBuffer:
+            self.mediaBuffer = newMediaBuffer
+            changed = True
+        newUnforwardedPackets = fromStatus.getUnforwardedPackets()
+        if self.unforwardedPackets != newUnforwardedPackets:
+            self.unforwardedPackets = newUnforwardedPackets
+            changed = True
         if changed:
             self.onChangeFire()
 
@@ -60,15 +100,256 @@ class eventsFromThread(enum.Enum):
     LOCKED   = enum.auto()
     UNLOCKED = enum.auto()
     TIMEOUT  = enum.auto()
-    DATA     = enum.auto()
+    METADATA = enum.auto()
+    PLAYING  = enum.auto()
     ERROR    = enum.auto()
+    METRICS  = enum.auto()
 
 # Commands to read thread
 class eventsToThread(enum.Enum):
     STOP = enum.auto()
 
+# Writes FLV tags to a non-blocking pipe
+# the tag header and trailer are packed into preallocated buffers and written with the body in a single writev so the body is never copied
+class flvMuxer(object):
+    fileHeader = b'FLV\x01\x05\x00\x00\x00\x09\x00\x00\x00\x00'
+
+    # with no write timeout a full pipe is waited on until the muxer is aborted
+    def __init__(self, fd, writeTimeout = None):
+        self.fd = fd
+        self.writeTimeout = writeTimeout
+        self.aborted = False
+        self.tagHeader = bytearray(11) # stream id in the last 3 bytes is always 0
+        self.tagHeaderView = memoryview(self.tagHeader)
+        self.tagTrailer = bytearray(4)
+        self.tagTrailerView = memoryview(self.tagTrailer)
+        self.poller = select.poll()
+        self.poller.register(self.fd, select.POLLOUT)
+
+    def writeFileHeader(self):
+        self._writeBuffers([memoryview(self.fileHeader)])
+
+    def writeTag(self, tagType, timestamp, body):
+        bodyLength = len(body)
+        # type and 24 bit length, then the lower 24 bits of the timestamp followed by its upper 8 bits
+        struct.pack_into('>II', self.tagHeader, 0, (tagType << 24) | bodyLength, ((timestamp & 0xffffff) << 8) | ((timestamp >> 24) & 0xff))
+        struct.pack_into('>I', self.tagTrailer, 0, bodyLength + 11)
+        self._writeBuffers([self.tagHeaderView, memoryview(body), self.tagTrailerView])
+
+    # write all the buffers, waiting for the pipe to drain if it fills, raises BlockingIOError if it stays full or the muxer is aborted
+    def _writeBuffers(self, buffers):
+        remaining = sum(len(buffer) for buffer in buffers)
+        deadline = None
+        first = 0 # index of the first buffer with data left to write
+        offset = 0 # bytes of the first buffer already written
+        while remaining > 0:
+            if offset > 0:
+                pending = [buffers[first][offset:]] + buffers[first+1:]
+            elif first > 0:
+                pending = buffers[first:]
+            else:
+                pending = buffers
+            try:
+                written = os.writev(self.fd, pending)
+            except BlockingIOError:
+                if self.writeTimeout is not None and deadline is None:
+                    deadline = time.monotonic() + self.writeTimeout
+                if len(self.poller.poll(100)) < 1:
+                    if self.aborted or (deadline is not None and time.monotonic() > deadline):
+                        raise
+                continue
+            remaining -= written
+            # step through the buffers that have now been fully written
+            written += offset
+            while first < len(buffers) and written >= len(buffers[first]):
+                written -= len(buffers[first])
+                first += 1
+            offset = written
+
+    # stop waiting on a full pipe, safe to call from another thread
+    def abort(self):
+        self.aborted = True
+
+    def close(self):
+        os.close(self.fd)
+
+# Buffer of FLV tags between the RTMP reader and the pipe writer so a short stall downstream doesn't block the connection
+# above the high watermark non-keyframe video is dropped until the buffer drains below the low watermark
+class mediaRing(object):
+    tagOverhead = 15 # FLV tag header and trailer
+
+    def __init__(self, maxBytes, highWatermark, lowWatermark):
+        self.maxBytes = maxBytes
+        self.highWatermark = highWatermark
+        self.lowWatermark = lowWatermark
+        self.tags = collections.deque()
+        self.size = 0
+        self.condition = threading.Condition()
+        self.closed = False
+        self.dropping = False
+        self.waitKeyframe = False # once a video tag has been dropped the rest of its GOP is useless
+        # metrics
+        self.dropCount = 0
+        self.dropBytes = 0
+        self.highWater = 0
+
+    @staticmethod
+    def _isKeyframe(body):
+        return len(body) > 0 and (body[0] >> 4) == 1
+
+    # queue a tag, returns False if it was dropped
+    def put(self, tagType, timestamp, body):
+        tagSize = len(body) + self.tagOverhead
+        with self.condition:
+            if self.closed:
+                return False
+            if self.size + tagSize > self.highWatermark:
+                if not self.dropping:
+                    print("RTMP media buffer above high watermark, dropping video")
+                self.dropping = True
+            elif self.dropping and self.size <= self.lowWatermark:
+                self.dropping = False
+            drop = False
+            if tagType == librtmp.packet.PACKET_TYPE_VIDEO:
+                keyframe = self._isKeyframe(body)
+                if keyframe:
+                    self.waitKeyframe = False
+                elif self.dropping or self.waitKeyframe:
+                    drop = True
+            if not drop and self.size + tagSize > self.maxBytes:
+                drop = True
+            if drop:
+                if tagType == librtmp.packet.PACKET_TYPE_VIDEO:
+                    self.waitKeyframe = True
+                self.dropCount += 1
+                self.dropBytes += tagSize
+                return False
+            self.tags.append((tagType, timestamp, body))
+            self.size += tagSize
+            if self.size > self.highWater:
+                self.highWater = self.size
+            self.condition.notify()
+            return True
+
+    # queue the FLV file header, it is never dropped
+    def putFileHeader(self):
+        with self.condition:
+            self.tags.append((None, 0, flvMuxer.fileHeader))
+            self.size += len(flvMuxer.fileHeader)
+            self.condition.notify()
+
+    # wait for the next tag, returns None once closed
+    def get(self):
+        with self.condition:
+            while len(self.tags) < 1 and not self.closed:
+                self.condition.wait()
+            if self.closed:
+                return None
+            tag = self.tags.popleft()
+            tagType, timestamp, body = tag
+            if tagType is None:
+                self.size -= len(body)
+            else:
+                self.size -= len(body) + self.tagOverhead
+            return tag
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.tags.clear()
+            self.size = 0
+            self.condition.notify_all()
+
+    def getMetrics(self):
+        with self.condition:
+            return {'depthBytes': self.size, 'depthTags': len(self.tags), 'dropCount': self.dropCount, 'dropBytes': self.dropBytes, 'highWater': self.highWater}
+
+# An RTMP connection that is connected in the background ready to be played
+# nothing reads an idle connection, so it is replaced with a fresh one before the server or the client gives up on it
+class standbyConnection(object):
+    maxAge = 30 # seconds before an idle connection is considered stale
+    refreshAge = 20 # seconds before an idle connection is replaced, the old one stays usable until the new one connects
+
+    def __init__(self, url, app, playpath):
+        self.url = url
+        self.app = app
+        self.playpath = playpath
+        self.lock = threading.Lock()
+        self.rtmpConnection = None
+        self.closed = False
+        self.connecting = False
+        self.created = time.monotonic()
+        with self.lock:
+            self._startConnect()
+
+    # must be called with the lock held
+    def _startConnect(self):
+        self.connecting = True
+        threading.Thread(target=self._connect, daemon=True).start()
+
+    def _connect(self):
+        try:
+            newConnection = librtmp.RTMP(self.url, app=self.app, playpath=self.playpath, live=True, timeout=1)
+            newConnection.set_option('timeout', '1')
+            newConnection.connect()
+        except librtmp.RTMPError as e:
+            print("Standby RTMP connection failed: "+str(e))
+            with self.lock:
+                self.connecting = False
+            return
+        oldConnection = None
+        with self.lock:
+            self.connecting = False
+            if self.closed:
+                oldConnection = newConnection
+            else:
+                oldConnection = self.rtmpConnection
+                self.rtmpConnection = newConnection
+                self.created = time.monotonic()
+        if oldConnection is not None:
+            oldConnection.close()
+
+    # must be called with the lock held
+    def _isHealthy(self):
+        return self.rtmpConnection is not None and self.rtmpConnection.connected and (time.monotonic() - self.created) < self.maxAge
+
+    def isReady(self):
+        with self.lock:
+            return self._isHealthy()
+
+    # reconnect in the background if the connection failed, dropped or is due a refresh
+    def service(self):
+        with self.lock:
+            if self.closed or self.connecting:
+                return
+            if self.rtmpConnection is None or not self.rtmpConnection.connected or (time.monotonic() - self.created) >= self.refreshAge:
+                self._startConnect()
+
+    # hand over the connection if it is still healthy, the standby is closed either way
+    def take(self):
+        with self.lock:
+            takenConnection = None
+            if self._isHealthy():
+                takenConnection = self.rtmpConnection
+                self.rtmpConnection = None
+            self.closed = True
+        if takenConnection is None:
+            self.close()
+        return takenConnection
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            oldConnection = self.rtmpConnection
+            self.rtmpConnection = None
+        if oldConnection is not None:
+            oldConnection.close()
+
 class rtmpStreamManager(object):
-    def __init__(self, config, sourceConfig):
+    metricsInterval = 1 # seconds between media buffer and packet count reports from the read thread
+    standbyServiceInterval = 5 # seconds between checks of the standby connections
+
+    def __init__(self, config, sourceConfig, fdRegistry):
         self.recvSockEvent, self.sendSockEvent = socket.socketpair() # socket for notifying event queue
         self.rtmpReadEventQueue = queue.Queue() # socket for passing metadata events
 
@@ -76,20 +357,29 @@ class rtmpStreamManager(object):
 
         self.stdoutReadfd, self.stdoutWritefd = os.pipe() # a pipe for passing the flv stream
 
+        self.sourceConfig = sourceConfig
+        self.standbyConnections = {} # pre-connected connections for the likely next streams, keyed by _standbyKey
+        self.recvSockStandby, self.sendSockStandby = socket.socketpair() # socket for the standby service timer
+        self.standbyTimer = None
+        self.mediaRing = None # buffer between the read thread and the flv pipe
+        self.packetCounts = collections.Counter() # packets the read thread handled itself rather than forwarding
         self.readThread = None
         self.rtmpConnection = None
-        self.statelog = [] # log of important things from rtmp stream
-        self.rtmplog = [] # a complete metadata output log, for debugging
+        self.statelog = rydeplayer.common.ringLog(200, 16*1024) # log of important things from rtmp stream
+        self.rtmplog = rydeplayer.common.ringLog(2000, 256*1024) # a complete metadata output log, for debugging
         self.threadRunning = False
         self.threadLocked = False
         self.activeConfig = config.copyConfig()
         self.lastState = { 'locked':None }
         self.changeRefState = copy.deepcopy(self.lastState)
         self.stateMonotonic = 0
+        self.traceGeneration = 0 # generation of the tune trace the current work is for
         self.tunerStatus = tunerStatus()
         # state type for the core rtmp state
-        self.coreStateType = collections.namedtuple('coreState', ['isRunning', 'isStarted', 'isLocked', 'monotonicState'])
+        self.coreStateType = collections.namedtuple('coreState', ['isRunning', 'isStarted', 'isLocked', 'monotonicState', 'traceGeneration'])
         self.laststart = 0;
+        self.fdRegistry = fdRegistry
+        self.fdRegistry.registerAll(self.getFDs(), self.handleFD)
 
     def reconfig(self, config):
         """reconfigures RTMP stream"""
@@ -97,6 +387,53 @@ class rtmpStreamManager(object):
             self.activeConfig = config.copyConfig()
             print(self.activeConfig)
             self.restart()
+    def _standbyKey(self, config):
+        return (config.band.getDomain(), config.band.getApp(), config.streamname.getValue())
+
+    def setRecording(self, enabled):
+        """recording isn't supported, the stream isn't a TS"""
+        if enabled:
+            print("Recording isn't supported for RTMP streams")
+    def setStandbyConfigs(self, configs):
+        """keep idle connections ready for these configs so switching to them skips the connect"""
+        if not self.sourceConfig.standby:
+            return
+        newKeys = []
+        for config in configs:
+            if config.getBand().getSource() == rydeplayer.sources.common.sources.RTMPSTREAM and config.isValid() and config != self.activeConfig:
+                newKeys.append(self._standbyKey(config))
+        for key in list(self.standbyConnections.keys()):
+            if key not in newKeys:
+                self.standbyConnections.pop(key).close()
+        for key in newKeys:
+            if key not in self.standbyConnections:
+                domain, app, streamname = key
+                self.standbyConnections[key] = standbyConnection(urllib.parse.urlunsplit(('rtmp', domain, '', '', '')), app, streamname)
+        self._scheduleStandbyService()
+
+    # keep the standby connections fresh for as long as they are wanted, not just until the next tune
+    def _scheduleStandbyService(self):
+        if self.standbyTimer is None and len(self.standbyConnections) > 0:
+            self.standbyTimer = threading.Timer(self.standbyServiceInterval, self._standbyTimerExpireThread)
+            self.standbyTimer.daemon = True
+            self.standbyTimer.start()
+
+    def _standbyTimerExpireThread(self):
+        self.sendSockStandby.send(b'\00')
+
+    def _serviceStandbys(self):
+        self.recvSockStandby.recv(1)
+        self.standbyTimer = None
+        for standby in self.standbyConnections.values():
+            standby.service()
+        self._scheduleStandbyService()
+
+    def _takeStandby(self, config):
+        standby = self.standbyConnections.pop(self._standbyKey(config), None)
+        if standby is None:
+            return None
+        return standby.take()
+
     def waitForMediaHangup(self):
         return True
     def remedia(self):
@@ -104,18 +441,18 @@ class rtmpStreamManager(object):
     def getMediaFd(self):
         return self.stdoutReadfd
     def getFDs(self):
-        return [self.recvSockEvent]
+        return [self.recvSockEvent, self.recvSockStandby]
     def getStatus(self):
         return self.tunerStatus
     def handleFD(self, fd):
         """handles a file descriptor that has data to read"""
-        fdCallbacks = dict()
-        fdCallbacks[self.recvSockEvent] = self.processEvents
-        if(fd in fdCallbacks):
-            fdCallbacks[fd]()
+        if fd is self.recvSockEvent:
+            self.processEvents()
+        elif fd is self.recvSockStandby:
+            self._serviceStandbys()
     def getCoreState(self):
         """gets the core system state in a single call"""
-        state = self.coreStateType(self.isRunning(), self.isStarted(), self.isLocked(), self.getMonotonicState())
+        state = self.coreStateType(self.isRunning(), self.isStarted(), self.isLocked(), self.getMonotonicState(), self.traceGeneration)
         return state
     def isStarted(self):
         if(self.readThread != None):
@@ -136,6 +473,8 @@ class rtmpStreamManager(object):
                 return False
         else:
             return False
+    def setTraceGeneration(self, generation):
+        self.traceGeneration = generation
     def getMonotonicState(self):
         return self.stateMonotonic
 
@@ -145,7 +484,9 @@ class rtmpStreamManager(object):
         self.stdoutReadfd, self.stdoutWritefd = os.pipe() # a pipe for passing the flv stream
         self.readThread.join()
         self.tunerStatus.setStatusToMatch(tunerStatus()) # reset status to defaults
-        self.readThread = threading.Thread(target=self._readThreadLoop, args=(self.rtmpConnection, self.stdoutWritefd, self.sendSockEvent, self.rtmpReadEventQueue, self.rtmpReadCommandQueue, self.activeConfig.band.getNetworkTimeout(), self.activeConfig.band.getNetworkTimeout()))
+        # the old ring was closed with its thread
+        self.mediaRing = mediaRing(self.sourceConfig.bufferSize, self.sourceConfig.getHighWatermarkBytes(), self.sourceConfig.getLowWatermarkBytes())
+        self.readThread = threading.Thread(target=self._readThreadLoop, args=(self.rtmpConnection, self.stdoutWritefd, self.mediaRing, self.packetCounts, self.sendSockEvent, self.rtmpReadEventQueue, self.rtmpReadCommandQueue, self.activeConfig.band.getNetworkTimeout(), self.activeConfig.band.getNetworkTimeout(), self.traceGeneration))
         self.readThread.start()
 
 
@@ -157,36 +498,28 @@ class rtmpStreamManager(object):
             eventType, eventData = self.rtmpReadEventQueue.get()
             if eventType == eventsFromThread.LOCKED:
                 self.threadLocked = True
+                rydeplayer.tracing.tracer.mark('locked', eventData) # the generation the thread was started for
                 print("Main Locked")
             elif eventType == eventsFromThread.UNLOCKED:
                 self._resetThread()
             elif eventType == eventsFromThread.TIMEOUT:
                 print("Data timeout")
                 self._resetThread()
-            elif eventType == eventsFromThread.DATA:
-                self.rtmplog.append((datetime.datetime.now().strftime("%m/%d/%Y, %H:%M:%S"),eventData))
-                packetType, packetBody = eventData
-                if packetType in [librtmp.packet.PACKET_TYPE_INFO, librtmp.packet.PACKET_TYPE_INVOKE]:
-                    decodedBody = librtmp.amf.decode_amf(packetBody)
-                    if packetType == librtmp.packet.PACKET_TYPE_INFO and len(decodedBody)>0 and decodedBody[0] == "onMetaData":
-                        audioPid = None
-                        videoPid = None
-                        for key in decodedBody[1]:
-                            if key == "audiocodecid":
-                                audioPid = decodedBody[1][key]
-                            elif key == "videocodecid":
-                                videoPid = decodedBody[1][key]
-                        if audioPid is not None or videoPid is not None:
-                            self.tunerStatus.setPIDs(audioPid, videoPid)
-                    elif packetType == librtmp.packet.PACKET_TYPE_INVOKE and len(decodedBody)>0 and decodedBody[0] == 'onStatus' and decodedBody[3]['code'] == 'NetStream.Play.Start':
-                        self.threadRunning = True
-                elif packetType == librtmp.packet.PACKET_TYPE_CONTROL:
-                    messageType = int.from_bytes(packetBody[:2], byteorder='big')
-                    if messageType == 6:
-                        print("RTMP - Server Ping: "+packetBody[2:].hex())
+            elif eventType == eventsFromThread.METADATA:
+                self.rtmplog.append(("Metadata", eventData))
+                audioPid, videoPid = eventData
+                self.tunerStatus.setPIDs(audioPid, videoPid)
+            elif eventType == eventsFromThread.PLAYING:
+                self.rtmplog.append("Play started")
+                self.threadRunning = True
             elif eventType == eventsFromThread.ERROR:
                 print("RTMPERROR - Main")
                 stop = True
+            elif eventType == eventsFromThread.METRICS:
+                mediaBuffer, unforwardedPackets = eventData
+                with self.tunerStatus.batch():
+                    self.tunerStatus.setMediaBuffer(mediaBuffer)
+                    self.tunerStatus.setUnforwardedPackets(unforwardedPackets)
 
             self.lastState['locked'] = self.threadLocked
             if self.lastState != self.changeRefState : # if the signal parameters have changed
@@ -208,6 +541,12 @@ class rtmpStreamManager(object):
         self.rtmpReadCommandQueue = queue.Queue() # reset rtmp thread queue
         if self.rtmpConnection is not None:
             self.rtmpConnection.close()
+        if self.mediaRing is not None:
+            self.statelog.append("Media buffer: "+str(self.mediaRing.getMetrics()))
+            print("RTMP media buffer: "+str(self.mediaRing.getMetrics()))
+            self.mediaRing = None
+        self.statelog.append("Unforwarded packets: "+str(dict(self.packetCounts)))
+        print("RTMP unforwarded packets: "+str(dict(self.packetCounts)))
         #open a clean buffer ready for the restart
         self.stdoutReadfd, self.stdoutWritefd = os.pipe() # a pipe for passing the flv stream
         self.readThread = None
@@ -215,16 +554,48 @@ class rtmpStreamManager(object):
         self.threadRunning = False
         #TODO: parse this and display a meaningful message on screen
         if dumpOutput:
-            for logline in self.rtmplog:
+            for logline in self.rtmplog.dump():
                 print(logline)
         return None
 
     def cleanup(self):
+        if self.standbyTimer is not None:
+            self.standbyTimer.cancel()
+            self.standbyTimer = None
+        for standby in self.standbyConnections.values():
+            standby.close()
+        self.standbyConnections = {}
+        self.fdRegistry.unregisterAll(self.getFDs())
         self.recvSockEvent.close()
         self.sendSockEvent.close()
+        self.recvSockStandby.close()
+        self.sendSockStandby.close()
+
+    # get the audio and video codec ids from an onMetaData info packet, None if it isn't one or has no codecs
+    def _decodeMetadataCodecs(self, packetBody):
+        try:
+            decodedBody = librtmp.amf.decode_amf(packetBody)
+        except Exception as e:
+            print("RTMP metadata decode failed: "+str(e))
+            return None
+        if len(decodedBody)>1 and decodedBody[0] == "onMetaData" and isinstance(decodedBody[1], dict):
+            audioPid = decodedBody[1].get("audiocodecid")
+            videoPid = decodedBody[1].get("videocodecid")
+            if audioPid is not None or videoPid is not None:
+                return (audioPid, videoPid)
+        return None
+
+    # check if an invoke packet is the server saying the stream has started playing
+    def _isPlayStart(self, packetBody):
+        try:
+            decodedBody = librtmp.amf.decode_amf(packetBody)
+        except Exception as e:
+            print("RTMP invoke decode failed: "+str(e))
+            return False
+        return len(decodedBody)>3 and decodedBody[0] == 'onStatus' and isinstance(decodedBody[3], dict) and decodedBody[3].get('code') == 'NetStream.Play.Start'
 
     # thread loop to read RTMP data and put in the read pipe
-    def _readThreadLoop(self, conn, wPipeFd, eventSock, eventQueue, commQueue, networkTimeout, networkTimeoutInit):
+    def _readThreadLoop(self, conn, wPipeFd, ring, packetCounts, eventSock, eventQueue, commQueue, networkTimeout, networkTimeoutInit, traceGeneration):
         if not conn.connected:
             try:
                 self.rtmpConnection.connect()
@@ -234,10 +605,13 @@ class rtmpStreamManager(object):
                 return
 
         fcntl.fcntl(wPipeFd, fcntl.F_SETFL, os.O_NONBLOCK)
-        wPipe = os.fdopen(wPipeFd, mode="bw")
+        muxer = flvMuxer(wPipeFd)
+        writeThread = threading.Thread(target=self._writeThreadLoop, args=(muxer, ring, eventSock, eventQueue))
+        writeThread.start()
         starttimestamp = 0;
         lastData = None
         lastPacket = time.monotonic()
+        lastMetrics = lastPacket
         while True: # loop until break
             try:
                 packet=conn.read_packet()
@@ -263,41 +637,52 @@ class rtmpStreamManager(object):
                 conn.handle_packet(packet) # handle packets to keep server happy
                 lastPacket = time.monotonic()
                 if packet.type in [librtmp.packet.PACKET_TYPE_AUDIO, librtmp.packet.PACKET_TYPE_VIDEO]:
-                    # pass on media packets
-                    try:
-                        self._writePacketToStream(packet, wPipe)
-                    except BlockingIOError:
-                        packet = None
-                        eventQueue.put((eventsFromThread.ERROR, None))
-                        eventSock.send(b'\00')
-                        break
+                    # pass on media packets, the ring drops video rather than blocking if the pipe backs up
+                    ring.put(packet.type, packet.timestamp, packet.body)
                     lastData = time.monotonic()
                     if starttimestamp <= 0:
                         starttimestamp = packet.timestamp
                 elif packet.type == librtmp.packet.PACKET_TYPE_INFO:
-                    # pass on metadata packets
-                    eventQueue.put((eventsFromThread.DATA, (packet.type, packet.body))) #pass metadata to source thread
-                    eventSock.send(b'\00')
+                    # only the codecs from the stream metadata are needed by the source thread
+                    codecs = self._decodeMetadataCodecs(packet.body)
+                    if codecs is not None:
+                        eventQueue.put((eventsFromThread.METADATA, codecs))
+                        eventSock.send(b'\00')
+                    else:
+                        packetCounts['info'] += 1
                     if starttimestamp <= 0:
                         starttimestamp = packet.timestamp
+                elif packet.type == librtmp.packet.PACKET_TYPE_INVOKE:
+                    if self._isPlayStart(packet.body):
+                        eventQueue.put((eventsFromThread.PLAYING, None))
+                        eventSock.send(b'\00')
+                    else:
+                        packetCounts['invoke'] += 1
                 elif packet.type == librtmp.packet.PACKET_TYPE_CONTROL:
-                    # check for start/stop(flush) packets
+                    # check for start/stop(flush) packets, everything else is just counted
                     messageType = int.from_bytes(packet.body[:2], byteorder='big')
-                    eventQueue.put((eventsFromThread.DATA, (packet.type, packet.body))) #pass metadata to source thread
-                    eventSock.send(b'\00')
                     if messageType == 0: #start
                         lastData = time.monotonic()
-                        wPipe.write(b'FLV\x01\x05\x00\x00\x00\x09\x00\x00\x00\x00')
+                        ring.putFileHeader()
                         starttimestamp = 0
-                        eventQueue.put((eventsFromThread.LOCKED, None))
+                        eventQueue.put((eventsFromThread.LOCKED, traceGeneration))
                         eventSock.send(b'\00')
                     elif messageType == 1: #flush/stop
                         eventQueue.put((eventsFromThread.UNLOCKED, None))
                         eventSock.send(b'\00')
                         break
+                    elif messageType == 6:
+                        packetCounts['ping'] += 1
+                    else:
+                        packetCounts['control'] += 1
                 else:
-                    eventQueue.put((eventsFromThread.DATA, (packet.type, packet.body))) #pass metadata to source thread
-                    eventSock.send(b'\00')
+                    packetCounts['other'] += 1
+            # publish the media buffer levels and a copy of the packet counts, they are only updated by this thread
+            # read_packet times out often enough for this to keep to the interval
+            if time.monotonic() - lastMetrics >= self.metricsInterval:
+                lastMetrics = time.monotonic()
+                eventQueue.put((eventsFromThread.METRICS, (ring.getMetrics(), dict(packetCounts))))
+                eventSock.send(b'\00')
             commandRaw = None
             try:
                 commandRaw=commQueue.get(False)
@@ -307,47 +692,49 @@ class rtmpStreamManager(object):
                 commOperator, commOperand = commandRaw
                 if commOperator == eventsToThread.STOP:
                     break
-        try:
-            wPipe.close()
-        except BlockingIOError:
-            eventQueue.put((eventsFromThread.ERROR, None))
-            eventSock.send(b'\00')
-
-    # generate flv header from rtmp packet
-    def _writePacketToStream(self, packet, stream):
-        packetBody = packet.body
-        packetOutBytes = bytes()
-        packetOutBytes += packet.type.to_bytes(1, byteorder='big')
-        packetOutBytes += len(packetBody).to_bytes(3, byteorder='big')
-        packetOutBytes += (packet.timestamp & 0xffffff).to_bytes(3, byteorder='big')
-        packetOutBytes += ((packet.timestamp & 0xff000000)>>24).to_bytes(1, byteorder='big')
-        packetOutBytes += (0).to_bytes(3, byteorder='big')
-        packetOutBytes += packetBody
-        packetOutBytes += (len(packetBody)+11).to_bytes(4, byteorder='big')
-        packetRemaining = packetOutBytes
-        while len(packetRemaining) > 0:
-            r, w, x = select.select([],[stream],[],1)
-            if stream in w:
-                try:
-                    stream.write(packetRemaining)
-                except BlockingIOError as ioErr:
-                    packetRemaining = packetRemaining[ioErr.characters_written:]
+        ring.close()
+        muxer.abort()
+        writeThread.join()
+        muxer.close()
+
+    # thread loop to write the buffered tags into the flv pipe
+    def _writeThreadLoop(self, muxer, ring, eventSock, eventQueue):
+        while True:
+            tag = ring.get()
+            if tag is None:
+                break
+            tagType, timestamp, body = tag
+            try:
+                if tagType is None:
+                    muxer.writeFileHeader()
                 else:
-                    break
-            else:
-                raise BlockingIOError()
+                    muxer.writeTag(tagType, timestamp, body)
+            except BlockingIOError: # aborted while waiting for the pipe
+                break
+            except OSError as e:
+                print(e)
+                eventQueue.put((eventsFromThread.ERROR, None))
+                eventSock.send(b'\00')
+                break
 
     def start(self):
         self.laststart = time.monotonic()
         if self.activeConfig.isValid():
             if self.readThread == None :
                 self.threadLocked = False
-                self.statelog=[]
-                self.rtmplog=[]
-                self.rtmpConnection = librtmp.RTMP(urllib.parse.urlunsplit(('rtmp', self.activeConfig.band.getDomain(), '', '', '')), app=self.activeConfig.band.getApp(), playpath=self.activeConfig.streamname.getValue(), live=True, timeout=1)
-                self.rtmpConnection.set_option('timeout', '1')
-                self.readThread = threading.Thread(target=self._readThreadLoop, args=(self.rtmpConnection, self.stdoutWritefd, self.sendSockEvent, self.rtmpReadEventQueue, self.rtmpReadCommandQueue, self.activeConfig.band.getNetworkTimeout(), self.activeConfig.band.getNetworkTimeoutInit()))
+                self.statelog.clear()
+                self.rtmplog.clear()
+                self.packetCounts.clear()
+                self.rtmpConnection = self._takeStandby(self.activeConfig)
+                if self.rtmpConnection is not None:
+                    print("Using standby RTMP connection")
+                else:
+                    self.rtmpConnection = librtmp.RTMP(urllib.parse.urlunsplit(('rtmp', self.activeConfig.band.getDomain(), '', '', '')), app=self.activeConfig.band.getApp(), playpath=self.activeConfig.streamname.getValue(), live=True, timeout=1)
+                    self.rtmpConnection.set_option('timeout', '1')
+                self.mediaRing = mediaRing(self.sourceConfig.bufferSize, self.sourceConfig.getHighWatermarkBytes(), self.sourceConfig.getLowWatermarkBytes())
+                self.readThread = threading.Thread(target=self._readThreadLoop, args=(self.rtmpConnection, self.stdoutWritefd, self.mediaRing, self.packetCounts, self.sendSockEvent, self.rtmpReadEventQueue, self.rtmpReadCommandQueue, self.activeConfig.band.getNetworkTimeout(), self.activeConfig.band.getNetworkTimeoutInit(), self.traceGeneration))
                 self.readThread.start()
+                rydeplayer.tracing.tracer.mark('spawn', self.traceGeneration)
                 self.lastState['locked'] = self.threadLocked
                 if self.lastState != self.changeRefState : # if the signal parameters have changed
                     self.stateMonotonic += 1
@@ -359,15 +746,58 @@ class rtmpStreamManager(object):
 
     def restart(self):
         if self.readThread is not None:
-            time.sleep(max(0.5-(time.monotonic()-self.laststart),0))
+            # a standby connection is already connected so there is no need to back off
+            standby = self.standbyConnections.get(self._standbyKey(self.activeConfig))
+            if standby is None or not standby.isReady():
+                time.sleep(max(0.5-(time.monotonic()-self.laststart),0))
             self.stop(False, False)
         self.start()
 
 class config(object):
+    def __init__(self, buffersize = 4*1024*1024, highwatermark = 75, lowwatermark = 25, standby = False):
+        self.standby = standby # keep connections ready for the neighbouring presets
+        self.bufferSize = buffersize # media buffer size in bytes
+        self.highWatermark = highwatermark # percentage of the buffer to start dropping video at
+        self.lowWatermark = lowwatermark # percentage of the buffer to stop dropping video at
+
+    def getHighWatermarkBytes(self):
+        return self.bufferSize*self.highWatermark//100
+
+    def getLowWatermarkBytes(self):
+        return self.bufferSize*self.lowWatermark//100
 
     def loadConfig(self, config):
         perfectConfig = True
-        if config is not None:
+        if isinstance(config, dict):
+            if 'buffersize' in config:
+                if isinstance(config['buffersize'], int) and config['buffersize'] > 0:
+                    self.bufferSize = config['buffersize']
+                else:
+                    print("Invalid RTMP media buffer size")
+                    perfectConfig = False
+            if 'highwatermark' in config:
+                if isinstance(config['highwatermark'], int) and config['highwatermark'] > 0 and config['highwatermark'] <= 100:
+                    self.highWatermark = config['highwatermark']
+                else:
+                    print("Invalid RTMP media buffer high watermark")
+                    perfectConfig = False
+            if 'lowwatermark' in config:
+                if isinstance(config['lowwatermark'], int) and config['lowwatermark'] >= 0 and config['lowwatermark'] <= 100:
+                    self.lowWatermark = config['lowwatermark']
+                else:
+                    print("Invalid RTMP media buffer low watermark")
+                    perfectConfig = False
+            if 'standby' in config:
+                if isinstance(config['standby'], bool):
+                    self.standby = config['standby']
+                else:
+                    print("Invalid RTMP standby connection setting")
+                    perfectConfig = False
+            if self.lowWatermark > self.highWatermark:
+                print("RTMP media buffer low watermark above high watermark, using high watermark")
+                self.lowWatermark = self.highWatermark
+                perfectConfig = False
+        elif config is not None:
             print("Invalid RTMP Stream config")
             perfectConfig = False
         return perfectConfig
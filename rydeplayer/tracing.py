@@ -0,0 +1,138 @@
+#    Ryde Player provides a on screen interface and video player for Longmynd compatible tuners.
+#    Copyright © 2022 Tim Clark
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import threading, time, collections, json
+
+# milestones between a tune request and video on screen, in the order they are expected
+milestones = ('retune', 'spawn', 'started', 'firststatus', 'locked', 'paramrestart', 'vlcplay', 'playing')
+
+# histogram of latencies with fixed buckets, all times in ns
+class latencyHistogram(object):
+    bucketLimits = tuple(limit*1000000 for limit in (100, 200, 500, 1000, 2000, 5000, 10000, 20000)) # ms
+    def __init__(self):
+        self.buckets = [0]*(len(self.bucketLimits)+1) # the last bucket is everything over the top limit
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def add(self, latency):
+        self.count += 1
+        self.total += latency
+        if self.min is None or latency < self.min:
+            self.min = latency
+        if self.max is None or latency > self.max:
+            self.max = latency
+        for bucket, limit in enumerate(self.bucketLimits):
+            if latency <= limit:
+                self.buckets[bucket] += 1
+                return
+        self.buckets[-1] += 1
+
+    # summary in ms ready to be serialised
+    def dump(self):
+        if self.count < 1:
+            return {'count': 0}
+        buckets = {}
+        for bucket, limit in enumerate(self.bucketLimits):
+            buckets['<='+str(limit//1000000)+'ms'] = self.buckets[bucket]
+        buckets['>'+str(self.bucketLimits[-1]//1000000)+'ms'] = self.buckets[-1]
+        return {'count': self.count, 'min': self.min/1000000, 'max': self.max/1000000, 'mean': self.total/self.count/1000000, 'buckets': buckets}
+
+# Records when each tune reaches each milestone, milestones can be marked from any thread
+class tuneTracer(object):
+    def __init__(self, historyLength = 50):
+        self.lock = threading.Lock()
+        self.current = None
+        self.generation = 0 # incremented for each tune, marks carry the generation of the tune they belong to
+        self.history = collections.deque(maxlen=historyLength)
+        # histograms of the time from the retune to each milestone, keyed by source type and by preset
+        self.sourceHistograms = {}
+        self.presetHistograms = {}
+
+    # start tracing a new tune, any unfinished trace is kept in the history as it is
+    # returns the generation of the new tune
+    def start(self, source, preset):
+        now = time.monotonic_ns()
+        with self.lock:
+            if self.current is not None:
+                self.history.append(self.current)
+            self.generation += 1
+            self.current = {'source': source, 'preset': preset, 'generation': self.generation, 'startTime': now, 'complete': False, 'milestones': {'retune': 0}}
+            return self.generation
+
+    # generation of the latest tune, for passing along with the request that carries it out
+    def getGeneration(self):
+        with self.lock:
+            return self.generation
+
+    # only the first time each milestone is reached for a tune is recorded
+    # marks from an earlier generation are late arrivals from a tune that has been replaced and are ignored
+    def mark(self, milestone, generation):
+        now = time.monotonic_ns()
+        with self.lock:
+            if self.current is None or generation != self.current['generation'] or milestone in self.current['milestones']:
+                return
+            self.current['milestones'][milestone] = now - self.current['startTime']
+            if milestone == 'playing':
+                self._finish()
+
+    def _finish(self):
+        trace = self.current
+        trace['complete'] = True
+        for histograms, key in [(self.sourceHistograms, trace['source']), (self.presetHistograms, trace['preset'])]:
+            if key not in histograms:
+                histograms[key] = {}
+            for milestone, latency in trace['milestones'].items():
+                if milestone not in histograms[key]:
+                    histograms[key][milestone] = latencyHistogram()
+                histograms[key][milestone].add(latency)
+        self.history.append(trace)
+        self.current = None
+
+    def _dumpTrace(self, trace):
+        dumped = {'source': trace['source'], 'preset': trace['preset'], 'generation': trace['generation'], 'complete': trace['complete'], 'milestones': {}}
+        for milestone in milestones:
+            if milestone in trace['milestones']:
+                dumped['milestones'][milestone] = trace['milestones'][milestone]/1000000
+        return dumped
+
+    def _dumpHistograms(self, histograms):
+        dumped = {}
+        for key, keyHistograms in histograms.items():
+            dumped[key] = {milestone: keyHistograms[milestone].dump() for milestone in milestones if milestone in keyHistograms}
+        return dumped
+
+    # everything recorded so far in ms, ready to be serialised
+    def dump(self):
+        with self.lock:
+            return {
+                'current': None if self.current is None else self._dumpTrace(self.current),
+                'history': [self._dumpTrace(trace) for trace in self.history],
+                'sources': self._dumpHistograms(self.sourceHistograms),
+                'presets': self._dumpHistograms(self.presetHistograms),
+                }
+
+    def dumpFile(self, path):
+        try:
+            with open(path, 'w') as traceFile:
+                json.dump(self.dump(), traceFile, indent=2)
+            print("Tune trace written to "+path)
+        except OSError as e:
+            print("Can't write tune trace: "+str(e))
+
+# shared by the player and the sources
+tracer = tuneTracer()